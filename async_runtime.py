@@ -0,0 +1,199 @@
+import asyncio
+
+from message import Message
+from node import Node
+from node_script import process_message
+from tracing import Tracer
+
+
+class AsyncNode(Node):
+    """
+    A Node whose tasks and messages run on an asyncio event loop instead of threads.
+
+    The consensus logic is inherited unchanged from Node; only task execution and message
+    transport are replaced. Sends are coroutines on the loop, so a broadcast costs one task per
+    target instead of one thread per broadcast, and a message delayed by the network emulation
+    (see netem.py) only delays itself. Other threads (client API, recovery) may still call `run_async` and the send
+    methods: the work is handed over to the loop.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loop = None  # Event loop of the runtime, set by AsyncRuntime.listen
+        self.tasks = set()  # Running send tasks (kept referenced until they finish)
+
+    def on_loop(self):
+        """Returns True if the caller runs on the node's event loop."""
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def submit(self, coroutine):
+        """
+        Runs a coroutine on the node's event loop without waiting for it.
+
+        :param coroutine: coroutine - The coroutine to run.
+        """
+        if self.on_loop():
+            task = self.loop.create_task(coroutine)
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        else:
+            asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run_async(self, target, *args):
+        """Runs tasks as loop callbacks: they only schedule sends, so they never block the loop."""
+        if self.on_loop():
+            self.loop.call_soon(target, *args)
+        else:
+            self.loop.call_soon_threadsafe(target, *args)
+
+    def broadcast_message(self, message):
+        """
+        Broadcasts a message to all other nodes in the network.
+
+        :param message: Message - The message to broadcast.
+        """
+        if self.tracer.enabled:
+            trace_started = Tracer.now()
+        serialized_message = message.serialize()
+        encoded = {}  # Encodings of the message by codec, shared by the peers that use the same one
+        for target_port in self.ports:
+            if target_port == self.port:  # Skip broadcasting to itself
+                continue
+            self.submit(self.send(target_port, self.compressor.encode(serialized_message, target_port, encoded),
+                                  message.type))
+        if self.tracer.enabled:
+            self.tracer.span("broadcast", message.trace_id, trace_started, type=message.type, bytes=len(serialized_message))
+
+    def send_message_to_port(self, target_port, message):
+        """
+        Sends a specific message to a target node via its port.
+
+        :param target_port: int - The port of the target node.
+        :param message: Message - The message to send.
+        """
+        self.submit(self.send(target_port, self.compressor.encode(message.serialize(), target_port), message.type))
+
+    async def send(self, target_port, data, message_type):
+        """
+        Sends serialized message bytes to a node over a new connection.
+
+        :param target_port: int - The port of the target node.
+        :param data: bytes - The serialized message.
+        :param message_type: str - The type of the message (for metrics).
+        """
+        try:
+            await self.transport.send_async(target_port, data)
+            self.metrics.inc("messages_sent", type=message_type)
+            self.metrics.inc("bytes_sent", len(data), type=message_type)
+        except ConnectionRefusedError:
+            self.log.warning("Could not connect to Node at port %s", target_port)
+            self.metrics.inc("messages_send_failed", type=message_type)
+        except (OSError, TimeoutError, ValueError) as e:
+            self.log.error("Error sending %s to port %s: %s", message_type, target_port, e)
+            self.metrics.inc("messages_send_failed", type=message_type)
+
+
+class AsyncRuntime:
+    """
+    Runs an AsyncNode on an asyncio event loop.
+
+    The node's transport delivers each received message on the loop (reader callbacks on the
+    loop's selector for the socket transports, see transport.LoopListener), where it is decoded
+    and processed right away. The loop runs one callback at a time, so messages are processed in
+    arrival order without a queue, and a message costs no task and no hand-over between threads.
+    The epoch loop is a task that waits for the epoch boundaries on the loop. The number of tasks
+    stays bounded by the messages being sent, whatever the rate of received messages.
+    """
+
+    def __init__(self, node):
+        """
+        :param node: AsyncNode - The node to run.
+        """
+        self.node = node
+        self.epoch_notarized = None  # Loop-side mirror of `node.epoch_notarized`
+        self.server = None
+
+    async def listen(self):
+        """Starts receiving messages on the running loop."""
+        loop = asyncio.get_running_loop()
+        self.node.loop = loop
+        self.epoch_notarized = asyncio.Event()
+        self.server = await self.node.transport.serve_async(self.node.port, self.handle_data)
+        self.node.metrics.set("task_count", lambda: len(asyncio.all_tasks(loop)))
+
+    def handle_data(self, data):
+        """Deserializes and processes a received message (runs on the loop)."""
+        node = self.node
+        if not data:
+            node.log.warning("No data received from socket.")
+            return
+        if not node.message_filter.admit(data):
+            return  # Stale or duplicate
+        data = node.compressor.decode(data)
+        if data is None:
+            node.metrics.inc("messages_invalid")
+            return
+        if node.tracer.enabled:
+            trace_started = Tracer.now()
+        message = Message.deserialize(data)
+        if message is None:
+            node.log.warning("Deserialization failed. Ignoring message.")
+            node.metrics.inc("messages_invalid")
+            return
+        node.metrics.inc("messages_received", type=message.type)
+        node.metrics.inc("bytes_received", message.size, type=message.type)
+        if node.tracer.enabled:
+            node.tracer.span("deserialize", message.trace_id, trace_started, type=message.type, bytes=message.size)
+        try:
+            process_message(node, message)
+        except Exception as e:
+            node.log.error("Error processing %s from %s: %s", message.type, message.sender, e)
+        if node.epoch_notarized.is_set():
+            self.epoch_notarized.set()
+
+    async def run_epochs(self):
+        """Runs the node's epochs (the asynchronous counterpart of `Node.run`)."""
+        node = self.node
+        node.create_scheduler()
+        if not node.rejoin:
+            # Wait for the designated start time
+            await node.scheduler.wait_for_epoch_async(node.scheduler.first_epoch)
+
+        node.restore_chain()
+        if node.rejoin:
+            # Recovery polls for the missing blocks, which the loop processes meanwhile
+            await asyncio.to_thread(node.recover_blockchain)
+
+        first_epoch = node.first_epoch_to_run()
+        if node.rejoin:
+            # Join at the next epoch boundary instead of replaying epochs that already passed
+            await node.scheduler.wait_for_epoch_async(first_epoch)
+
+        for epoch in range(first_epoch, node.total_epochs + 1):
+            self.epoch_notarized.clear()
+            node.start_epoch(epoch)
+            if node.epoch_notarized.is_set():
+                self.epoch_notarized.set()
+
+            # In optimistic mode the epoch ends as soon as its block is notarized, and 2Δ is only the timeout
+            early_event = self.epoch_notarized if node.optimistic_responsiveness else None
+            overrun = await node.scheduler.wait_for_epoch_async(epoch + 1, early_event)
+            await asyncio.to_thread(node.end_epoch, epoch, overrun)  # Saving the chain does not stall the loop
+
+        # Display the final blockchain state
+        node.display_blockchain()
+        node.tracer.close()
+
+    async def serve_forever(self):
+        """Keeps answering other nodes after the epochs are done."""
+        await asyncio.get_running_loop().create_future()  # Never completes
+
+    async def close(self):
+        """Stops receiving messages and waits briefly for the sends in progress."""
+        self.server.close()
+        tasks = list(self.node.tasks)
+        if tasks:
+            await asyncio.wait(tasks, timeout=1.0)
@@ -0,0 +1,49 @@
+import hashlib
+import json
+
+from transaction import Transaction
+
+
+class Batch:
+    """
+    Represents a batch of transactions, disseminated to every node ahead of the blocks that reference it.
+
+    A batch is identified by its digest, a SHA-1 hash of its serialized transactions, so a
+    block can list batch digests instead of carrying the transactions themselves.
+    """
+
+    def __init__(self, transactions):
+        """
+        Initializes a Batch object with its transactions, in order.
+
+        :param transactions: list - The Transaction objects of the batch.
+        """
+        self.transactions = list(transactions)
+        serialized = json.dumps([tx.to_dict() for tx in self.transactions], sort_keys=True).encode('utf-8')
+        self.size = len(serialized)  # Size in bytes of the serialized transactions
+        self.digest = hashlib.sha1(serialized).digest()
+
+    def to_dict(self):
+        """
+        Serializes the Batch object into a dictionary format.
+
+        :return: dict - A dictionary with the batch's digest and transactions.
+        """
+        return {
+            'digest': self.digest.hex(),
+            'transactions': [tx.to_dict() for tx in self.transactions]
+        }
+
+    @staticmethod
+    def from_dict(data):
+        """
+        Deserializes a dictionary to reconstruct a Batch object.
+
+        :param data: dict - A dictionary containing the batch's digest and transactions.
+        :return: Batch - The reconstructed Batch object.
+        :raises ValueError: If the digest does not match the transactions.
+        """
+        batch = Batch(Transaction.from_dict(tx) for tx in data['transactions'])
+        if batch.digest.hex() != data['digest']:
+            raise ValueError("Batch digest does not match its transactions")
+        return batch
@@ -0,0 +1,307 @@
+import collections
+import json
+import os
+import threading
+import weakref
+
+from batch import Batch
+from logger import get_logger
+from message import Message
+from tx_index import PENDING
+
+log = get_logger("batch_store")
+
+
+class BatchStore:
+    """
+    Data-availability layer: transactions travel in batches ahead of the blocks that order them.
+
+    Each node seals the transactions it creates into batches, broadcasts them and stores every
+    batch it receives. A leader proposes a block that lists the digests of available batches
+    (not yet in a notarized block) instead of carrying the transactions, so proposals and
+    votes stay small however many transactions a block orders.
+
+    A node only votes for a block, and only notarizes it, once it stores all of the block's
+    batches: it fills in the block's transactions from them, replacing whatever transactions
+    the block was received with (the block hash only covers the digests, and stored batches
+    were checked against theirs). Missing batches are fetched from
+    the block's proposer (and from every node if they are still missing an epoch later); the
+    vote and the notarization resume when they arrive. Blocks whose transactions are not known
+    are never finalized.
+
+    Stored batches are kept for the whole run, so lagging nodes can always fetch them (they
+    share their Transaction objects with the blocks, which are kept in memory anyway). They are
+    appended to `batches_<node_id>.jsonl` as they are stored, so a rejoining node can still
+    serve them. The store's state is guarded by its own lock, which may be taken while holding
+    the node's lock, never the other way around.
+    """
+
+    def __init__(self, node, batch_size=100, file_name=None):
+        """
+        :param node: Node - The node (for its ID, ports, lock, transaction index and metrics).
+        :param batch_size: int - Number of transactions that seals a batch (a partial batch is sealed at each epoch start).
+        :param file_name: str, optional - File the batches are appended to (none: not persisted).
+        :raises ValueError: If the batch size is not positive.
+        """
+        if batch_size <= 0:
+            raise ValueError("batch_size must be positive")
+        self.node = node
+        self.batch_size = batch_size
+        self.file_name = file_name
+        self.lock = threading.Lock()
+        self.batches = {}  # Maps a digest to its stored Batch
+        self.available = collections.OrderedDict()  # Digests of the batches not yet in a notarized block, oldest first
+        self.sealing = []  # Own transactions waiting to be sealed into a batch
+        self.waiting = {}  # Maps the hash of a block missing batches to (block, vote for it once they arrive)
+        self.requested = {}  # Maps a missing digest to the epoch it was last requested in
+        self.filled = weakref.WeakSet()  # Block instances whose transactions were filled in from stored batches
+        self.file = None
+        self.file_lock = threading.Lock()  # Serializes appends to the file (kept out of the state lock)
+        node.on_notarized.append(self.block_notarized)
+        node.on_finalized.append(self.blocks_finalized)  # Also covers ancestors finalized without being notarized here
+        node.metrics.set("batches_stored", lambda: len(self.batches))
+        node.metrics.set("batches_available", lambda: len(self.available))
+
+    def add_local(self, transactions, epoch):
+        """
+        Adds transactions created by this node to the next batch.
+
+        :param transactions: list - The new transactions.
+        :param epoch: int - The current epoch.
+        """
+        with self.node.lock:
+            fresh = [tx for tx in transactions if self.node.tx_index.add_pending(tx.tx_id, epoch + 1)]
+        with self.lock:
+            self.sealing.extend(fresh)
+            full = len(self.sealing) >= self.batch_size
+        if full:
+            self.seal()
+
+    def seal(self):
+        """Seals this node's waiting transactions into batches and broadcasts them."""
+        with self.lock:
+            sealing, self.sealing = self.sealing, []
+        for start in range(0, len(sealing), self.batch_size):
+            batch = Batch(sealing[start:start + self.batch_size])
+            self.store([batch])
+            self.node.metrics.inc("batches_sealed")
+            self.node.run_async(self.node.broadcast_message, Message.create_batch_message(batch, self.node.node_id))
+
+    def tick(self):
+        """
+        Periodic work, at the start of each epoch: seals the waiting transactions and requests
+        batches that are still missing from every node.
+        """
+        self.seal()
+        epoch = self.node.current_epoch
+        blockchain = self.node.blockchain
+        finalized_epoch = blockchain[-1].epoch if blockchain else 0
+        with self.lock:
+            # Blocks at or below the finalized tip no longer matter (e.g. forks whose batches never arrived)
+            for block_hash, (block, _) in list(self.waiting.items()):
+                if block.epoch <= finalized_epoch:
+                    del self.waiting[block_hash]
+            wanted = {digest for block, _ in self.waiting.values() for digest in block.batch_digests}
+            self.requested = {digest: requested_in for digest, requested_in in self.requested.items() if digest in wanted}
+            overdue = [digest for digest, requested_in in self.requested.items() if requested_in < epoch]
+            for digest in overdue:
+                self.requested[digest] = epoch
+        if overdue:
+            self.node.run_async(self.node.broadcast_message, Message.create_query_batch_message(overdue, self.node.node_id))
+
+    def contains(self, digest):
+        """Returns True if the batch is stored."""
+        return digest in self.batches
+
+    def add_batches(self, batches):
+        """
+        Stores batches received from another node (BATCH or RESPONSE_BATCH).
+
+        :param batches: list - The received batches.
+        """
+        self.node.metrics.inc("batches_received", len(batches))
+        self.store(batches)
+
+    def store(self, batches):
+        """
+        Stores batches, then resumes the votes and notarizations that were waiting for them.
+
+        :param batches: list - Received or sealed batches.
+        """
+        with self.lock:
+            new = [batch for batch in batches if batch.digest not in self.batches]
+            for batch in new:
+                self.batches[batch.digest] = batch
+                self.available[batch.digest] = batch
+                self.requested.pop(batch.digest, None)
+            resumed = [(block, vote) for block, vote in self.waiting.values()
+                       if all(digest in self.batches for digest in block.batch_digests)]
+            for block, _ in resumed:
+                del self.waiting[block.hash]
+        if not new:
+            return
+        self.persist(new)
+        with self.node.lock:
+            for batch in new:
+                for tx in batch.transactions:
+                    self.node.tx_index.add_pending(tx.tx_id, self.node.current_epoch)
+
+        for block, vote in resumed:
+            self.node.metrics.inc("blocks_resumed")
+            if vote:
+                self.node.vote_on_block(block)
+            self.node.notarize_block(block)
+        if resumed:
+            with self.node.lock:
+                self.node.finalize_blocks()  # Finalization may have waited for these transactions
+
+    def resolve(self, block):
+        """
+        Fills in the transactions of a block from its stored batches.
+
+        The transactions the block carries are never trusted: they are replaced by those of the
+        batches, whose digests the block hash covers.
+
+        :param block: Block - The block.
+        :return: list - Digests of the block's batches that are not stored (empty once the block is resolved).
+        """
+        if self.resolved(block):
+            return []
+        with self.lock:
+            missing = [digest for digest in block.batch_digests if digest not in self.batches]
+            if not missing:
+                block.transactions = {tx.tx_id: tx for digest in block.batch_digests
+                                      for tx in self.batches[digest].transactions}
+                self.filled.add(block)
+        return missing
+
+    def resolved(self, block):
+        """Returns True if the block's transactions are known: it references no batch, or they were filled in from its batches."""
+        return not block.batch_digests or block in self.filled
+
+    def batches_of(self, blocks):
+        """
+        Returns the stored batches referenced by blocks (sent along with them during recovery).
+
+        :param blocks: list - The blocks.
+        :return: list - The batches, in block order.
+        """
+        with self.lock:
+            return [self.batches[digest] for block in blocks if block.batch_digests
+                    for digest in block.batch_digests if digest in self.batches]
+
+    def ensure(self, block, source, vote=False):
+        """
+        Makes sure a block's transactions are known before the node votes for or notarizes it.
+
+        :param block: Block - The block (the node's own instance of it, which is filled in).
+        :param source: int - ID of a node that stores the batches (the block's proposer).
+        :param vote: bool - Vote for the block once its batches arrive.
+        :return: bool - True if the block is resolved; otherwise its missing batches are requested.
+        """
+        missing = self.resolve(block)
+        if not missing:
+            return True
+        with self.lock:
+            waiting_vote = self.waiting.get(block.hash, (block, False))[1]
+            self.waiting[block.hash] = (block, vote or waiting_vote)
+            request = [digest for digest in missing if digest not in self.requested]
+            for digest in request:
+                self.requested[digest] = self.node.current_epoch
+        if vote:
+            self.node.metrics.inc("votes_deferred")
+        if request:
+            self.node.metrics.inc("batch_fetches")
+            query = Message.create_query_batch_message(request, self.node.node_id)
+            self.node.run_async(self.node.send_message_to_port, self.node.ports[source], query)
+        return False
+
+    def pack(self, policy, chain):
+        """
+        Selects the available batches of a proposal. Callers hold the node's lock.
+
+        Batches whose transactions all reached a block already (e.g. the same transactions
+        sealed by two nodes) are no longer available.
+
+        :param policy: BlockPackingPolicy - The block packing policy.
+        :param chain: list - The blocks the proposal extends, back to the finalized tip (their batches are left out).
+        :return: tuple - (selected batches, number of transactions left in the available batches).
+        """
+        ordered = {digest for block in chain if block.batch_digests for digest in block.batch_digests}
+        with self.lock:
+            for digest, batch in list(self.available.items()):
+                if not any((self.node.tx_index.lookup(tx.tx_id) or {}).get('state', PENDING) == PENDING
+                           for tx in batch.transactions):
+                    del self.available[digest]
+            candidates = [batch for digest, batch in self.available.items() if digest not in ordered]
+        return policy.pack_batches(candidates)
+
+    def serve(self, digests, sender):
+        """
+        Answers a QUERY_BATCH with the requested batches that are stored.
+
+        :param digests: list - The requested digests.
+        :param sender: int - ID of the requesting node.
+        """
+        with self.lock:
+            batches = [self.batches[digest] for digest in digests if digest in self.batches]
+        if batches:
+            response = Message.create_response_batch_message(batches, self.node.node_id)
+            self.node.send_message_to_port(self.node.ports[sender], response)
+
+    def block_notarized(self, block):
+        """Node listener: the block's batches are no longer available for proposals (called under the node's lock)."""
+        if block.batch_digests:
+            with self.lock:
+                for digest in block.batch_digests:
+                    self.available.pop(digest, None)
+
+    def blocks_finalized(self, blocks):
+        """Node listener: the blocks' batches are no longer available for proposals (called under the node's lock)."""
+        for block in blocks:
+            self.block_notarized(block)
+
+    def persist(self, batches):
+        """Appends batches to the store's file, one JSON object per line."""
+        if self.file_name is None:
+            return
+        try:
+            with self.file_lock:
+                if self.file is None:
+                    self.file = open(self.file_name, 'a')
+                for batch in batches:
+                    self.file.write(json.dumps(batch.to_dict()) + "\n")
+                self.file.flush()
+        except OSError as e:
+            log.error("Error saving batches to file: %s", e)
+
+    def load(self):
+        """
+        Restores the batches saved by a previous run of the node (when it rejoins).
+
+        Batches already ordered by the loaded chain are stored but not available for proposals.
+        """
+        if self.file_name is None or not os.path.exists(self.file_name):
+            return
+        batches = []
+        try:
+            with open(self.file_name, 'r') as f:
+                for line in f:
+                    if line.strip():
+                        batches.append(Batch.from_dict(json.loads(line)))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            log.error("Error loading batches from file: %s", e)
+        ordered = {digest for block in self.node.blockchain if block.batch_digests for digest in block.batch_digests}
+        with self.lock:
+            for batch in batches:
+                self.batches[batch.digest] = batch
+                if batch.digest not in ordered:
+                    self.available[batch.digest] = batch
+
+    def reset_file(self):
+        """Starts an empty batch file (a node that does not rejoin starts from scratch)."""
+        if self.file_name is not None and os.path.exists(self.file_name):
+            try:
+                os.remove(self.file_name)
+            except OSError as e:
+                log.error("Error removing batch file: %s", e)
@@ -0,0 +1,556 @@
+import argparse
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import platform
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from async_runtime import AsyncNode, AsyncRuntime
+from batch import Batch
+from block import Block
+from block_policy import BlockPackingPolicy
+from certificate import KeySet
+from compression import CODECS, Compressor
+from ledger import LedgerState
+from load_generator import percentile
+import logger
+from message import Message
+from node import Node
+from node_script import handle_incoming_messages, process_message
+from transaction import Transaction
+from transport import ShmTransport, TcpTransport, UnixTransport
+
+
+CHAIN_LENGTHS = [10, 100, 1000]  # Number of blocks in the chain
+BLOCK_SIZES = [1, 10, 100, 1000]  # Number of transactions per block
+NODE_COUNTS = [4, 16, 64]  # Number of nodes voting on a block
+MESSAGE_RATES = [100, 500, 2000, 5000]  # Messages per second sent to a node's listener
+
+QUICK_CHAIN_LENGTHS = [10, 100]
+QUICK_BLOCK_SIZES = [1, 100]
+QUICK_NODE_COUNTS = [4, 16]
+QUICK_MESSAGE_RATES = [100, 5000]
+
+
+class BytesConnection:
+    """Minimal stand-in for a connected socket that returns preloaded bytes and then EOF."""
+
+    def __init__(self, data):
+        self.buffer = io.BytesIO(data)
+
+    def recv(self, size):
+        return self.buffer.read(size)
+
+
+def make_transactions(count, first_tx_id=1):
+    """
+    Builds `count` deterministic transactions with consecutive IDs.
+
+    :param count: int - Number of transactions.
+    :param first_tx_id: int - ID of the first transaction.
+    :return: dict - Transactions keyed by ID, as stored in a Block.
+    """
+    return {
+        tx_id: Transaction(tx_id, f"Client{tx_id % 100 + 1}", f"Client{(tx_id * 7) % 100 + 1}", tx_id % 1000 + 1)
+        for tx_id in range(first_tx_id, first_tx_id + count)
+    }
+
+
+def make_chain(length, block_size):
+    """
+    Builds a hash-linked chain starting with the genesis block.
+
+    :param length: int - Number of blocks after the genesis block.
+    :param block_size: int - Number of transactions per block.
+    :return: list - The chain of blocks, genesis first.
+    """
+    chain = [Block(epoch=0, previous_hash=b'0' * 20, transactions={})]
+    for epoch in range(1, length + 1):
+        transactions = make_transactions(block_size, (epoch - 1) * block_size + 1)
+        chain.append(Block(epoch, chain[-1].hash, transactions))
+    return chain
+
+
+def make_node(total_nodes=4, chain=None, finalized=None, node_class=Node, port=0):
+    """
+    Builds a Node (without starting its thread) holding the given chain.
+
+    :param total_nodes: int - Number of nodes in the network.
+    :param chain: list, optional - Blocks to load as notarized.
+    :param finalized: int, optional - How many blocks of the chain are already finalized (default: all).
+    :param node_class: type - Node or one of its subclasses.
+    :param port: int - Port of the node.
+    :return: Node - The node.
+    """
+    node = node_class(0, total_nodes, 10 ** 6, 1, port, [port] + list(range(1, total_nodes)), "00:00", False)
+    chain = chain or [node.genesis_block]
+    finalized = len(chain) if finalized is None else finalized
+    node.notarized_blocks = {block.epoch: block for block in chain}
+    node.blockchain = list(chain[:finalized])
+    node.ledger = LedgerState.rebuild(node.blockchain)
+    node.tx_index.rebuild(node.blockchain, node.notarized_blocks)
+    node.current_epoch = chain[-1].epoch + 1
+    node.keys = KeySet.derive("benchmark", total_nodes)
+    return node
+
+
+def measure(function, setup=None, number=None, repeat=5, min_time=0.05):
+    """
+    Times a function, calling `setup` (untimed) before each repetition.
+
+    When `number` is not given, it is calibrated so each repetition takes at least `min_time`.
+
+    :return: dict - Per-call timings in seconds.
+    """
+    if number is None:
+        number = 1
+        while True:
+            state = setup() if setup else None
+            started = time.perf_counter()
+            for _ in range(number):
+                function(state)
+            if time.perf_counter() - started >= min_time or number >= 10 ** 6:
+                break
+            number *= 10
+
+    timings = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        started = time.perf_counter()
+        for _ in range(number):
+            function(state)
+        timings.append((time.perf_counter() - started) / number)
+
+    return {
+        'number': number,
+        'repeat': repeat,
+        'mean_s': statistics.mean(timings),
+        'min_s': min(timings),
+        'stdev_s': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+    }
+
+
+def bench_message_serialize(block_sizes, **_):
+    """Message.serialize of a PROPOSE message, by block size."""
+    for block_size in block_sizes:
+        block = Block(1, b'0' * 20, make_transactions(block_size))
+        message = Message.create_propose_message(block, 0)
+        yield {'block_size': block_size}, measure(lambda _: message.serialize())
+
+
+def bench_message_deserialize(block_sizes, **_):
+    """Message.deserialize_from_socket of a PROPOSE message, by block size (carrying its transactions, or referencing batches of 100)."""
+    for block_size in block_sizes:
+        data = Message.create_propose_message(Block(1, b'0' * 20, make_transactions(block_size)), 0).serialize()
+        yield {'block_size': block_size, 'bytes': len(data)}, measure(
+            lambda _: Message.deserialize_from_socket(BytesConnection(data)))
+
+        transactions = list(make_transactions(block_size).values())
+        batches = [Batch(transactions[start:start + 100]) for start in range(0, block_size, 100)]
+        block = Block(1, b'0' * 20, {tx.tx_id: tx for tx in transactions}, [batch.digest for batch in batches])
+        data = Message.create_propose_message(block, 0).serialize()
+        yield {'block_size': block_size, 'batching': True, 'bytes': len(data)}, measure(
+            lambda _: Message.deserialize_from_socket(BytesConnection(data)))
+
+
+def bench_message_filter(block_sizes, **_):
+    """Dropping a VOTE from its header (block already notarized, or duplicate), by block size."""
+    for block_size in block_sizes:
+        chain = make_chain(2, block_size)
+        node = make_node(chain=chain, finalized=1)
+        keys = KeySet.derive("benchmark", 4)
+        data = Message.create_vote_message(chain[-1], 1, keys.mac(1, chain[-1].hash, chain[-1].epoch)).serialize()
+        yield {'block_size': block_size, 'case': 'notarized_vote'}, measure(lambda _: node.message_filter.admit(data))
+
+        node.notarized_blocks.pop(chain[-1].epoch)
+        node.message_filter.admit(data)
+        yield {'block_size': block_size, 'case': 'duplicate'}, measure(lambda _: node.message_filter.admit(data))
+
+
+def bench_compression(block_sizes, **_):
+    """Compressing a PROPOSE body for one peer, by codec and block size (the ratio is reported alongside)."""
+    node = make_node()
+    node.compressor = Compressor(node, list(CODECS), threshold=0)
+    for codec_name, codec in CODECS.items():
+        node.compressor.peer_accepts[1] = 1 << codec
+        for block_size in block_sizes:
+            data = Message.create_propose_message(make_chain(1, block_size)[-1], 0).serialize()
+            encoded = node.compressor.encode(data, 1)
+            timing = measure(lambda _: node.compressor.encode(data, 1))
+            timing['ratio'] = round(len(encoded) / len(data), 4)
+            yield {'codec': codec_name, 'block_size': block_size}, timing
+
+
+def bench_block_calculate_hash(block_sizes, **_):
+    """Block.calculate_hash, by block size."""
+    for block_size in block_sizes:
+        block = Block(1, b'0' * 20, make_transactions(block_size))
+        yield {'block_size': block_size}, measure(lambda _: block.calculate_hash())
+
+
+def bench_block_from_dict(block_sizes, **_):
+    """Block.from_dict, by block size."""
+    for block_size in block_sizes:
+        data = Block(1, b'0' * 20, make_transactions(block_size)).to_dict()
+        yield {'block_size': block_size}, measure(lambda _: Block.from_dict(data))
+
+
+def bench_block_packing(block_sizes, **_):
+    """BlockPackingPolicy.pack of a backlog of twice the block size, limited by transaction count and by bytes."""
+    for block_size in block_sizes:
+        candidates = list(make_transactions(2 * block_size).values())
+        node = make_node()
+        by_count = BlockPackingPolicy(node, max_transactions=block_size)
+        by_bytes = BlockPackingPolicy(node, max_bytes=block_size * by_count.transaction_size(candidates[0]))
+        yield {'block_size': block_size, 'limit': 'transactions'}, measure(lambda _: by_count.pack(candidates))
+        yield {'block_size': block_size, 'limit': 'bytes'}, measure(lambda _: by_bytes.pack(candidates))
+
+
+def bench_node_add_transaction(chain_lengths, **_):
+    """Node.add_transaction of a new transaction, by chain length (10 transactions per block)."""
+    for chain_length in chain_lengths:
+        chain = make_chain(chain_length, 10)
+        first_new_tx_id = chain_length * 10 + 1
+
+        def setup():
+            node = make_node(chain=chain)
+            return {'node': node, 'next_tx_id': [first_new_tx_id]}
+
+        def add(state):
+            tx_id = state['next_tx_id'][0]
+            state['next_tx_id'][0] += 1
+            state['node'].add_transaction(Transaction(tx_id, "Client1", "Client2", 1), chain_length)
+
+        yield {'chain_length': chain_length}, measure(add, setup)
+
+
+def bench_node_finalize_blocks(chain_lengths, **_):
+    """Node.finalize_blocks when the newest notarization finalizes one more block, by chain length."""
+    for chain_length in chain_lengths:
+        chain = make_chain(chain_length, 10)
+
+        def setup():
+            return make_node(chain=chain, finalized=len(chain) - 2)
+
+        yield {'chain_length': chain_length}, measure(lambda node: node.finalize_blocks(), setup, number=1, repeat=20)
+
+
+def bench_node_get_chain_to_block(chain_lengths, **_):
+    """Node.get_chain_to_block from the tip when half of the chain is finalized, by chain length."""
+    for chain_length in chain_lengths:
+        chain = make_chain(chain_length, 10)
+        node = make_node(chain=chain, finalized=len(chain) // 2 + 1)
+        yield {'chain_length': chain_length}, measure(lambda _: node.get_chain_to_block(chain[-1]))
+
+
+def bench_node_save_blockchain(chain_lengths, block_sizes, **_):
+    """Node.save_blockchain, by chain length and block size."""
+    for chain_length in chain_lengths:
+        for block_size in block_sizes:
+            node = make_node(chain=make_chain(chain_length, block_size))
+            yield {'chain_length': chain_length, 'block_size': block_size}, measure(
+                lambda _: node.save_blockchain(), repeat=3, min_time=0.02)
+
+
+def bench_node_load_blockchain(chain_lengths, block_sizes, **_):
+    """Node.load_blockchain, by chain length and block size."""
+    for chain_length in chain_lengths:
+        for block_size in block_sizes:
+            node = make_node(chain=make_chain(chain_length, block_size))
+            node.save_blockchain()
+            yield {'chain_length': chain_length, 'block_size': block_size}, measure(
+                lambda _: node.load_blockchain(), repeat=3, min_time=0.02)
+
+
+def bench_vote_round(node_counts, **_):
+    """Processing the VOTE messages that notarize a block (and finalize its parent), by node count."""
+    for node_count in node_counts:
+        chain = make_chain(3, 10)
+        proposal = Block(4, chain[-1].hash, make_transactions(10, 31))
+        keys = KeySet.derive("benchmark", node_count)
+        votes = [Message.create_vote_message(proposal, sender, keys.mac(sender, proposal.hash, proposal.epoch))
+                 for sender in range(1, node_count)]
+
+        def setup():
+            return make_node(node_count, chain=chain, finalized=2)
+
+        def vote_round(node):
+            for vote in votes:
+                process_message(node, vote)
+
+        yield {'node_count': node_count}, measure(vote_round, setup, number=1, repeat=20)
+
+
+def bench_transport_send(block_sizes, **_):
+    """Sending a PROPOSE message and receiving it on the same host, by transport and block size."""
+    for transport_name, make_transport in (('tcp', lambda port, ports: TcpTransport()),
+                                           ('unix', lambda port, ports: UnixTransport()),
+                                           ('shm', ShmTransport)):
+        ports = [free_port(), free_port()]
+        sender, receiver = make_transport(ports[0], ports), make_transport(ports[1], ports)
+        listener = receiver.listen(ports[1])
+        try:
+            for block_size in block_sizes:
+                data = Message.create_propose_message(make_chain(1, block_size)[-1], 0).serialize()
+
+                def send_and_receive(_):
+                    sender.send(ports[1], data)
+                    listener.receive()
+
+                yield {'transport': transport_name, 'block_size': block_size}, measure(send_and_receive)
+        finally:
+            listener.close()
+
+
+def free_port():
+    """Returns a local TCP port that is currently free."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+def start_threaded_listener(node):
+    """
+    Runs the threaded runtime's listener for a node. Returns a sampling callback and a stop callback.
+
+    Stopping closes the listener, which ends the listener thread; the queue thread stays idle until the process exits.
+    """
+    listener = node.transport.listen(node.port)
+    threading.Thread(target=handle_incoming_messages, args=(listener, node), daemon=True).start()
+    return lambda: {'threads': threading.active_count(), 'tasks': 0}, listener.close
+
+
+def start_asyncio_listener(node):
+    """Runs the asyncio runtime's listener for a node. Returns a sampling callback and a stop callback."""
+    runtime = AsyncRuntime(node)
+    ready = threading.Event()
+    loop = asyncio.new_event_loop()
+
+    def serve():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(runtime.listen())
+        ready.set()
+        loop.run_forever()
+        loop.run_until_complete(runtime.close())
+        loop.close()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    ready.wait()
+
+    def stop():
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5.0)
+
+    sample = lambda: {'threads': threading.active_count(), 'tasks': len(asyncio.all_tasks(loop))}
+    return sample, stop
+
+
+def send_at_rate(port, messages, rate, results):
+    """
+    Sends each message over a new connection at a fixed rate (runs in its own process, like another node).
+
+    :param port: int - The port of the node.
+    :param messages: list - The serialized messages.
+    :param rate: int - Messages per second.
+    :param results: multiprocessing.Queue - Receives the `time.perf_counter()` at which each message was sent.
+    """
+    sent = []
+    started = time.perf_counter()
+    for index, data in enumerate(messages):
+        delay = started + index / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.connect(('localhost', port))
+            sent.append(time.perf_counter())
+            s.sendall(data)
+    results.put(sent)
+
+
+def measure_runtime(runtime, rate, duration=1.0, timeout=10.0):
+    """
+    Sends ECHO_TRANSACTION messages to a node's listener at a fixed rate and times each message
+    from the moment it is sent until the node processes it.
+
+    The messages are sent by another process, as they are by the other nodes, so the sender does
+    not compete with the listener for the interpreter lock. `time.perf_counter()` is a system-wide
+    monotonic clock, so the send and processing times of both processes can be compared.
+
+    :param runtime: str - 'threads' or 'asyncio'.
+    :param rate: int - Messages per second.
+    :param duration: float - Seconds of sending.
+    :param timeout: float - Seconds to wait for the last messages to be processed.
+    :return: dict - Latency statistics, and the peak numbers of threads (started by the runtime) and tasks while the messages were processed.
+    """
+    baseline = threading.active_count()  # Threads left idle by earlier measurements are not counted
+    node = make_node(node_class=AsyncNode if runtime == 'asyncio' else Node, port=free_port())
+    processed = {}
+    add_transaction = node.add_transaction
+
+    def record(transaction, epoch):
+        processed[transaction.tx_id] = time.perf_counter()
+        add_transaction(transaction, epoch)
+
+    node.add_transaction = record
+    sample, stop = (start_asyncio_listener if runtime == 'asyncio' else start_threaded_listener)(node)
+
+    count = int(rate * duration)
+    messages = [Message.create_echo_transaction_message(transaction, node.current_epoch, 1).serialize()
+                for transaction in make_transactions(count).values()]
+    context = multiprocessing.get_context('spawn')  # The node's threads are not forked along
+    results = context.Queue()
+    sender = context.Process(target=send_at_rate, args=(node.port, messages, rate, results), daemon=True)
+    sender.start()
+    peaks = {'threads': 0, 'tasks': 0}
+    deadline = time.perf_counter() + duration + timeout
+    while len(processed) < count and time.perf_counter() < deadline:
+        for key, value in sample().items():
+            peaks[key] = max(peaks[key], value)
+        time.sleep(0.01)
+    sent = results.get(timeout=timeout)
+    sender.join()
+    stop()
+
+    latencies = sorted(processed[tx_id] - sent[tx_id - 1] for tx_id in processed if tx_id <= len(sent))
+    return {
+        'number': len(latencies),
+        'repeat': 1,
+        'mean_s': statistics.mean(latencies) if latencies else None,
+        'min_s': latencies[0] if latencies else None,
+        'p50_s': percentile(latencies, 50),
+        'p99_s': percentile(latencies, 99),
+        'lost': count - len(latencies),
+        'peak_threads': peaks['threads'] - baseline,
+        'peak_tasks': peaks['tasks'],
+    }
+
+
+def bench_runtime_messages(message_rates, **_):
+    """Per-message latency (sent until processed) of the threaded and the asyncio listener, by message rate."""
+    for runtime in ('asyncio', 'threads'):
+        for rate in message_rates:
+            yield {'runtime': runtime, 'rate': rate}, measure_runtime(runtime, rate)
+
+
+BENCHMARKS = {
+    'Message.serialize': bench_message_serialize,
+    'Message.deserialize_from_socket': bench_message_deserialize,
+    'MessageFilter.admit': bench_message_filter,
+    'Compressor.encode': bench_compression,
+    'Block.calculate_hash': bench_block_calculate_hash,
+    'Block.from_dict': bench_block_from_dict,
+    'BlockPackingPolicy.pack': bench_block_packing,
+    'Node.add_transaction': bench_node_add_transaction,
+    'Node.finalize_blocks': bench_node_finalize_blocks,
+    'Node.get_chain_to_block': bench_node_get_chain_to_block,
+    'Node.save_blockchain': bench_node_save_blockchain,
+    'Node.load_blockchain': bench_node_load_blockchain,
+    'process_message(VOTE) round': bench_vote_round,
+    'transport send': bench_transport_send,
+    'runtime message latency': bench_runtime_messages,
+}
+
+
+def run_benchmarks(selected=None, quick=False, log_level="WARNING"):
+    """
+    Runs the selected benchmarks (all by default) inside a temporary directory.
+
+    :param selected: list, optional - Names (or name prefixes) of the benchmarks to run.
+    :param quick: bool - Use fewer and smaller sizes.
+    :param log_level: str - Log level of the benchmarked nodes (production level by default).
+    :return: dict - Metadata and the list of results.
+    """
+    logger.configure(level=log_level)
+    sizes = {
+        'chain_lengths': QUICK_CHAIN_LENGTHS if quick else CHAIN_LENGTHS,
+        'block_sizes': QUICK_BLOCK_SIZES if quick else BLOCK_SIZES,
+        'node_counts': QUICK_NODE_COUNTS if quick else NODE_COUNTS,
+        'message_rates': QUICK_MESSAGE_RATES if quick else MESSAGE_RATES,
+    }
+    results = []
+    previous_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)  # save/load_blockchain write to the working directory
+        try:
+            for name, benchmark in BENCHMARKS.items():
+                if selected and not any(name.startswith(prefix) for prefix in selected):
+                    continue
+                for params, timing in benchmark(**sizes):
+                    results.append({'name': name, 'params': params, **timing})
+                    print(f"{name:<32} {json.dumps(params):<45} {timing['mean_s'] * 1e6:>12.2f} us")
+        finally:
+            os.chdir(previous_directory)
+
+    return {
+        'meta': {
+            'python': sys.version.split()[0],
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'quick': quick,
+            'log_level': log_level,
+        },
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold):
+    """
+    Prints the ratio current/baseline for every case found in both runs.
+
+    :param threshold: float - Ratio above which a case is reported as a regression.
+    :return: int - The number of regressions.
+    """
+    baseline_results = {(r['name'], json.dumps(r['params'], sort_keys=True)): r for r in baseline['results']}
+    regressions = 0
+    for result in current['results']:
+        key = (result['name'], json.dumps(result['params'], sort_keys=True))
+        if key not in baseline_results:
+            continue
+        ratio = result['min_s'] / baseline_results[key]['min_s']
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{result['name']:<32} {key[1]:<45} x{ratio:.2f}{flag}")
+    return regressions
+
+
+def main():
+    """
+    Entry point of the benchmark suite.
+
+    Usage:
+        benchmark.py [--quick] [--only NAME ...] [--output results.json] [--compare baseline.json]
+    """
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the consensus hot paths.")
+    parser.add_argument("--quick", action="store_true", help="Use fewer and smaller sizes")
+    parser.add_argument("--only", nargs="+", help="Only run benchmarks whose name starts with one of these")
+    parser.add_argument("--output", default="bench_results.json", help="File to write the results to")
+    parser.add_argument("--compare", help="Baseline results file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Ratio reported as a regression")
+    parser.add_argument("--log-level", default="WARNING", help="Log level of the benchmarked nodes")
+    args = parser.parse_args()
+
+    current = run_benchmarks(args.only, args.quick, args.log_level)
+    with open(args.output, 'w') as f:
+        json.dump(current, f, indent=4)
+    print(f"Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        if compare(baseline, current, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,52 +6,68 @@ class Block:
     Represents a block in the Blockchain, storing transactions, the epoch number, and a link to the previous block through its hash.
     """
     
-    def __init__(self, epoch, previous_hash, transactions):
+    def __init__(self, epoch, previous_hash, transactions, batch_digests=None):
         """
         Initializes a Block object with an epoch number, hash of the previous block, and a set of transactions.
 
         :param epoch: int - The epoch number of the block, indicating its place in the blockchain.
         :param previous_hash: bytes - SHA-1 hash of the previous block in the chain.
         :param transactions: dict - A dictionary where each key is a transaction ID (tx_id) and each value is a Transaction object.
+        :param batch_digests: list, optional - Digests of the transaction batches the block references (see batch.py).
+            The transactions of such a block are those of its batches, and may be filled in after the block is received.
         """
         self.epoch = epoch
         self.previous_hash = previous_hash  # Should be of type bytes.
         self.transactions = transactions    # Dictionary with transaction ID as key and Transaction as value.
+        self.batch_digests = batch_digests  # None for a block that carries its transactions.
         self.hash = self.calculate_hash()   # Hash calculated for this block's data.
     
     def calculate_hash(self):
         """
         Calculates the SHA-1 hash for the block using the epoch, previous block hash, and transaction IDs.
 
+        A block that references batches is hashed over its batch digests instead, which already
+        bind its transactions.
+
         :return: bytes - The SHA-1 hash representing the block.
         """
+        if self.batch_digests is not None:
+            block_string = f"{self.epoch}{self.previous_hash.hex()}{[digest.hex() for digest in self.batch_digests]}"
+            return hashlib.sha1(block_string.encode('utf-8')).digest()
         block_string = f"{self.epoch}{self.previous_hash.hex()}{sorted(self.transactions.keys())}"
         return hashlib.sha1(block_string.encode('utf-8')).digest()
     
-    def to_dict(self):
+    def to_dict(self, compact=False):
         """
         Serializes the Block object into a dictionary format.
 
-        :return: dict - A dictionary with the block's epoch, previous hash, transactions, and current hash.
+        :param compact: bool - Leave out the transactions of a block that references batches (the receivers fetch its batches).
+        :return: dict - A dictionary with the block's epoch, previous hash, transactions, current hash,
+            and batch digests (only for a block that references batches).
         """
-        return {
+        data = {
             'epoch': self.epoch,
             'previous_hash': self.previous_hash.hex(),
-            'transactions': [tx.to_dict() for tx in self.transactions.values()],
+            'transactions': [] if compact and self.batch_digests is not None else [tx.to_dict() for tx in self.transactions.values()],
             'hash': self.hash.hex()
         }
+        if self.batch_digests is not None:
+            data['batch_digests'] = [digest.hex() for digest in self.batch_digests]
+        return data
     
     @staticmethod
     def from_dict(data):
         """
         Deserializes a dictionary to reconstruct a Block object.
 
-        :param data: dict - A dictionary containing the block's attributes (epoch, previous hash, transactions, and hash).
+        :param data: dict - A dictionary containing the block's attributes (epoch, previous hash, transactions, hash
+            and optionally batch digests).
         :return: Block - A reconstructed Block object with all attributes.
         """
         epoch = data['epoch']
         previous_hash = bytes.fromhex(data['previous_hash'])
         transactions = {int(tx['tx_id']): Transaction.from_dict(tx) for tx in data['transactions']}
-        block = Block(epoch, previous_hash, transactions)
+        batch_digests = [bytes.fromhex(digest) for digest in data['batch_digests']] if 'batch_digests' in data else None
+        block = Block(epoch, previous_hash, transactions, batch_digests)
         block.hash = bytes.fromhex(data['hash'])  # Set the hash to match the received block data
         return block
@@ -0,0 +1,155 @@
+import json
+import time
+
+
+class BlockPackingPolicy:
+    """
+    Decides which pending transactions go into a proposal.
+
+    A block holds at most `max_transactions` transactions and `max_bytes` bytes of serialized
+    transactions; the transactions that do not fit stay in the pool for the next leader. With
+    a `target_latency`, the transaction limit is also sized adaptively from the time this
+    node's own proposals take to be notarized (AIMD): it grows by `increase` transactions after
+    each full block notarized within the target, and is multiplied by `decrease` after a block
+    notarized late or not notarized within its epoch. Without limits, every pending
+    transaction is proposed.
+    """
+
+    def __init__(self, node, max_bytes=None, max_transactions=None, target_latency=None,
+                 initial_transactions=100, increase=50, decrease=0.5):
+        """
+        :param node: Node - The node (for its epoch duration and metrics).
+        :param max_bytes: int, optional - Maximum size of the block's serialized transactions.
+        :param max_transactions: int, optional - Maximum number of transactions in a block.
+        :param target_latency: float, optional - Target propose-to-notarize latency in seconds (enables adaptive sizing).
+        :param initial_transactions: int - Starting transaction limit of adaptive sizing (capped by `max_transactions`).
+        :param increase: int - Transactions added to the limit after a full block notarized in time.
+        :param decrease: float - Factor applied to the limit after a late block.
+        :raises ValueError: If a limit is not positive or the decrease factor is not in (0, 1).
+        """
+        for name, value in (("max_bytes", max_bytes), ("max_transactions", max_transactions),
+                            ("target_latency", target_latency)):
+            if value is not None and value <= 0:
+                raise ValueError(f"{name} must be positive")
+        if not 0 < decrease < 1:
+            raise ValueError("decrease must be between 0 and 1")
+        self.node = node
+        self.max_bytes = max_bytes
+        self.max_transactions = max_transactions
+        self.target_latency = target_latency
+        self.increase = increase
+        self.decrease = decrease
+        self.limit = None  # Current adaptive transaction limit
+        if target_latency is not None:
+            self.limit = min(initial_transactions, max_transactions) if max_transactions else initial_transactions
+        self.outstanding = {}  # Maps the hash of an own proposal to (proposal time, whether the limit was reached)
+        self.sizes = {}  # Sizes of the transactions left out of the last proposal, by tx_id (they are packed again)
+        node.on_notarized.append(self.block_notarized)
+        node.metrics.set("block_transaction_limit", lambda: self.transaction_limit() or 0)
+
+    def transaction_limit(self):
+        """Returns the maximum number of transactions of the next block (None: no limit)."""
+        return self.limit if self.limit is not None else self.max_transactions
+
+    @staticmethod
+    def transaction_size(transaction):
+        """Returns the size of a transaction in a serialized block (JSON and separator)."""
+        return len(json.dumps(transaction.to_dict())) + 2
+
+    def pack(self, candidates):
+        """
+        Selects the transactions of a proposal.
+
+        :param candidates: list - Pending transactions, oldest first.
+        :return: tuple - (selected transactions, number of candidates left in the pool).
+        """
+        self.expire()
+        sizes = {}
+
+        def size_of(transaction):
+            sizes[transaction.tx_id] = self.sizes.get(transaction.tx_id) or self.transaction_size(transaction)
+            return sizes[transaction.tx_id]
+
+        selected = self.select(candidates, lambda transaction: 1, size_of)
+        for transaction in selected:
+            sizes.pop(transaction.tx_id, None)
+        self.sizes = sizes
+        return selected, len(candidates) - len(selected)
+
+    def pack_batches(self, batches):
+        """
+        Selects the batches of a proposal, each counting as its transactions.
+
+        :param batches: list - Available batches, oldest first.
+        :return: tuple - (selected batches, number of transactions left in the available batches).
+        """
+        self.expire()
+        selected = self.select(batches, lambda batch: len(batch.transactions), lambda batch: batch.size)
+        return selected, sum(len(batch.transactions) for batch in batches) - sum(len(batch.transactions) for batch in selected)
+
+    def select(self, items, count_of, size_of):
+        """
+        Takes items, in order, while they fit the limits; an item larger than a limit is only taken alone.
+
+        :param items: list - The candidate items.
+        :param count_of: callable - item -> number of transactions.
+        :param size_of: callable - item -> size in bytes.
+        :return: list - The selected items.
+        """
+        limit = self.transaction_limit()
+        if limit is None and self.max_bytes is None:
+            return list(items)
+
+        selected = []
+        count = size = 0
+        for item in items:
+            item_count = count_of(item)
+            if limit is not None and selected and count + item_count > limit:
+                break
+            if self.max_bytes is not None:
+                item_size = size_of(item)
+                if selected and size + item_size > self.max_bytes:
+                    break
+                size += item_size
+            count += item_count
+            selected.append(item)
+        return selected
+
+    def proposed(self, block, deferred):
+        """
+        Records a proposal of this node, whose notarization latency drives the adaptive limit.
+
+        :param block: Block - The proposed block.
+        :param deferred: int - Number of pending transactions that did not fit in the block.
+        """
+        self.node.metrics.observe("block_transactions", len(block.transactions),
+                                  buckets=(0, 1, 10, 50, 100, 500, 1000, 5000, 10000, 50000))
+        if deferred:
+            self.node.metrics.inc("transactions_deferred", deferred)
+        if self.limit is not None:
+            self.outstanding[block.hash] = (time.monotonic(), deferred > 0)
+
+    def block_notarized(self, block):
+        """Node listener: adapts the limit to the latency of this node's notarized proposals (called under the node's lock)."""
+        proposal = self.outstanding.pop(block.hash, None)
+        if proposal is None:
+            return
+        proposed_at, full = proposal
+        if time.monotonic() - proposed_at > self.target_latency:
+            self.shrink()
+        elif full:
+            self.limit += self.increase
+            if self.max_transactions is not None:
+                self.limit = min(self.limit, self.max_transactions)
+
+    def expire(self):
+        """Treats own proposals that were not notarized within an epoch as late."""
+        now = time.monotonic()
+        for block_hash, (proposed_at, _) in list(self.outstanding.items()):
+            if now - proposed_at > self.node.epoch_duration:
+                del self.outstanding[block_hash]
+                self.shrink()
+
+    def shrink(self):
+        self.limit = max(int(self.limit * self.decrease), 1)
+        self.node.metrics.inc("block_limit_decreases")
@@ -0,0 +1,174 @@
+import hashlib
+import hmac
+
+
+MAC_SIZE = 16  # Bytes kept from each HMAC-SHA256 tag
+
+
+class KeySet:
+    """
+    The MAC keys of every node, shared by all nodes of the network.
+
+    Node i authenticates its votes with key i, and any node holding the key set can check them.
+    Because the keys are shared, a certificate convinces the members of the network but is
+    not transferable proof to outsiders (unlike signatures).
+    """
+
+    def __init__(self, keys):
+        """
+        :param keys: list - One key (bytes) per node, indexed by node ID.
+        """
+        self.keys = keys
+
+    @staticmethod
+    def from_config(mac_keys):
+        """
+        Builds the key set from the `mac_keys` configuration entry.
+
+        :param mac_keys: list - One hex-encoded key per node.
+        :return: KeySet - The key set.
+        """
+        return KeySet([bytes.fromhex(key) for key in mac_keys])
+
+    @staticmethod
+    def derive(seed, total_nodes):
+        """
+        Derives a development key set from the protocol seed (for tests and local clusters only:
+        anyone who knows the seed can forge votes).
+
+        :param seed: str - The protocol seed.
+        :param total_nodes: int - Number of nodes.
+        :return: KeySet - The key set.
+        """
+        return KeySet([hashlib.sha256(f"{seed}-mac-{node_id}".encode('utf-8')).digest() for node_id in range(total_nodes)])
+
+    def mac(self, node_id, block_hash, epoch):
+        """
+        Computes the MAC of a node's vote.
+
+        :param node_id: int - The voter.
+        :param block_hash: bytes - The hash of the block voted for.
+        :param epoch: int - The epoch of the block.
+        :return: bytes - The MAC.
+        """
+        message = b"VOTE" + epoch.to_bytes(8, 'big') + block_hash
+        return hmac.new(self.keys[node_id], message, hashlib.sha256).digest()[:MAC_SIZE]
+
+    def verify(self, node_id, block_hash, epoch, mac):
+        """
+        Checks the MAC of a node's vote.
+
+        :return: bool - True if the MAC is valid.
+        """
+        if mac is None or not 0 <= node_id < len(self.keys):
+            return False
+        return hmac.compare_digest(self.mac(node_id, block_hash, epoch), mac)
+
+
+class NotarizationCertificate:
+    """
+    Evidence that a block was notarized: the block's hash and epoch, a bitmap of the voters
+    and the MAC of each voter's vote, in voter order.
+    """
+
+    def __init__(self, block_hash, epoch, voters=0, macs=None):
+        """
+        :param block_hash: bytes - The hash of the block.
+        :param epoch: int - The epoch of the block.
+        :param voters: int - Bitmap of the voters (bit i set if node i voted).
+        :param macs: dict, optional - Maps a voter to the MAC of its vote.
+        """
+        self.block_hash = block_hash
+        self.epoch = epoch
+        self.voters = voters
+        self.macs = macs or {}
+
+    def add_vote(self, node_id, mac):
+        """Adds a voter and the MAC of its vote."""
+        self.voters |= 1 << node_id
+        self.macs[node_id] = mac
+
+    def voter_count(self):
+        """Returns the number of voters."""
+        return bin(self.voters).count("1")
+
+    def verify(self, keys, total_nodes):
+        """
+        Checks that more than half of the nodes voted for the block and that every MAC is valid.
+
+        :param keys: KeySet - The MAC keys of the network.
+        :param total_nodes: int - Number of nodes.
+        :return: bool - True if the certificate is valid.
+        """
+        if self.voter_count() <= total_nodes // 2 or self.voters >> total_nodes:
+            return False
+        return all(keys.verify(node_id, self.block_hash, self.epoch, self.macs.get(node_id))
+                   for node_id in range(total_nodes) if self.voters >> node_id & 1)
+
+    def to_dict(self):
+        """
+        Serializes the certificate.
+
+        :return: dict - Hash, epoch, voter bitmap and the MACs of the voters in voter order.
+        """
+        voter_ids = [node_id for node_id in sorted(self.macs) if self.voters >> node_id & 1]
+        return {
+            'hash': self.block_hash.hex(),
+            'epoch': self.epoch,
+            'voters': self.voters,
+            'macs': "".join(self.macs[node_id].hex() for node_id in voter_ids),
+        }
+
+    @staticmethod
+    def from_dict(data):
+        """
+        Deserializes a certificate.
+
+        :param data: dict - A dictionary produced by `to_dict`.
+        :return: NotarizationCertificate - The certificate.
+        """
+        voters = int(data['voters'])
+        macs = bytes.fromhex(data['macs'])
+        voter_ids = [node_id for node_id in range(voters.bit_length()) if voters >> node_id & 1]
+        return NotarizationCertificate(
+            bytes.fromhex(data['hash']), int(data['epoch']), voters,
+            {node_id: macs[i * MAC_SIZE:(i + 1) * MAC_SIZE] for i, node_id in enumerate(voter_ids)}
+        )
+
+
+def verify_blocks(blocks, certificates, keys, total_nodes, known_hashes, resolve=None):
+    """
+    Verifies a range of blocks received during sync in one pass.
+
+    Each block must have a valid certificate for its recomputed hash and epoch, and must link to
+    a block that is already known or to an earlier block of the range. The hash of a block that
+    references batches only covers their digests, so its transactions must come from `resolve`,
+    which fills them in from verified batches. Blocks are checked in epoch order and
+    verification stops at the first invalid block, so the result is always a connected prefix
+    of the range.
+
+    :param blocks: list - The received blocks.
+    :param certificates: dict - Maps a block hash to its NotarizationCertificate.
+    :param keys: KeySet - The MAC keys of the network.
+    :param total_nodes: int - Number of nodes.
+    :param known_hashes: set - Hashes of the blocks the verifier already holds.
+    :param resolve: callable, optional - block -> True if the block's transactions were filled in from its batches.
+    :return: tuple - (list of verified blocks, reason the rest was rejected or None).
+    """
+    verified = []
+    known_hashes = set(known_hashes)
+    for block in sorted(blocks, key=lambda block: block.epoch):
+        if block.calculate_hash() != block.hash:
+            return verified, f"block of epoch {block.epoch} does not match its hash"
+        if block.batch_digests and (resolve is None or not resolve(block)):
+            return verified, f"transactions of block of epoch {block.epoch} are not available from its batches"
+        if block.previous_hash not in known_hashes:
+            return verified, f"block of epoch {block.epoch} does not link to a known block"
+        certificate = certificates.get(block.hash)
+        if certificate is None or certificate.epoch != block.epoch:
+            return verified, f"block of epoch {block.epoch} has no certificate"
+        if not certificate.verify(keys, total_nodes):
+            return verified, f"certificate of epoch {block.epoch} is invalid"
+        verified.append(block)
+        known_hashes.add(block.hash)
+    return verified, None
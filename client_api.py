@@ -0,0 +1,261 @@
+import itertools
+import json
+import queue
+import socket
+import threading
+
+from message import Message
+from transaction import Transaction
+
+
+class ClientSession:
+    """
+    One client connection to the client API.
+
+    Requests are read line by line, so a client can pipeline any number of them over the
+    connection without waiting for replies. Replies and commit acknowledgements are written
+    by a dedicated writer thread from a queue, so consensus never blocks on a slow client.
+    """
+
+    def __init__(self, server, connection):
+        self.server = server
+        self.connection = connection
+        self.outbox = queue.Queue()  # Lines waiting to be written to the client
+        self.closed = False
+
+    def send(self, reply):
+        """Queues a reply for the writer thread; safe to call while holding the node's lock."""
+        if not self.closed:
+            self.outbox.put(reply)
+
+    def write_loop(self):
+        """Writes queued replies, batching whatever is already waiting, until the session closes."""
+        try:
+            while True:
+                replies = [self.outbox.get()]
+                while True:
+                    try:
+                        replies.append(self.outbox.get_nowait())
+                    except queue.Empty:
+                        break
+                stopping = None in replies
+                if stopping:
+                    replies = replies[:replies.index(None)]
+                if replies:
+                    self.connection.sendall("".join(json.dumps(reply) + "\n" for reply in replies).encode('utf-8'))
+                if stopping:
+                    return
+        except OSError:
+            self.closed = True
+
+    def read_loop(self):
+        """Reads and handles requests until the client disconnects."""
+        with self.connection.makefile('r', encoding='utf-8') as reader:
+            for line in reader:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError as e:
+                    self.send({'error': f"invalid JSON: {e}"})
+                    continue
+                self.send(self.server.handle_request(self, request))
+        self.closed = True
+        self.outbox.put(None)  # Stops the writer thread
+
+    def run(self):
+        """Serves the connection until the client disconnects."""
+        writer = threading.Thread(target=self.write_loop, daemon=True)
+        writer.start()
+        try:
+            self.read_loop()
+        except OSError:
+            self.closed = True
+            self.outbox.put(None)
+        writer.join()
+        self.server.forget(self)
+        self.connection.close()
+
+
+class ClientAPIServer:
+    """
+    Local endpoint through which clients submit transactions to a node and follow their commit.
+
+    Protocol: newline-delimited JSON over TCP. A request is
+    `{"id": 1, "op": "submit", "transactions": [{"sender": "A", "receiver": "B", "amount": 5}, ...]}`
+    and is answered with `{"id": 1, "status": "accepted", "tx_ids": [...]}`. For every accepted
+    transaction the client is then sent `{"event": "notarized", "tx_id": ..., "epoch": ..., "block": ...}`
+    and `{"event": "finalized", ...}` as the block holding it is notarized and finalized.
+
+    `{"op": "status", "tx_id": ...}` returns the state (pending, notarized, finalized or unknown),
+    block hash, epoch and position of a transaction. The finalized ledger state can be queried with `{"op": "balance", "account": ...}` and
+    `{"op": "history", "account": ..., "from_epoch": ..., "to_epoch": ...}` (both bounds optional).
+    """
+
+    def __init__(self, node, port, host='localhost'):
+        """
+        :param node: Node - The node transactions are submitted to.
+        :param port: int - Port of the client endpoint.
+        :param host: str - Interface to listen on (local only by default).
+        """
+        self.node = node
+        self.address = (host, port)
+        self.lock = threading.Lock()
+        self.watchers = {}  # Maps a tx_id to the session waiting for its acknowledgements
+        self.notarized = set()  # tx_ids already acknowledged as notarized
+        node.on_notarized.append(self.block_notarized)
+        node.on_finalized.append(self.blocks_finalized)
+        node.on_chain_replaced.append(self.blocks_finalized)  # Acknowledges watched transactions of the new chain
+
+    def handle_request(self, session, request):
+        """
+        Handles one request and returns the reply.
+
+        :param session: ClientSession - The session the request arrived on.
+        :param request: dict - The decoded request.
+        :return: dict - The reply.
+        """
+        request_id = request.get('id')
+        op = request.get('op')
+        if op == 'ping':
+            return {'id': request_id, 'status': 'ok', 'epoch': self.node.current_epoch}
+        if op == 'status':
+            with self.node.lock:
+                entry = self.node.tx_index.lookup(request.get('tx_id'))
+                return {'id': request_id, 'status': 'ok', 'tx_id': request.get('tx_id'),
+                        **(entry or {'state': 'unknown'})}
+        if op == 'balance':
+            with self.node.lock:
+                return {'id': request_id, 'status': 'ok', 'account': request.get('account'),
+                        'balance': self.node.ledger.balance(request.get('account')), 'height': self.node.ledger.height}
+        if op == 'history':
+            with self.node.lock:
+                entries = self.node.ledger.account_history(request.get('account'), request.get('from_epoch'),
+                                                           request.get('to_epoch'))
+                return {'id': request_id, 'status': 'ok', 'account': request.get('account'),
+                        'history': [dict(zip(('epoch', 'tx_id', 'counterparty', 'delta'), entry)) for entry in entries],
+                        'height': self.node.ledger.height}
+        if op != 'submit':
+            return {'id': request_id, 'error': f"unknown op: {op}"}
+
+        transactions = []
+        try:
+            for data in request.get('transactions', []):
+                tx_id = self.node.get_next_tx_id()
+                transactions.append(Transaction(tx_id, data['sender'], data['receiver'], data['amount'],
+                                                data.get('payload', "")))
+        except (KeyError, TypeError) as e:
+            return {'id': request_id, 'error': f"invalid transaction: {e}"}
+
+        with self.lock:
+            for transaction in transactions:
+                self.watchers[transaction.tx_id] = session
+        self.submit(transactions)
+        return {'id': request_id, 'status': 'accepted', 'tx_ids': [tx.tx_id for tx in transactions]}
+
+    def submit(self, transactions):
+        """
+        Adds the transactions to the node's pool and echoes them to the other nodes (or to its next batch, with batching).
+
+        They stay pending on every node until a block holding them is notarized, so they are
+        acknowledged even when they reach the next leader after it proposed.
+        """
+        epoch = self.node.current_epoch
+        self.node.metrics.inc("client_transactions_submitted", len(transactions))
+        if self.node.batch_store is not None:
+            self.node.batch_store.add_local(transactions, epoch)
+            return
+        for transaction in transactions:
+            self.node.add_transaction(transaction, epoch)
+
+        def echo_all():
+            for transaction in transactions:
+                self.node.broadcast_message(Message.create_echo_transaction_message(transaction, epoch, self.node.node_id))
+        self.node.run_async(echo_all)
+
+    def block_notarized(self, block):
+        """Node listener: acknowledges the notarization of watched transactions (called under the node's lock)."""
+        block_hash = block.hash.hex()
+        with self.lock:
+            for tx_id in block.transactions:
+                session = self.watchers.get(tx_id)
+                if session is not None and tx_id not in self.notarized:
+                    self.notarized.add(tx_id)
+                    session.send({'event': 'notarized', 'tx_id': tx_id, 'epoch': block.epoch, 'block': block_hash})
+
+    def blocks_finalized(self, blocks):
+        """Node listener: acknowledges the finalization of watched transactions (called under the node's lock)."""
+        with self.lock:
+            for block in blocks:
+                block_hash = None
+                for tx_id in block.transactions:
+                    session = self.watchers.pop(tx_id, None)
+                    if session is None:
+                        continue
+                    block_hash = block_hash or block.hash.hex()
+                    if tx_id not in self.notarized:
+                        session.send({'event': 'notarized', 'tx_id': tx_id, 'epoch': block.epoch, 'block': block_hash})
+                    self.notarized.discard(tx_id)
+                    session.send({'event': 'finalized', 'tx_id': tx_id, 'epoch': block.epoch, 'block': block_hash})
+
+    def forget(self, session):
+        """Stops tracking the transactions of a closed session."""
+        with self.lock:
+            for tx_id in [tx_id for tx_id, watcher in self.watchers.items() if watcher is session]:
+                del self.watchers[tx_id]
+                self.notarized.discard(tx_id)
+
+    def serve(self, sock):
+        """Accepts client connections forever, one thread per session."""
+        while True:
+            connection, _ = sock.accept()
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=ClientSession(self, connection).run, daemon=True).start()
+
+    def start(self):
+        """Starts listening in a daemon thread."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(self.address)
+        sock.listen()
+        threading.Thread(target=self.serve, args=(sock,), daemon=True).start()
+
+
+class ClientConnection:
+    """
+    Client side of the client API: pipelines submissions over one connection and reads events.
+    """
+
+    def __init__(self, host, port):
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('r', encoding='utf-8')
+        self.request_ids = itertools.count(1)
+        self.send_lock = threading.Lock()
+
+    def submit(self, transactions):
+        """
+        Sends a batch of transactions without waiting for the reply.
+
+        :param transactions: list - Dictionaries with `sender`, `receiver`, `amount` and optionally `payload`.
+        :return: int - The request ID echoed in the reply.
+        """
+        request_id = next(self.request_ids)
+        line = json.dumps({'id': request_id, 'op': 'submit', 'transactions': transactions}) + "\n"
+        with self.send_lock:
+            self.sock.sendall(line.encode('utf-8'))
+        return request_id
+
+    def read(self):
+        """
+        Reads the next reply or event (blocking).
+
+        :return: dict - The decoded line, or None once the node closes the connection.
+        """
+        line = self.reader.readline()
+        return json.loads(line) if line else None
+
+    def close(self):
+        """Closes the connection."""
+        self.sock.close()
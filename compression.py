@@ -0,0 +1,193 @@
+import lzma
+import time
+import zlib
+
+from block import Block
+from certificate import NotarizationCertificate
+from logger import get_logger
+from message import CODEC_OFFSET, HEADER, Message
+from transaction import Transaction
+
+log = get_logger("compression")
+
+NONE, ZLIB, LZMA, ZDICT = 0, 1, 2, 3  # Codec of a message body (bit `codec` of the accepted-codecs mask)
+CODECS = {'zlib': ZLIB, 'lzma': LZMA, 'zdict': ZDICT}
+CODEC_NAMES = {codec: name for name, codec in CODECS.items()}
+
+ZLIB_LEVEL = 6
+LZMA_PRESET = 1  # Faster presets barely change the ratio on JSON blocks
+MAX_BODY_SIZE = 64 * 1024 * 1024  # Larger decompressed bodies are rejected
+
+
+def build_dictionary():
+    """
+    Builds the preset dictionary of the zdict codec from messages in the block format.
+
+    Key names, `ClientNN` accounts and the JSON structure of proposals and sync responses are
+    then already known to the decompressor, which pays off most on small and medium bodies.
+    The dictionary is derived from the code, so every node builds the same one.
+
+    :return: bytes - The dictionary (at most 32 KB, the zlib window).
+    """
+    transactions = {
+        tx_id: Transaction(tx_id, f"Client{tx_id % 100 + 1}", f"Client{(tx_id * 7) % 100 + 1}", tx_id * 13 % 1000 + 1)
+        for tx_id in range(1, 101)
+    }
+    block = Block(1, bytes(20), transactions)
+    samples = [
+        Message.create_response_missing_blocks_message([block], 0, [NotarizationCertificate(block.hash, 1)]),
+        Message.create_propose_message(block, 0),  # Most frequent last: zlib prefers the end of the dictionary
+    ]
+    return b"".join(message.serialize()[HEADER.size:] for message in samples)[-32768:]
+
+
+DICTIONARY = build_dictionary()
+
+
+def compress(body, codec):
+    """
+    Compresses a message body.
+
+    :param body: bytes - The JSON body.
+    :param codec: int - ZLIB, LZMA or ZDICT.
+    :return: bytes - The compressed body.
+    """
+    if codec == ZLIB:
+        return zlib.compress(body, ZLIB_LEVEL)
+    if codec == LZMA:
+        return lzma.compress(body, format=lzma.FORMAT_RAW, filters=[{'id': lzma.FILTER_LZMA2, 'preset': LZMA_PRESET}])
+    if codec == ZDICT:
+        compressor = zlib.compressobj(ZLIB_LEVEL, zdict=DICTIONARY)
+        return compressor.compress(body) + compressor.flush()
+    raise ValueError(f"Unknown codec {codec}")
+
+
+def decompress(body, codec):
+    """
+    Decompresses a message body.
+
+    :param body: bytes - The compressed body.
+    :param codec: int - ZLIB, LZMA or ZDICT.
+    :return: bytes - The JSON body.
+    :raises ValueError: If the body is invalid or decompresses to more than MAX_BODY_SIZE.
+    """
+    try:
+        if codec in (ZLIB, ZDICT):
+            decompressor = zlib.decompressobj(zdict=DICTIONARY) if codec == ZDICT else zlib.decompressobj()
+            data = decompressor.decompress(body, MAX_BODY_SIZE)
+            truncated = bool(decompressor.unconsumed_tail)
+        elif codec == LZMA:
+            decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_RAW, filters=[{'id': lzma.FILTER_LZMA2, 'preset': LZMA_PRESET}])
+            data = decompressor.decompress(body, MAX_BODY_SIZE)
+            truncated = not decompressor.eof and not decompressor.needs_input
+        else:
+            raise ValueError(f"Unknown codec {codec}")
+    except (zlib.error, lzma.LZMAError) as e:
+        raise ValueError(f"Invalid compressed body: {e}")
+    if truncated:
+        raise ValueError("Compressed body too large")
+    return data
+
+
+class Compressor:
+    """
+    Compresses the bodies of outgoing messages and decompresses incoming ones.
+
+    Codecs are negotiated per peer without extra messages: every message carries, in its
+    header, the mask of the codecs its sender accepts. A node compresses a message for a peer
+    with its most preferred codec that the peer accepts, once the body reaches the size
+    threshold, and sends it uncompressed until it has heard from the peer. The header itself is
+    never compressed, so stale messages are still dropped before any decompression.
+    """
+
+    def __init__(self, node, codecs=(), threshold=4096):
+        """
+        :param node: Node - The node (for its ports and metrics).
+        :param codecs: list - Names of the enabled codecs, most preferred first (none: compression disabled).
+        :param threshold: int - Minimum body size, in bytes, for a message to be compressed.
+        :raises ValueError: If a codec name is unknown.
+        """
+        unknown = [name for name in codecs if name not in CODECS]
+        if unknown:
+            raise ValueError(f"Unknown compression codecs {unknown} (expected {', '.join(CODECS)})")
+        self.node = node
+        self.preferred = [CODECS[name] for name in codecs]
+        self.accepts = sum(1 << codec for codec in self.preferred)  # Mask advertised to the peers
+        self.threshold = threshold
+        self.peer_accepts = {}  # Maps a peer's port to the mask of the codecs it accepts
+
+    def peer_port(self, sender):
+        """Returns the port of a message's sender (a node ID, or a port for QUERY_MISSING_BLOCKS)."""
+        if sender is None:
+            return None
+        return self.node.ports[sender] if 0 <= sender < len(self.node.ports) else sender
+
+    def codec_for(self, target_port):
+        """Returns the codec to use for a peer (NONE until the peer has advertised a common codec)."""
+        accepts = self.peer_accepts.get(target_port, 0)
+        for codec in self.preferred:
+            if accepts >> codec & 1:
+                return codec
+        return NONE
+
+    def with_codec(self, data, codec, body):
+        """Returns the message `data` with its header marked with `codec` and the given body."""
+        return data[:CODEC_OFFSET] + bytes((codec, self.accepts)) + data[CODEC_OFFSET + 2:HEADER.size] + body
+
+    def encode(self, data, target_port, encoded=None):
+        """
+        Prepares a serialized message for a peer.
+
+        :param data: bytes - The serialized (uncompressed) message.
+        :param target_port: int - The port of the peer.
+        :param encoded: dict, optional - Encodings already made for this message, by codec (shared within a broadcast).
+        :return: bytes - The message to send.
+        """
+        body_size = len(data) - HEADER.size
+        codec = self.codec_for(target_port) if body_size >= self.threshold else NONE
+        if encoded is not None and codec in encoded:
+            return encoded[codec]
+
+        if codec == NONE:
+            result = self.with_codec(data, NONE, data[HEADER.size:])
+        else:
+            started = time.thread_time()
+            body = compress(data[HEADER.size:], codec)
+            name = CODEC_NAMES[codec]
+            self.node.metrics.inc("compression_cpu_seconds", time.thread_time() - started, codec=name)
+            self.node.metrics.observe("compression_ratio", len(body) / body_size,
+                                      buckets=(0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.8, 1.0), codec=name)
+            if len(body) < body_size:
+                self.node.metrics.inc("compression_bytes_saved", body_size - len(body), codec=name)
+                result = self.with_codec(data, codec, body)
+            else:
+                result = self.with_codec(data, NONE, data[HEADER.size:])
+        if encoded is not None:
+            encoded[codec] = result
+        return result
+
+    def decode(self, data):
+        """
+        Learns the codecs accepted by the sender of a received message and decompresses its body.
+
+        :param data: bytes - The received message.
+        :return: bytes - The message with an uncompressed body, or None if it cannot be decompressed.
+        """
+        header = Message.peek(data)
+        if header is None:
+            return data  # Let the decoder report the invalid message
+        port = self.peer_port(header.sender)
+        if port is not None:
+            self.peer_accepts[port] = header.accepts
+        if header.codec == NONE:
+            return data
+
+        started = time.thread_time()
+        try:
+            body = decompress(data[HEADER.size:], header.codec)
+        except ValueError as e:
+            log.warning("Could not decompress %s from %s: %s", header.type, header.sender, e)
+            return None
+        self.node.metrics.inc("decompression_cpu_seconds", time.thread_time() - started,
+                              codec=CODEC_NAMES.get(header.codec, str(header.codec)))
+        return data[:CODEC_OFFSET] + bytes((NONE, header.accepts)) + data[CODEC_OFFSET + 2:HEADER.size] + body
@@ -3,10 +3,10 @@ import re
 
 def delete_blockchain_files():
     """
-    Deletes all blockchain_[i].json files in the current directory.
+    Deletes all blockchain_[i].json, checkpoint_[i].json and batches_[i].jsonl files in the current directory.
     """
     # Define the pattern for the files to delete
-    pattern = re.compile(r"blockchain_\d+\.json")
+    pattern = re.compile(r"(blockchain|checkpoint)_\d+\.json$|batches_\d+\.jsonl$")
 
     # Get all files in the current directory
     files = os.listdir()
@@ -23,7 +23,7 @@ def delete_blockchain_files():
             print(f"Failed to delete {file}: {e}")
 
     if not blockchain_files:
-        print("No blockchain_[i].json files found.")
+        print("No blockchain_[i].json, checkpoint_[i].json or batches_[i].jsonl files found.")
 
 if __name__ == "__main__":
     delete_blockchain_files()
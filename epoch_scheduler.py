@@ -0,0 +1,148 @@
+import asyncio
+import math
+import time
+
+
+class EpochScheduler:
+    """
+    Schedules epochs at absolute boundaries anchored to a start instant shared by all nodes.
+
+    Every boundary is computed from the start instant instead of chaining sleeps, so the
+    time a node spends working inside an epoch is never added to the next one and nodes
+    stay aligned for the whole run. The wall-clock start instant is converted once to the
+    monotonic clock, which is immune to system clock adjustments during the run.
+    """
+
+    def __init__(self, start_timestamp, epoch_duration, first_epoch=1):
+        """
+        Initializes the scheduler.
+
+        :param start_timestamp: float - Wall-clock (UNIX) time at which `first_epoch` begins.
+        :param epoch_duration: float - Duration of each epoch in seconds (sub-second values are allowed).
+        :param first_epoch: int - The epoch that begins exactly at `start_timestamp`.
+        """
+        self.epoch_duration = float(epoch_duration)
+        self.first_epoch = first_epoch
+        self.start_monotonic = time.monotonic() + (start_timestamp - time.time())  # Anchor on the monotonic clock
+        self.overruns = {}  # Maps an epoch to the seconds its work ran past the epoch's end
+        self.early_starts = {}  # Maps an epoch to the seconds it started ahead of its timeout
+        self.last_start = None  # Instant the last epoch began (its deadline, unless it started early)
+
+    def epoch_start(self, epoch):
+        """
+        Returns the monotonic instant at which the given epoch begins.
+
+        :param epoch: int - The epoch number.
+        :return: float - The boundary as a `time.monotonic()` value.
+        """
+        return self.start_monotonic + (epoch - self.first_epoch) * self.epoch_duration
+
+    def epoch_at(self, instant=None):
+        """
+        Returns the epoch in progress at the given monotonic instant.
+
+        :param instant: float, optional - A `time.monotonic()` value; defaults to now.
+        :return: int - The epoch number, or `first_epoch - 1` before the start instant.
+        """
+        if instant is None:
+            instant = time.monotonic()
+        if instant < self.start_monotonic:
+            return self.first_epoch - 1
+        return self.first_epoch + int((instant - self.start_monotonic) // self.epoch_duration)
+
+    def time_until(self, epoch):
+        """
+        Returns the seconds left until the given epoch begins (negative once it has begun).
+
+        :param epoch: int - The epoch number.
+        :return: float - Seconds until the boundary.
+        """
+        return self.epoch_start(epoch) - time.monotonic()
+
+    def deadline(self, epoch):
+        """
+        Returns the monotonic instant at which the given epoch begins at the latest.
+
+        That is its boundary, unless early starts moved the node ahead of the schedule: then
+        it is the first boundary at least one epoch after the previous epoch began. Either
+        way it is a boundary of the shared schedule, so nodes that ran ahead by different
+        amounts still time out together.
+
+        :param epoch: int - The epoch number.
+        :return: float - The deadline as a `time.monotonic()` value.
+        """
+        boundary = self.epoch_start(epoch)
+        if self.last_start is None:
+            return boundary
+        periods = math.ceil((self.last_start - self.start_monotonic) / self.epoch_duration - 1e-9) + 1
+        return min(boundary, self.start_monotonic + periods * self.epoch_duration)
+
+    def started(self, epoch, deadline, early):
+        """
+        Records how the epoch began and returns the overrun of the previous one.
+
+        :param epoch: int - The epoch that begins now.
+        :param deadline: float - The epoch's deadline (see `deadline`).
+        :param early: bool - The early event started the epoch before its deadline.
+        :return: float - Seconds by which the deadline was missed (0.0 when on time or early).
+        """
+        now = time.monotonic()
+        if early:
+            self.early_starts[epoch] = max(deadline - now, 0.0)
+            self.last_start = now
+            return 0.0
+        self.last_start = deadline
+        if now <= deadline:
+            return 0.0
+        if epoch > self.first_epoch:
+            self.overruns[epoch - 1] = now - deadline
+        return now - deadline
+
+    def wait_for_epoch(self, epoch, early_event=None):
+        """
+        Sleeps until the given epoch begins.
+
+        If the deadline has already passed, the previous epoch's work overran its window;
+        the overrun is recorded and the method returns immediately instead of sleeping.
+        When `early_event` is given and gets set before the deadline, the epoch starts
+        right away; the schedule keeps its anchor (see `deadline`).
+
+        :param epoch: int - The epoch to wait for.
+        :param early_event: threading.Event, optional - Event that allows the epoch to start early.
+        :return: float - Seconds by which the boundary was missed (0.0 when on time or early).
+        """
+        deadline = self.deadline(epoch)
+        remaining = deadline - time.monotonic()
+
+        # Sleep in a loop since time.sleep may wake up slightly early
+        while remaining > 0:
+            if early_event is None:
+                time.sleep(remaining)
+            elif early_event.wait(remaining):
+                return self.started(epoch, deadline, True)
+            remaining = deadline - time.monotonic()
+        return self.started(epoch, deadline, False)
+
+    async def wait_for_epoch_async(self, epoch, early_event=None):
+        """
+        Asynchronous version of `wait_for_epoch` for the asyncio runtime.
+
+        :param epoch: int - The epoch to wait for.
+        :param early_event: asyncio.Event, optional - Event that allows the epoch to start early.
+        :return: float - Seconds by which the boundary was missed (0.0 when on time or early).
+        """
+        deadline = self.deadline(epoch)
+        remaining = deadline - time.monotonic()
+
+        # Sleep in a loop since the event loop's timers may fire slightly early
+        while remaining > 0:
+            if early_event is None:
+                await asyncio.sleep(remaining)
+            else:
+                try:
+                    await asyncio.wait_for(early_event.wait(), remaining)
+                    return self.started(epoch, deadline, True)
+                except asyncio.TimeoutError:
+                    pass
+            remaining = deadline - time.monotonic()
+        return self.started(epoch, deadline, False)
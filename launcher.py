@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import select
+import socket
+import subprocess
+import sys
+import time
+
+
+class ClusterLauncher:
+    """
+    Starts one node_script.py process per node of a network configuration and coordinates the start.
+
+    Each node connects back to the launcher's control socket once it is listening. When every
+    node is ready (the readiness barrier), the launcher hands all of them the same start
+    instant, a short lead time in the future, with sub-second precision. It then waits for the
+    nodes to finish and collects their final report (chain and metrics) and exit status.
+    """
+
+    def __init__(self, config_file, lead_time=0.5, ready_timeout=30.0, log_dir="."):
+        """
+        :param config_file: str - Path of the network configuration file.
+        :param lead_time: float - Seconds between the barrier and the shared start instant.
+        :param ready_timeout: float - Seconds to wait for every node to report that it is listening.
+        :param log_dir: str - Directory for the nodes' output files (node_<id>.log).
+        """
+        self.config_file = config_file
+        with open(config_file, 'r') as f:
+            self.config = json.load(f)
+        self.lead_time = lead_time
+        self.ready_timeout = ready_timeout
+        self.log_dir = log_dir
+        self.processes = {}  # Maps a node ID to its process
+        self.connections = {}  # Maps a node ID to its control connection
+        self.reports = {}  # Maps a node ID to its final report
+
+    def spawn_nodes(self, control_port):
+        """Starts every node process, pointing it at the control socket."""
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "node_script.py")
+        os.makedirs(self.log_dir, exist_ok=True)
+        for node_id, port in enumerate(self.config["ports"][:self.config["num_nodes"]]):
+            log_file = open(os.path.join(self.log_dir, f"node_{node_id}.log"), 'w')
+            self.processes[node_id] = subprocess.Popen(
+                [sys.executable, script, str(node_id), str(port), "False", self.config_file,
+                 "--control-port", str(control_port)],
+                stdout=log_file, stderr=subprocess.STDOUT
+            )
+            log_file.close()  # The child process keeps its own handle
+
+    def wait_until_ready(self, server):
+        """
+        Accepts one control connection per node until all of them report that they are listening.
+
+        :raises RuntimeError: If a node exits or the timeout expires before every node is ready.
+        """
+        deadline = time.monotonic() + self.ready_timeout
+        pending = {}  # Connections whose readiness line has not arrived yet
+        while len(self.connections) < len(self.processes):
+            for node_id, process in self.processes.items():
+                if process.poll() is not None and node_id not in self.connections:
+                    raise RuntimeError(f"Node {node_id} exited with status {process.returncode} before it was ready")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                missing = sorted(set(self.processes) - set(self.connections))
+                raise RuntimeError(f"Nodes {missing} were not ready after {self.ready_timeout} seconds")
+
+            readable, _, _ = select.select([server] + list(pending), [], [], min(remaining, 0.1))
+            for ready in readable:
+                if ready is server:
+                    connection, _ = server.accept()
+                    pending[connection] = connection.makefile('r')
+                    continue
+                line = pending[ready].readline()
+                if line:
+                    message = json.loads(line)
+                    if message.get('status') == 'listening':
+                        self.connections[message['node_id']] = (ready, pending[ready])
+                        print(f"Node {message['node_id']} is listening on port {message['port']}")
+                del pending[ready]
+
+    def release(self):
+        """Sends the same start instant to every node and returns it."""
+        start_at = time.time() + self.lead_time
+        reply = (json.dumps({'start_at': start_at}) + "\n").encode('utf-8')
+        for connection, _ in self.connections.values():
+            connection.sendall(reply)
+        return start_at
+
+    def collect(self, timeout):
+        """
+        Reads every node's final report and waits for the processes to exit.
+
+        :param timeout: float - Seconds to wait for the nodes to finish.
+        """
+        deadline = time.monotonic() + timeout
+        for node_id, (connection, reader) in self.connections.items():
+            connection.settimeout(max(deadline - time.monotonic(), 0.1))
+            try:
+                line = reader.readline()
+                if line:
+                    self.reports[node_id] = json.loads(line)
+            except (socket.timeout, OSError, json.JSONDecodeError):
+                pass
+            finally:
+                connection.close()
+
+        for node_id, process in self.processes.items():
+            try:
+                process.wait(timeout=max(deadline - time.monotonic(), 0.1))
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+    def terminate(self):
+        """Kills every node process that is still running."""
+        for process in self.processes.values():
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
+    def run(self):
+        """
+        Launches the cluster, runs it to completion and returns a summary.
+
+        :return: dict - Start instant, exit status, finalized height and metrics of each node.
+        """
+        run_time = self.config["total_epochs"] * 2 * self.config["delta"]
+        launched_at = time.monotonic()
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+            server.bind(('localhost', 0))
+            server.listen()
+            try:
+                self.spawn_nodes(server.getsockname()[1])
+                self.wait_until_ready(server)
+                ready_after = time.monotonic() - launched_at
+                start_at = self.release()
+                print(f"All {len(self.processes)} nodes ready after {ready_after:.2f}s; "
+                      f"starting at {start_at:.6f} (in {self.lead_time}s)")
+                self.collect(self.lead_time + run_time + 30)
+            finally:
+                self.terminate()
+
+        hashes = [report['finalized_hashes'] for report in self.reports.values()]
+        shortest = min((len(chain) for chain in hashes), default=0)
+        return {
+            'start_at': start_at,
+            'ready_after': ready_after,
+            'consistent': all(chain[:shortest] == hashes[0][:shortest] for chain in hashes),
+            'nodes': {
+                node_id: {
+                    'exit_status': process.returncode,
+                    'finalized_height': self.reports.get(node_id, {}).get('finalized_height'),
+                    'overruns': self.reports.get(node_id, {}).get('overruns'),
+                    'metrics': self.reports.get(node_id, {}).get('metrics'),
+                }
+                for node_id, process in self.processes.items()
+            },
+        }
+
+
+def main():
+    """
+    Entry point of the cluster launcher.
+
+    Usage:
+        launcher.py <network_config_file> [--lead-time 0.5] [--ready-timeout 30] [--log-dir logs] [--report report.json]
+    """
+    parser = argparse.ArgumentParser(description="Start a local cluster with a readiness barrier.")
+    parser.add_argument("config", help="Network configuration file (start_time is not needed)")
+    parser.add_argument("--lead-time", type=float, default=0.5, help="Seconds between the barrier and the start")
+    parser.add_argument("--ready-timeout", type=float, default=30.0, help="Seconds to wait for every node")
+    parser.add_argument("--log-dir", default=".", help="Directory for the nodes' output files")
+    parser.add_argument("--report", default="launch_report.json", help="File for the run summary")
+    args = parser.parse_args()
+
+    launcher = ClusterLauncher(args.config, args.lead_time, args.ready_timeout, args.log_dir)
+    try:
+        summary = launcher.run()
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    with open(args.report, 'w') as f:
+        json.dump(summary, f, indent=4)
+
+    failed = False
+    for node_id, result in summary['nodes'].items():
+        print(f"Node {node_id}: exit status {result['exit_status']}, finalized height {result['finalized_height']}")
+        failed = failed or result['exit_status'] != 0
+    print(f"Finalized chains consistent: {summary['consistent']}. Report saved to {args.report}")
+    sys.exit(1 if failed or not summary['consistent'] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import hashlib
+
+
+class LeaderSchedule:
+    """
+    Deterministic leader schedule derived from a hash of the shared seed and the epoch number.
+
+    Every node computes the same leader for an epoch without touching the process-wide
+    `random` module. Leaders for a sliding window of upcoming epochs are cached, so a lookup
+    is O(1) and transactions can be routed to the nodes that will propose next.
+    """
+
+    def __init__(self, seed, total_nodes, window=32):
+        """
+        Initializes the leader schedule.
+
+        :param seed: str - The seed shared by all nodes.
+        :param total_nodes: int - Total number of nodes in the network.
+        :param window: int - Number of upcoming epochs to keep precomputed.
+        """
+        self.seed = seed
+        self.total_nodes = total_nodes
+        self.window = window
+        self.leaders = {}  # Maps an epoch to its leader
+
+    def compute_leader(self, epoch):
+        """
+        Computes the leader of an epoch from the hash of the seed and the epoch.
+
+        :param epoch: int - The epoch number.
+        :return: int - The ID of the leader node.
+        """
+        digest = hashlib.sha256(f"{self.seed}-{epoch}".encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'big') % self.total_nodes
+
+    def leader_for(self, epoch):
+        """
+        Returns the leader of an epoch, computing and caching it on a miss.
+
+        :param epoch: int - The epoch number.
+        :return: int - The ID of the leader node.
+        """
+        leader = self.leaders.get(epoch)
+        if leader is None:
+            leader = self.compute_leader(epoch)
+            self.leaders[epoch] = leader
+        return leader
+
+    def precompute(self, from_epoch):
+        """
+        Fills the window of leaders starting at `from_epoch` and evicts leaders of earlier epochs.
+
+        Other threads look leaders up (and cache misses) concurrently, so the cache is never
+        iterated in place: the window is built into a new dictionary that replaces it. A miss
+        cached meanwhile in the old dictionary is only computed again.
+
+        :param from_epoch: int - The first epoch of the window (usually the current epoch).
+        """
+        leaders = {epoch: leader for epoch, leader in list(self.leaders.items()) if epoch >= from_epoch}
+        for epoch in range(from_epoch, from_epoch + self.window):
+            if epoch not in leaders:
+                leaders[epoch] = self.compute_leader(epoch)
+        self.leaders = leaders
+
+    def upcoming_leaders(self, from_epoch, count=None):
+        """
+        Returns the leaders of the epochs following `from_epoch`, in order.
+
+        :param from_epoch: int - The epoch after which the upcoming epochs start.
+        :param count: int, optional - Number of epochs to return; defaults to the window size.
+        :return: list - A list of (epoch, leader_id) tuples.
+        """
+        count = self.window if count is None else count
+        return [(epoch, self.leader_for(epoch)) for epoch in range(from_epoch + 1, from_epoch + 1 + count)]
@@ -0,0 +1,134 @@
+import bisect
+
+
+class LedgerState:
+    """
+    Account balances and per-account history materialized from the finalized chain.
+
+    Blocks are applied incrementally as the chain is extended, so a balance is a dictionary
+    lookup and a history range query is a binary search over the account's entries, without
+    replaying the chain. The state records the last applied block, so a checkpoint can be
+    checked against the chain it was taken from.
+    """
+
+    def __init__(self):
+        self.balances = {}  # Maps an account to its balance
+        self.history = {}  # Maps an account to its entries [epoch, tx_id, counterparty, delta], in chain order
+        self.history_epochs = {}  # Maps an account to the epochs of its entries (kept for bisect)
+        self.height = 0  # Number of applied blocks
+        self.last_hash = None  # Hash (hex) of the last applied block
+
+    def record(self, account, epoch, tx_id, counterparty, delta):
+        """Applies one side of a transfer to an account."""
+        self.balances[account] = self.balances.get(account, 0) + delta
+        self.history.setdefault(account, []).append([epoch, tx_id, counterparty, delta])
+        self.history_epochs.setdefault(account, []).append(epoch)
+
+    def apply_block(self, block):
+        """
+        Applies the transactions of a newly finalized block.
+
+        :param block: Block - The block appended to the finalized chain.
+        """
+        for tx_id, tx in block.transactions.items():
+            self.record(tx.sender, block.epoch, tx_id, tx.receiver, -tx.amount)
+            self.record(tx.receiver, block.epoch, tx_id, tx.sender, tx.amount)
+        self.height += 1
+        self.last_hash = block.hash.hex()
+
+    def apply_blocks(self, blocks):
+        """Applies blocks in chain order."""
+        for block in blocks:
+            self.apply_block(block)
+
+    def balance(self, account):
+        """
+        Returns the balance of an account (0 for unknown accounts).
+
+        :param account: str - The account name.
+        :return: int/float - The balance.
+        """
+        return self.balances.get(account, 0)
+
+    def account_history(self, account, from_epoch=None, to_epoch=None):
+        """
+        Returns the entries of an account within an epoch range.
+
+        :param account: str - The account name.
+        :param from_epoch: int, optional - First epoch included.
+        :param to_epoch: int, optional - Last epoch included.
+        :return: list - Entries [epoch, tx_id, counterparty, delta] in chain order.
+        """
+        entries = self.history.get(account, [])
+        epochs = self.history_epochs.get(account, [])
+        start = bisect.bisect_left(epochs, from_epoch) if from_epoch is not None else 0
+        end = bisect.bisect_right(epochs, to_epoch) if to_epoch is not None else len(entries)
+        return entries[start:end]
+
+    def to_dict(self):
+        """
+        Serializes the ledger state for a checkpoint.
+
+        :return: dict - Height, last applied block hash, balances and history.
+        """
+        return LedgerState.snapshot_to_dict(self.snapshot())
+
+    def snapshot(self):
+        """
+        Takes a snapshot of the state that stays valid while blocks keep being applied.
+
+        The history lists are only ever appended to, so the snapshot shares them with their
+        current lengths instead of copying the entries: it costs one step per account, and
+        `snapshot_to_dict` can then run without holding the node's lock.
+
+        :return: dict - The snapshot.
+        """
+        return {
+            'height': self.height,
+            'last_hash': self.last_hash,
+            'balances': dict(self.balances),
+            'history': {account: (entries, len(entries)) for account, entries in self.history.items()},
+        }
+
+    @staticmethod
+    def snapshot_to_dict(snapshot):
+        """
+        Serializes a snapshot taken with `snapshot` (the same format as `to_dict`).
+
+        :param snapshot: dict - The snapshot.
+        :return: dict - Height, last applied block hash, balances and history.
+        """
+        return {
+            'height': snapshot['height'],
+            'last_hash': snapshot['last_hash'],
+            'balances': snapshot['balances'],
+            'history': {account: entries[:length] for account, (entries, length) in snapshot['history'].items()},
+        }
+
+    @staticmethod
+    def from_dict(data):
+        """
+        Restores a ledger state from a checkpoint.
+
+        :param data: dict - A dictionary produced by `to_dict`.
+        :return: LedgerState - The restored state.
+        """
+        ledger = LedgerState()
+        ledger.height = data['height']
+        ledger.last_hash = data['last_hash']
+        ledger.balances = dict(data['balances'])
+        ledger.history = {account: list(entries) for account, entries in data['history'].items()}
+        ledger.history_epochs = {account: [entry[0] for entry in entries] for account, entries in ledger.history.items()}
+        return ledger
+
+    @staticmethod
+    def rebuild(blocks):
+        """
+        Builds the ledger state of a chain from scratch (used when the chain is replaced).
+
+        :param blocks: list - The finalized chain.
+        :return: LedgerState - The state after applying every block.
+        """
+        ledger = LedgerState()
+        ledger.apply_blocks(blocks)
+        return ledger
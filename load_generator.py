@@ -0,0 +1,351 @@
+import argparse
+import bisect
+import itertools
+import json
+import math
+import random
+import sys
+import threading
+import time
+
+from client_api import ClientConnection
+
+
+def percentile(values, q):
+    """
+    Returns the q-th percentile (0-100) of the values, by nearest rank.
+
+    :param values: list - Sorted values.
+    :param q: float - The percentile.
+    :return: float - The percentile, or None if there are no values.
+    """
+    if not values:
+        return None
+    rank = max(math.ceil(q * len(values) / 100) - 1, 0)  # The smallest value with at least q% of the values at or below it
+    return values[min(rank, len(values) - 1)]
+
+
+def latency_summary(latencies):
+    """Summarizes latencies in seconds as count, mean and percentiles."""
+    values = sorted(latencies)
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values) if values else None,
+        'p50': percentile(values, 50),
+        'p90': percentile(values, 90),
+        'p99': percentile(values, 99),
+        'max': values[-1] if values else None,
+    }
+
+
+def account_sampler(rng, accounts, distribution="uniform", exponent=1.1):
+    """
+    Returns a function that draws account names from the given distribution.
+
+    :param rng: random.Random - The random number generator.
+    :param accounts: int - Number of distinct accounts.
+    :param distribution: str - `uniform`, or `zipf` (a few hot accounts take most of the load).
+    :param exponent: float - Exponent of the zipf distribution.
+    :return: function - Draws one account name per call.
+    """
+    if distribution == "uniform":
+        return lambda: f"Client{rng.randint(1, accounts)}"
+    if distribution != "zipf":
+        raise ValueError(f"Unknown distribution: {distribution}")
+
+    cumulative = list(itertools.accumulate(1 / rank ** exponent for rank in range(1, accounts + 1)))
+    total = cumulative[-1]
+    return lambda: f"Client{bisect.bisect_left(cumulative, rng.random() * total) + 1}"
+
+
+def make_payload(rng, size):
+    """Returns a random hex payload of `size` characters (empty for size 0)."""
+    return f"{rng.getrandbits(4 * size):0{size}x}" if size > 0 else ""
+
+
+def synthetic_workload(rate, duration, accounts=100, sender_distribution="uniform", receiver_distribution="uniform",
+                       zipf_exponent=1.1, tx_size=0, arrivals="poisson", burst_every=0, burst_length=1.0,
+                       burst_factor=5.0, seed=0):
+    """
+    Generates an open-loop workload: transactions and the offsets at which they are due.
+
+    Arrival times are drawn in advance from the target rate, independently of how fast the
+    cluster answers, so a saturated cluster shows up as growing latency instead of a lower
+    offered load.
+
+    :param rate: float - Target transactions per second.
+    :param duration: float - Seconds of load.
+    :param accounts: int - Number of distinct sender/receiver accounts.
+    :param sender_distribution: str - `uniform` or `zipf`.
+    :param receiver_distribution: str - `uniform` or `zipf`.
+    :param zipf_exponent: float - Exponent of the zipf distributions.
+    :param tx_size: int - Size in characters of the random payload of each transaction.
+    :param arrivals: str - `poisson` (exponential gaps) or `constant` (evenly spaced).
+    :param burst_every: float - Seconds between the starts of bursts (0 disables bursts).
+    :param burst_length: float - Seconds each burst lasts.
+    :param burst_factor: float - Rate multiplier during a burst.
+    :param seed: int - Seed of the workload's random number generator.
+    :return: generator - Yields (offset in seconds, transaction dict) in offset order.
+    """
+    rng = random.Random(seed)
+    sender = account_sampler(rng, accounts, sender_distribution, zipf_exponent)
+    receiver = account_sampler(rng, accounts, receiver_distribution, zipf_exponent)
+    offset = 0.0
+    while True:
+        current_rate = rate
+        if burst_every > 0 and offset % burst_every < burst_length:
+            current_rate = rate * burst_factor
+        offset += rng.expovariate(current_rate) if arrivals == "poisson" else 1 / current_rate
+        if offset >= duration:
+            return
+        yield offset, {
+            'sender': sender(),
+            'receiver': receiver(),
+            'amount': rng.randint(1, 1000),
+            'payload': make_payload(rng, tx_size),
+        }
+
+
+def file_workload(file_name, rate=None):
+    """
+    Reads a workload from a JSON-lines file.
+
+    Each line holds `sender`, `receiver`, `amount` and optionally `payload` and `at` (offset in
+    seconds). Lines without `at` are spaced evenly at `rate` transactions per second (or all
+    sent at once if no rate is given).
+
+    :param file_name: str - Path of the workload file.
+    :param rate: float, optional - Rate for lines without an offset.
+    :return: generator - Yields (offset in seconds, transaction dict).
+    :raises ValueError: If a line is not a valid transaction.
+    """
+    with open(file_name, 'r') as f:
+        for number, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+                transaction = {'sender': data['sender'], 'receiver': data['receiver'], 'amount': data['amount']}
+            except (json.JSONDecodeError, KeyError, TypeError) as e:
+                raise ValueError(f"{file_name}:{number + 1}: invalid transaction ({e})")
+            if data.get('payload'):
+                transaction['payload'] = data['payload']
+            offset = data.get('at', number / rate if rate else 0.0)
+            yield offset, transaction
+
+
+class LoadGenerator:
+    """
+    Drives a workload against the client API of one or more nodes and measures commit latency.
+
+    Transactions due in the same batch window are submitted together, spread round-robin over
+    the target nodes, without waiting for replies. A reader thread per connection matches the
+    notarized and finalized acknowledgements with the submission time of each transaction.
+    Latency is measured from the time a batch was due, not from when it was sent, so a sender
+    that falls behind its schedule does not hide the wait from the results.
+    """
+
+    def __init__(self, targets, batch_interval=0.01):
+        """
+        :param targets: list - (host, port) of each node's client endpoint.
+        :param batch_interval: float - Seconds of due transactions grouped into one request.
+        """
+        self.targets = targets
+        self.batch_interval = batch_interval
+        self.lock = threading.Lock()
+        self.requests = {}  # Maps (connection index, request ID) to the scheduled submission time
+        self.submitted_at = {}  # Maps a tx_id to its scheduled submission time
+        self.early_events = {}  # Events that arrived before the reply assigning their tx_id
+        self.notarize_latencies = []
+        self.finalize_latencies = []
+        self.accepted = 0
+        self.errors = 0
+        self.last_finalized_at = None
+        self.all_finalized = threading.Event()
+        self.expected = None  # Number of transactions to wait for, known once sending ends
+
+    def record_event(self, event, submitted_at, received_at):
+        """Records the latency of one acknowledgement (called with `self.lock` held)."""
+        if event['event'] == 'notarized':
+            self.notarize_latencies.append(received_at - submitted_at)
+        elif event['event'] == 'finalized':
+            self.finalize_latencies.append(received_at - submitted_at)
+            self.last_finalized_at = received_at
+            if self.expected is not None and len(self.finalize_latencies) >= self.expected:
+                self.all_finalized.set()
+
+    def read_replies(self, index, connection):
+        """Reader thread: matches replies and events of one connection."""
+        while True:
+            try:
+                reply = connection.read()
+            except (OSError, ValueError):
+                reply = None
+            if reply is None:
+                return
+            received_at = time.monotonic()
+            with self.lock:
+                if 'event' in reply:
+                    submitted_at = self.submitted_at.get(reply['tx_id'])
+                    if submitted_at is None:
+                        self.early_events.setdefault(reply['tx_id'], []).append((reply, received_at))
+                    else:
+                        self.record_event(reply, submitted_at, received_at)
+                elif reply.get('status') == 'accepted':
+                    submitted_at = self.requests.pop((index, reply['id']))
+                    self.accepted += len(reply['tx_ids'])
+                    for tx_id in reply['tx_ids']:
+                        self.submitted_at[tx_id] = submitted_at
+                        for event, event_received_at in self.early_events.pop(tx_id, []):
+                            self.record_event(event, submitted_at, event_received_at)
+                else:
+                    self.requests.pop((index, reply.get('id')), None)
+                    self.errors += 1
+
+    def run(self, workload, drain=10.0):
+        """
+        Sends the workload on schedule and waits for its transactions to be finalized.
+
+        :param workload: iterable - (offset in seconds, transaction dict) pairs in offset order.
+        :param drain: float - Seconds to wait for outstanding acknowledgements after the last submission.
+        :return: dict - Offered load, achieved throughput and latency percentiles.
+        """
+        connections = [ClientConnection(host, port) for host, port in self.targets]
+        for index, connection in enumerate(connections):
+            threading.Thread(target=self.read_replies, args=(index, connection), daemon=True).start()
+
+        sent = 0
+        max_lag = 0.0
+        next_connection = itertools.cycle(range(len(connections)))
+        started = time.monotonic()
+        batch = []
+        batch_due = None
+        for offset, transaction in itertools.chain(workload, [(None, None)]):
+            if batch and (offset is None or offset >= batch_due + self.batch_interval):
+                # Send the batch at its due time, never waiting for earlier replies (open loop)
+                delay = started + batch_due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    max_lag = max(max_lag, -delay)
+                index = next(next_connection)
+                with self.lock:
+                    request_id = connections[index].submit(batch)
+                    self.requests[(index, request_id)] = started + batch_due  # Late sends count as latency
+                sent += len(batch)
+                batch = []
+            if offset is None:
+                break
+            if not batch:
+                batch_due = offset
+            batch.append(transaction)
+        sending_time = time.monotonic() - started
+
+        with self.lock:
+            self.expected = sent
+            if len(self.finalize_latencies) >= sent:
+                self.all_finalized.set()
+        self.all_finalized.wait(drain)
+        for connection in connections:
+            connection.close()
+
+        with self.lock:
+            elapsed = (self.last_finalized_at or time.monotonic()) - started
+            return {
+                'sent': sent,
+                'accepted': self.accepted,
+                'errors': self.errors,
+                'notarized': len(self.notarize_latencies),
+                'finalized': len(self.finalize_latencies),
+                'sending_seconds': sending_time,
+                'offered_tps': sent / sending_time if sending_time > 0 else None,
+                'throughput_tps': len(self.finalize_latencies) / elapsed if self.finalize_latencies else 0.0,
+                'max_send_lag_seconds': max_lag,
+                'notarize_latency_seconds': latency_summary(self.notarize_latencies),
+                'finalize_latency_seconds': latency_summary(self.finalize_latencies),
+            }
+
+
+def targets_from_config(config_file):
+    """Returns the client endpoints of every node of a network configuration."""
+    with open(config_file, 'r') as f:
+        config = json.load(f)
+    offset = config.get("client_port_offset")
+    if offset is None:
+        raise ValueError(f"{config_file} has no client_port_offset")
+    return [('localhost', port + offset) for port in config["ports"][:config["num_nodes"]]]
+
+
+def format_seconds(value):
+    """Formats a latency in milliseconds for the summary table."""
+    return f"{value * 1000:9.1f}" if value is not None else f"{'-':>9}"
+
+
+def main():
+    """
+    Entry point of the load generator.
+
+    Usage:
+        load_generator.py --config network_info.json --rate 50 100 200 --duration 10 [--distribution zipf] ...
+        load_generator.py --target localhost:6100 --workload transactions.jsonl
+    """
+    parser = argparse.ArgumentParser(description="Open-loop load generator for the client transaction API.")
+    parser.add_argument("--config", help="Network configuration (targets every node's client_port_offset)")
+    parser.add_argument("--target", nargs="+", default=[], help="Client endpoints as host:port")
+    parser.add_argument("--rate", type=float, nargs="+", default=[50.0],
+                        help="Target transactions per second; several rates run one step each (saturation sweep)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load per step")
+    parser.add_argument("--workload", help="JSON-lines workload file instead of synthetic transactions")
+    parser.add_argument("--accounts", type=int, default=100, help="Number of distinct accounts")
+    parser.add_argument("--sender-distribution", choices=["uniform", "zipf"], default="uniform")
+    parser.add_argument("--receiver-distribution", choices=["uniform", "zipf"], default="uniform")
+    parser.add_argument("--zipf-exponent", type=float, default=1.1)
+    parser.add_argument("--tx-size", type=int, default=0, help="Payload size of each transaction in characters")
+    parser.add_argument("--arrivals", choices=["poisson", "constant"], default="poisson")
+    parser.add_argument("--burst-every", type=float, default=0, help="Seconds between bursts (0 disables bursts)")
+    parser.add_argument("--burst-length", type=float, default=1.0, help="Seconds each burst lasts")
+    parser.add_argument("--burst-factor", type=float, default=5.0, help="Rate multiplier during a burst")
+    parser.add_argument("--batch-interval", type=float, default=0.01, help="Seconds of transactions per request")
+    parser.add_argument("--drain", type=float, default=10.0, help="Seconds to wait for outstanding acknowledgements")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="load_report.json", help="File for the results")
+    args = parser.parse_args()
+
+    targets = [(target.rsplit(':', 1)[0], int(target.rsplit(':', 1)[1])) for target in args.target]
+    if args.config:
+        targets += targets_from_config(args.config)
+    if not targets:
+        parser.error("give --config or --target")
+
+    results = []
+    for step, rate in enumerate(args.rate):
+        if args.workload:
+            workload = file_workload(args.workload, rate)
+        else:
+            workload = synthetic_workload(
+                rate, args.duration, args.accounts, args.sender_distribution, args.receiver_distribution,
+                args.zipf_exponent, args.tx_size, args.arrivals, args.burst_every, args.burst_length,
+                args.burst_factor, args.seed + step
+            )
+        try:
+            result = LoadGenerator(targets, args.batch_interval).run(workload, args.drain)
+        except OSError as e:
+            print(f"Error: cannot reach the client endpoints: {e}")
+            sys.exit(1)
+        result['target_tps'] = rate
+        results.append(result)
+
+        finalize = result['finalize_latency_seconds']
+        print(f"rate {rate:8.1f} tx/s: sent {result['sent']:6d}, finalized {result['finalized']:6d}, "
+              f"throughput {result['throughput_tps']:8.1f} tx/s, finalize latency ms "
+              f"p50 {format_seconds(finalize['p50'])} p90 {format_seconds(finalize['p90'])} "
+              f"p99 {format_seconds(finalize['p99'])}")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=4)
+    print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
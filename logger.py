@@ -0,0 +1,254 @@
+import atexit
+import collections
+import json
+import sys
+import threading
+import time
+
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+LEVELS = {name: level for level, name in LEVEL_NAMES.items()}
+
+MUTABLE_VIEWS = (type({}.keys()), type({}.values()), type({}.items()), set)
+
+
+def snapshot(values):
+    """
+    Copies the arguments that may change before the writer formats them, when the record is queued.
+
+    Dictionary views and sets (e.g. `block.transactions.keys()`) are copied into lists, so the
+    record shows them as they were when logged and the writer never iterates a live container.
+    """
+    if any(isinstance(value, MUTABLE_VIEWS) for value in values):
+        return tuple(list(value) if isinstance(value, MUTABLE_VIEWS) else value for value in values)
+    return values
+
+
+def render_argument(value):
+    """
+    Renders one deferred argument at emission time.
+
+    Bytes are rendered as hex (block hashes are passed as raw bytes so that no hex
+    encoding happens at the call site) and dictionary views and sets as lists.
+    """
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    if isinstance(value, MUTABLE_VIEWS + (frozenset,)):
+        return list(value)
+    return value
+
+
+def clock(timestamp):
+    """Renders a record's wall-clock time as HH:MM:SS.mmm."""
+    return time.strftime("%H:%M:%S", time.localtime(timestamp)) + f".{int(timestamp * 1000) % 1000:03d}"
+
+
+class LogWriter:
+    """
+    Background writer fed through a bounded ring buffer.
+
+    Logging a record only appends the unformatted record to the buffer; formatting and
+    I/O happen in the writer thread. When the buffer is full, the oldest records are
+    overwritten and counted as dropped, so logging never blocks the caller.
+    """
+
+    def __init__(self, stream=None, capacity=65536, json_format=False):
+        """
+        :param stream: file, optional - Output stream; defaults to the current sys.stdout.
+        :param capacity: int - Maximum number of records waiting to be written.
+        :param json_format: bool - Write one JSON object per record instead of text.
+        """
+        self.stream = stream
+        self.json_format = json_format
+        self.buffer = collections.deque(maxlen=capacity)
+        self.condition = threading.Condition(threading.Lock())
+        self.dropped = 0
+        self.write_lock = threading.Lock()  # Keeps batches in order when flush() races the writer thread
+        self.thread = threading.Thread(target=self.run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, record):
+        """Queues a record for writing."""
+        with self.condition:
+            if len(self.buffer) == self.buffer.maxlen:
+                self.dropped += 1
+            self.buffer.append(record)
+            self.condition.notify()
+
+    def format(self, record):
+        """
+        Formats a record; the message is only interpolated here, off the caller's thread.
+
+        A record that cannot be formatted (e.g. an argument whose `__str__` raises) is written
+        as a fallback line instead, so it never takes the rest of the batch down with it.
+        """
+        try:
+            return self.format_record(record)
+        except Exception as e:
+            timestamp, level, name, message = record[:4]
+            return f"{clock(timestamp)} {LEVEL_NAMES.get(level, level):<7} [{name}] {message!r} (unformattable record: {e!r})"
+
+    def format_record(self, record):
+        """Formats a record that is known to be well formed."""
+        timestamp, level, name, message, args, fields = record
+        if args:
+            try:
+                message = message % tuple(render_argument(arg) for arg in args)
+            except (TypeError, ValueError):
+                message = f"{message} {args}"
+        if self.json_format:
+            return json.dumps({'ts': timestamp, 'level': LEVEL_NAMES.get(level, level), 'logger': name,
+                               'msg': message, **{key: render_argument(value) for key, value in fields.items()}},
+                              default=str)
+        extra = "".join(f" {key}={render_argument(value)}" for key, value in fields.items())
+        return f"{clock(timestamp)} {LEVEL_NAMES.get(level, level):<7} [{name}] {message}{extra}"
+
+    def write_pending(self):
+        """Writes every queued record."""
+        with self.write_lock:
+            self.write_batch()
+
+    def write_batch(self):
+        """Takes every queued record from the buffer and writes it."""
+        with self.condition:
+            records = list(self.buffer)
+            self.buffer.clear()
+            dropped, self.dropped = self.dropped, 0
+        if not records and not dropped:
+            return
+        lines = [self.format(record) for record in records]
+        if dropped:
+            lines.append(f"(log buffer full: {dropped} records dropped)")
+        stream = self.stream or sys.stdout
+        stream.write("\n".join(lines) + "\n")
+        stream.flush()
+
+    def run(self):
+        """Writer loop: waits for records and writes them in batches, whatever goes wrong with one batch."""
+        while True:
+            with self.condition:
+                while not self.buffer:
+                    self.condition.wait()
+            try:
+                self.write_pending()
+            except Exception as e:
+                try:
+                    sys.stderr.write(f"log writer: batch lost: {e!r}\n")
+                except Exception:
+                    pass
+
+    def flush(self):
+        """Writes every queued record from the calling thread."""
+        self.write_pending()
+
+
+class Logger:
+    """
+    Leveled, structured logger with deferred formatting.
+
+    `logger.debug("Block %s notarized", block.hash, epoch=block.epoch)` costs a level check
+    when DEBUG is disabled; otherwise the raw arguments are queued and only formatted by
+    the background writer, outside of any lock held by the caller.
+    """
+
+    def __init__(self, name, level, writer):
+        self.name = name
+        self.level = level
+        self.writer = writer
+
+    def is_enabled(self, level):
+        """Returns whether records of the given level are emitted."""
+        return level >= self.level
+
+    def log(self, level, message, *args, **fields):
+        """Queues a record if its level is enabled."""
+        if level >= self.level:
+            self.writer.submit((time.time(), level, self.name, message, snapshot(args), fields))
+
+    def debug(self, message, *args, **fields):
+        if DEBUG >= self.level:
+            self.writer.submit((time.time(), DEBUG, self.name, message, snapshot(args), fields))
+
+    def info(self, message, *args, **fields):
+        if INFO >= self.level:
+            self.writer.submit((time.time(), INFO, self.name, message, snapshot(args), fields))
+
+    def warning(self, message, *args, **fields):
+        if WARNING >= self.level:
+            self.writer.submit((time.time(), WARNING, self.name, message, snapshot(args), fields))
+
+    def error(self, message, *args, **fields):
+        if ERROR >= self.level:
+            self.writer.submit((time.time(), ERROR, self.name, message, snapshot(args), fields))
+
+
+# Module-wide configuration shared by every logger
+default_level = INFO
+default_writer = None
+loggers = {}
+loggers_lock = threading.Lock()
+
+
+def parse_level(level):
+    """Accepts a level number or name (e.g. "DEBUG")."""
+    return LEVELS[level.upper()] if isinstance(level, str) else level
+
+
+def get_writer():
+    """Returns the shared writer, creating it on first use."""
+    global default_writer
+    if default_writer is None:
+        default_writer = LogWriter()
+        atexit.register(default_writer.flush)
+    return default_writer
+
+
+def get_logger(name):
+    """
+    Returns the logger with the given name, creating it with the default level.
+
+    :param name: str - The logger name (e.g. "node3").
+    :return: Logger - The logger.
+    """
+    with loggers_lock:
+        logger = loggers.get(name)
+        if logger is None:
+            logger = loggers[name] = Logger(name, default_level, get_writer())
+        return logger
+
+
+def configure(level=None, stream=None, json_format=None, capacity=None):
+    """
+    Configures every logger (existing and future).
+
+    :param level: int or str, optional - Minimum level to emit.
+    :param stream: file, optional - Output stream.
+    :param json_format: bool, optional - Write JSON records instead of text.
+    :param capacity: int, optional - Size of the ring buffer.
+    """
+    global default_level
+    writer = get_writer()
+    if capacity is not None:
+        writer.flush()
+        with writer.condition:
+            writer.buffer = collections.deque(writer.buffer, maxlen=capacity)
+    if stream is not None:
+        writer.flush()
+        writer.stream = stream
+    if json_format is not None:
+        writer.json_format = json_format
+    if level is not None:
+        default_level = parse_level(level)
+        with loggers_lock:
+            for logger in loggers.values():
+                logger.level = default_level
+
+
+def flush():
+    """Writes every queued record now."""
+    get_writer().flush()
@@ -1,6 +1,14 @@
+import collections
 import json
+import struct
+from batch import Batch
 from block import Block
+from certificate import NotarizationCertificate
+from logger import get_logger
 from transaction import Transaction
+from transport import read_until_eof
+
+log = get_logger("message")
 
 class MessageType:
     """
@@ -11,6 +19,31 @@ class MessageType:
     ECHO_TRANSACTION = "ECHO_TRANSACTION"  # Broadcasting a transaction
     QUERY_MISSING_BLOCKS = "QUERY_MISSING_BLOCKS"  # Request for missing blocks
     RESPONSE_MISSING_BLOCKS = "RESPONSE_MISSING_BLOCKS"  # Response with missing blocks
+    BATCH = "BATCH"  # Disseminating a batch of transactions
+    QUERY_BATCH = "QUERY_BATCH"  # Request for batches missing to vote on or notarize a block
+    RESPONSE_BATCH = "RESPONSE_BATCH"  # Response with the requested batches
+
+TYPE_CODES = {
+    MessageType.PROPOSE: 1,
+    MessageType.VOTE: 2,
+    MessageType.ECHO_TRANSACTION: 3,
+    MessageType.QUERY_MISSING_BLOCKS: 4,
+    MessageType.RESPONSE_MISSING_BLOCKS: 5,
+    MessageType.BATCH: 6,
+    MessageType.QUERY_BATCH: 7,
+    MessageType.RESPONSE_BATCH: 8,
+}
+CODE_TYPES = {code: message_type for message_type, code in TYPE_CODES.items()}
+
+# Fixed header in front of the JSON body: magic, type code, codec of the body (0: uncompressed),
+# codecs the sender accepts (bitmask, see compression.py), sender (-1 if none), epoch and key
+# (the block hash for PROPOSE/VOTE, the tx_id for ECHO_TRANSACTION, the digest for BATCH, zeros otherwise)
+HEADER = struct.Struct(">2sBBBiQ20s")
+HEADER_MAGIC = b"SL"
+CODEC_OFFSET = 3  # Offset of the codec byte (the accepted codecs follow it)
+KEY_SIZE = 20
+
+MessageHeader = collections.namedtuple("MessageHeader", ["type", "codec", "accepts", "sender", "epoch", "key"])
 
 class Message:
     """
@@ -33,7 +66,10 @@ class Message:
         """
         self.type = message_type
         self.content = content
-        self.sender = sender      
+        self.sender = sender
+        self.size = None  # Size in bytes on the wire, set when the message is deserialized
+        self.trace_id = None  # Trace ID carried in the envelope when tracing is enabled
+        self.mac = None  # MAC of the sender's vote (VOTE messages only), carried in the envelope
     
     def serialize(self):
             """
@@ -43,8 +79,9 @@ class Message:
             - bytes: The serialized message in JSON format.
             """
             if isinstance(self.content, Block):
-                content = self.content.to_dict()  # Convert block to a dictionary
-            elif isinstance(self.content, Transaction):
+                # Proposals and votes of a block that references batches leave its transactions out
+                content = self.content.to_dict(compact=self.type in (MessageType.PROPOSE, MessageType.VOTE))
+            elif isinstance(self.content, (Transaction, Batch)):
                 content = self.content.to_dict()  # Convert transaction to a dictionary
             elif isinstance(self.content, dict):
                 if self.type == MessageType.RESPONSE_MISSING_BLOCKS:
@@ -53,6 +90,21 @@ class Message:
                         "missing_blocks": [
                             block.to_dict() if isinstance(block, Block) else block
                             for block in self.content.get("missing_blocks", [])
+                        ],
+                        "certificates": [
+                            certificate.to_dict() if isinstance(certificate, NotarizationCertificate) else certificate
+                            for certificate in self.content.get("certificates", [])
+                        ],
+                        "batches": [
+                            batch.to_dict() if isinstance(batch, Batch) else batch
+                            for batch in self.content.get("batches", [])
+                        ]
+                    }
+                elif self.type == MessageType.RESPONSE_BATCH:
+                    content = {
+                        "batches": [
+                            batch.to_dict() if isinstance(batch, Batch) else batch
+                            for batch in self.content.get("batches", [])
                         ]
                     }
                 else:
@@ -60,38 +112,105 @@ class Message:
             else:
                 content = self.content  # Other content types are serialized directly
 
-            return json.dumps({
+            envelope = {
                 'type': self.type,
                 'content': content,
                 'sender': self.sender,
-            }).encode('utf-8')
+            }
+            if self.trace_id is not None:
+                envelope['trace'] = self.trace_id  # Only present while tracing
+            if self.mac is not None:
+                envelope['mac'] = self.mac.hex()
+            return self.header() + json.dumps(envelope).encode('utf-8')
+
+    def header(self):
+        """
+        Builds the fixed header of the message, which receivers read without parsing the body.
+
+        Returns:
+        - bytes: The packed header.
+        """
+        epoch, key = 0, b''
+        if self.type in (MessageType.PROPOSE, MessageType.VOTE):
+            epoch, key = self.content.epoch, self.content.hash
+        elif self.type == MessageType.ECHO_TRANSACTION:
+            transaction = self.content['transaction']
+            tx_id = transaction.tx_id if isinstance(transaction, Transaction) else transaction['tx_id']
+            epoch, key = self.content['epoch'], tx_id.to_bytes(KEY_SIZE, 'big')
+        elif self.type == MessageType.QUERY_MISSING_BLOCKS:
+            epoch = self.content.get("last_epoch", 0)
+        elif self.type == MessageType.BATCH:
+            key = self.content.digest
+        sender = self.sender if self.sender is not None else -1
+        return HEADER.pack(HEADER_MAGIC, TYPE_CODES[self.type], 0, 0, sender, epoch, key)
+
+    @staticmethod
+    def peek(data):
+        """
+        Reads the fixed header of a serialized message without decoding its body.
+
+        Parameters:
+        - data (bytes): The serialized message.
+
+        Returns:
+        - MessageHeader: Type, codec, accepted codecs, sender, epoch and key, or None if the message has no valid header.
+        """
+        if len(data) < HEADER.size or not data.startswith(HEADER_MAGIC):
+            return None
+        _, code, codec, accepts, sender, epoch, key = HEADER.unpack_from(data)
+        if code not in CODE_TYPES:
+            return None
+        return MessageHeader(CODE_TYPES[code], codec, accepts, sender if sender >= 0 else None, epoch, key)
     
     @staticmethod
-    def deserialize_from_socket(conn, blockchain_tx_ids=None, notarized_tx_ids=None):
+    def deserialize_from_socket(conn):
         """
         Deserializes a message received from a socket.
 
+        The sender writes a single message and closes the connection, so the socket
+        is read until EOF; messages larger than one read are therefore not truncated.
+
         Parameters:
         - conn (socket): The socket connection from which data is received.
-        - blockchain_tx_ids (set, optional): Set of transaction IDs already included in the blockchain.
-        - notarized_tx_ids (set, optional): Set of transaction IDs already notarized.
+
+        Returns:
+        - Message: A Message object or None if deserialization fails.
+        """
+        data = read_until_eof(conn)
+        if not data:
+            log.warning("No data received from socket.")
+            return None
+        return Message.deserialize(data)
+
+    @staticmethod
+    def deserialize(data):
+        """
+        Deserializes a message from the bytes produced by `serialize` (fixed header, then JSON body).
+
+        Parameters:
+        - data (bytes): The serialized message.
 
         Returns:
         - Message: A Message object or None if deserialization fails.
         """
         try:
-            data = conn.recv(4096)  # Read up to 4 KB of data
-            if not data:
-                print("No data received from socket.")
+            header = Message.peek(data)
+            if header is None:
+                log.warning("Message header missing or invalid.")
                 return None
-
-            obj = json.loads(data.decode('utf-8'))  # Decode JSON into a Python object
+            if header.codec:
+                log.warning("Compressed message must be decompressed before it is deserialized.")
+                return None
+            obj = json.loads(data[HEADER.size:].decode('utf-8'))  # Decode the JSON body into a Python object
             msg_type = obj.get('type')
             content = obj.get('content')
             sender = obj.get('sender', None)
 
             if not msg_type:
-                print("Message type missing or invalid.")
+                log.warning("Message type missing or invalid.")
+                return None
+            if msg_type != header.type or sender != header.sender:
+                log.warning("Message header does not match its body.")
                 return None
 
             # Handle specific message types
@@ -99,7 +218,7 @@ class Message:
                 if isinstance(content, dict):
                     content = Block.from_dict(content)  # Convert content back to a Block
                 else:
-                    print(f"Invalid block content: {content}")
+                    log.warning("Invalid block content: %s", content)
                     return None
             elif msg_type == MessageType.ECHO_TRANSACTION:
                 if isinstance(content, dict):
@@ -109,29 +228,65 @@ class Message:
                         transaction = Transaction.from_dict(transaction_data)
                         content = {'transaction': transaction, 'epoch': epoch}
                     else:
-                        print(f"Invalid transaction content: {content}")
+                        log.warning("Invalid transaction content: %s", content)
                         return None
                 else:
-                    print(f"Invalid content format for ECHO_TRANSACTION: {content}")
+                    log.warning("Invalid content format for ECHO_TRANSACTION: %s", content)
                     return None
             elif msg_type == MessageType.RESPONSE_MISSING_BLOCKS:
                 if isinstance(content, dict) and "missing_blocks" in content:
                     content["missing_blocks"] = [
                         Block.from_dict(block_data) for block_data in content["missing_blocks"]
                     ]
+                    certificates = [
+                        NotarizationCertificate.from_dict(data) for data in content.get("certificates", [])
+                    ]
+                    content["certificates"] = {certificate.block_hash: certificate for certificate in certificates}
+                    content["batches"] = [Batch.from_dict(batch_data) for batch_data in content.get("batches", [])]
                 else:
-                    print(f"Invalid content format for RESPONSE_MISSING_BLOCKS: {content}")
+                    log.warning("Invalid content format for RESPONSE_MISSING_BLOCKS: %s", content)
+                    return None
+            elif msg_type == MessageType.BATCH:
+                if isinstance(content, dict):
+                    content = Batch.from_dict(content)  # Checks the digest against the transactions
+                else:
+                    log.warning("Invalid content format for BATCH: %s", content)
+                    return None
+            elif msg_type == MessageType.RESPONSE_BATCH:
+                if isinstance(content, dict) and "batches" in content:
+                    content["batches"] = [Batch.from_dict(batch_data) for batch_data in content["batches"]]
+                else:
+                    log.warning("Invalid content format for RESPONSE_BATCH: %s", content)
+                    return None
+            elif msg_type == MessageType.QUERY_BATCH:
+                if isinstance(content, dict) and isinstance(content.get("digests"), list):
+                    content["digests"] = [bytes.fromhex(digest) for digest in content["digests"]]
+                else:
+                    log.warning("Invalid content format for QUERY_BATCH: %s", content)
                     return None
             elif msg_type in [MessageType.QUERY_MISSING_BLOCKS]:
                 # QUERY messages typically have simpler content
                 pass
             else:
-                print(f"Unknown message type: {msg_type}")
+                log.warning("Unknown message type: %s", msg_type)
                 return None
 
-            return Message(msg_type, content, sender)
+            message = Message(msg_type, content, sender)
+            if msg_type in (MessageType.PROPOSE, MessageType.VOTE) and (content.epoch, content.hash) != (header.epoch, header.key):
+                log.warning("Message header does not match its block.")
+                return None
+            if msg_type == MessageType.BATCH and content.digest != header.key:
+                log.warning("Message header does not match its batch.")
+                return None
+            message.size = len(data)
+            message.trace_id = obj.get('trace')
+            if obj.get('mac') is not None:
+                message.mac = bytes.fromhex(obj['mac'])
+            return message
         except json.JSONDecodeError as e:
-            print(f"JSON decode error: {e}")
+            log.warning("JSON decode error: %s", e)
+        except (KeyError, ValueError, TypeError) as e:
+            log.warning("Malformed message content: %s", e)
     
     @staticmethod
     def create_propose_message(block, sender):
@@ -148,18 +303,21 @@ class Message:
         return Message(MessageType.PROPOSE, block, sender)
 
     @staticmethod
-    def create_vote_message(block, sender):
+    def create_vote_message(block, sender, mac=None):
         """
         Creates a VOTE message.
 
         Parameters:
         - block (Block): The block being voted on.
         - sender (int): The ID of the sending node.
+        - mac (bytes, optional): The MAC authenticating the vote.
 
         Returns:
         - Message: A Message object of type VOTE.
         """
-        return Message(MessageType.VOTE, block, sender)
+        message = Message(MessageType.VOTE, block, sender)
+        message.mac = mac
+        return message
 
     @staticmethod
     def create_echo_transaction_message(transaction, epoch, sender):
@@ -191,15 +349,65 @@ class Message:
         return Message(MessageType.QUERY_MISSING_BLOCKS, {"last_epoch": last_epoch}, sender)
 
     @staticmethod
-    def create_response_missing_blocks_message(missing_blocks, sender):
+    def create_response_missing_blocks_message(missing_blocks, sender, certificates=(), batches=()):
         """
         Creates a RESPONSE_MISSING_BLOCKS message.
 
+        Blocks that reference batches are sent without their transactions, followed by the batches.
+
         Parameters:
         - missing_blocks (list of Block): The list of missing blocks to send.
         - sender (int): The ID of the sending node.
+        - certificates (list of NotarizationCertificate, optional): The notarization certificates of the blocks.
+        - batches (list of Batch, optional): The batches the blocks reference.
 
         Returns:
         - Message: A Message object of type RESPONSE_MISSING_BLOCKS.
         """
-        return Message(MessageType.RESPONSE_MISSING_BLOCKS, {"missing_blocks": [block.to_dict() for block in missing_blocks]}, sender)
+        return Message(MessageType.RESPONSE_MISSING_BLOCKS, {
+            "missing_blocks": [block.to_dict(compact=True) for block in missing_blocks],
+            "certificates": [certificate.to_dict() for certificate in certificates],
+            "batches": [batch.to_dict() for batch in batches]
+        }, sender)
+
+    @staticmethod
+    def create_batch_message(batch, sender):
+        """
+        Creates a BATCH message.
+
+        Parameters:
+        - batch (Batch): The batch of transactions to disseminate.
+        - sender (int): The ID of the sending node.
+
+        Returns:
+        - Message: A Message object of type BATCH.
+        """
+        return Message(MessageType.BATCH, batch, sender)
+
+    @staticmethod
+    def create_query_batch_message(digests, sender):
+        """
+        Creates a QUERY_BATCH message.
+
+        Parameters:
+        - digests (list of bytes): The digests of the missing batches.
+        - sender (int): The ID of the sending node.
+
+        Returns:
+        - Message: A Message object of type QUERY_BATCH.
+        """
+        return Message(MessageType.QUERY_BATCH, {"digests": [digest.hex() for digest in digests]}, sender)
+
+    @staticmethod
+    def create_response_batch_message(batches, sender):
+        """
+        Creates a RESPONSE_BATCH message.
+
+        Parameters:
+        - batches (list of Batch): The requested batches that the sender stores.
+        - sender (int): The ID of the sending node.
+
+        Returns:
+        - Message: A Message object of type RESPONSE_BATCH.
+        """
+        return Message(MessageType.RESPONSE_BATCH, {"batches": [batch.to_dict() for batch in batches]}, sender)
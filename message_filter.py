@@ -0,0 +1,86 @@
+import collections
+import hashlib
+
+from message import Message, MessageType
+
+
+class MessageFilter:
+    """
+    Drops received messages that no longer matter, from their fixed header, before the body is decoded.
+
+    A message is dropped when it is:
+    - a duplicate: a PROPOSE, VOTE or ECHO_TRANSACTION whose exact bytes were already received
+      (digests are kept in a bounded LRU);
+    - a stale PROPOSE: its epoch is not after the highest notarized epoch, so the node would not vote for it;
+    - a stale VOTE: its block is already notarized, or its epoch is not after the finalized tip;
+    - a known ECHO_TRANSACTION: the transaction is already pending, notarized or finalized;
+    - a known BATCH: the batch is already stored.
+
+    QUERY and RESPONSE messages are always decoded (a rejoining node may repeat the same query).
+    The filter is used by a single listener thread or task.
+    """
+
+    DEDUPLICATED = (MessageType.PROPOSE, MessageType.VOTE, MessageType.ECHO_TRANSACTION, MessageType.BATCH)
+
+    def __init__(self, node, capacity=8192):
+        """
+        :param node: Node - The node whose state decides what is stale.
+        :param capacity: int - Number of message digests remembered.
+        """
+        self.node = node
+        self.capacity = capacity
+        self.seen = collections.OrderedDict()  # Digests of the last received messages, oldest first
+        self.notarized_epoch = 0  # Highest epoch notarized by the node (a lower bound, see `stale_epoch`)
+        node.on_notarized.append(self.block_notarized)
+
+    def block_notarized(self, block):
+        """Node listener: tracks the highest notarized epoch (called under the node's lock)."""
+        self.notarized_epoch = max(self.notarized_epoch, block.epoch)
+
+    def stale_epoch(self):
+        """Returns an epoch at or below which proposals are not voted for."""
+        blockchain = self.node.blockchain
+        return max(self.notarized_epoch, blockchain[-1].epoch if blockchain else 0)
+
+    def admit(self, data):
+        """
+        Decides whether a received message is worth decoding.
+
+        :param data: bytes - The serialized message.
+        :return: bool - False if the message is dropped.
+        """
+        header = Message.peek(data)
+        if header is None:
+            return True  # Let the decoder report the invalid message
+        reason = None
+        if header.type == MessageType.PROPOSE and header.epoch <= self.stale_epoch():
+            reason = "stale_proposal"
+        elif header.type == MessageType.VOTE:
+            notarized = self.node.notarized_blocks.get(header.epoch)
+            blockchain = self.node.blockchain
+            if notarized is not None and notarized.hash == header.key:
+                reason = "notarized_vote"
+            elif blockchain and header.epoch <= blockchain[-1].epoch:
+                reason = "finalized_vote"
+        elif header.type == MessageType.ECHO_TRANSACTION:
+            if int.from_bytes(header.key, 'big') in self.node.tx_index:
+                reason = "known_transaction"
+        elif header.type == MessageType.BATCH:
+            if self.node.batch_store is not None and self.node.batch_store.contains(header.key):
+                reason = "known_batch"
+
+        # Stale messages are dropped without hashing them; the others are checked for duplicates
+        if reason is None and header.type in self.DEDUPLICATED:
+            digest = hashlib.blake2b(data, digest_size=16).digest()
+            if digest in self.seen:
+                self.seen.move_to_end(digest)
+                reason = "duplicate"
+            else:
+                self.seen[digest] = None
+                if len(self.seen) > self.capacity:
+                    self.seen.popitem(last=False)
+
+        if reason is None:
+            return True
+        self.node.metrics.inc("messages_dropped_early", type=header.type, reason=reason)
+        return False
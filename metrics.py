@@ -0,0 +1,249 @@
+import bisect
+import collections
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Default histogram buckets in seconds, from sub-millisecond LAN latencies up to long epochs
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed bucket bounds, plus count, sum, min and max.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # Last slot counts values above every bound
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        """Records one value."""
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """Estimates a quantile as the upper bound of the bucket holding it."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def to_dict(self):
+        """Serializes the histogram into a dictionary."""
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.sum / self.count if self.count else None,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+            'buckets': {str(bound): count for bound, count in zip(self.bounds, self.counts)},
+            'overflow': self.counts[-1],
+        }
+
+
+class MetricsRegistry:
+    """
+    Thread-safe registry of counters, gauges and histograms, optionally labelled.
+
+    Metrics are created on first use. Gauges may also be callables evaluated when the
+    registry is read, which suits values such as queue depths or the thread count.
+    Per-epoch samples keep one value per epoch for the latest `epoch_window` epochs.
+    """
+
+    def __init__(self, prefix="streamlet", epoch_window=256):
+        self.prefix = prefix
+        self.epoch_window = epoch_window
+        self.lock = threading.Lock()
+        self.counters = {}  # Maps (name, labels) to a number
+        self.gauges = {}  # Maps (name, labels) to a number or a callable
+        self.histograms = {}  # Maps (name, labels) to a Histogram
+        self.epoch_samples = {}  # Maps a name to an OrderedDict of epoch -> value, oldest first
+
+    @staticmethod
+    def key(name, labels):
+        """Builds the registry key of a metric from its name and labels."""
+        return name, tuple(sorted(labels.items())) if labels else ()
+
+    def inc(self, name, amount=1, **labels):
+        """Increments a counter."""
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        """Sets a gauge to a value, or to a callable evaluated on every read."""
+        with self.lock:
+            self.gauges[self.key(name, labels)] = value
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        """Records a value in a histogram."""
+        key = self.key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def record_epoch(self, name, epoch, value):
+        """Records the value of a metric for one epoch, forgetting the oldest epoch beyond the window."""
+        with self.lock:
+            samples = self.epoch_samples.get(name)
+            if samples is None:
+                samples = self.epoch_samples[name] = collections.OrderedDict()
+            samples[epoch] = value
+            if len(samples) > self.epoch_window:
+                samples.popitem(last=False)
+
+    @staticmethod
+    def label_text(labels):
+        """Formats labels in the Prometheus text format."""
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+    def read_gauges(self):
+        """Returns the gauges with callables evaluated."""
+        with self.lock:
+            gauges = dict(self.gauges)
+        values = {}
+        for key, value in gauges.items():
+            try:
+                values[key] = value() if callable(value) else value
+            except Exception:
+                values[key] = None  # A gauge callback must never break a read
+        return values
+
+    def snapshot(self):
+        """
+        Returns every metric as a JSON-serializable dictionary.
+
+        :return: dict - Counters, gauges and histograms keyed by "name{labels}".
+        """
+        gauges = self.read_gauges()
+        with self.lock:
+            return {
+                'timestamp': time.time(),
+                'counters': {f"{name}{self.label_text(labels)}": value
+                             for (name, labels), value in self.counters.items()},
+                'gauges': {f"{name}{self.label_text(labels)}": value
+                           for (name, labels), value in gauges.items()},
+                'histograms': {f"{name}{self.label_text(labels)}": histogram.to_dict()
+                               for (name, labels), histogram in self.histograms.items()},
+                'epochs': {name: {str(epoch): value for epoch, value in samples.items()}
+                           for name, samples in self.epoch_samples.items()},
+            }
+
+    def render_text(self):
+        """
+        Renders every metric in the Prometheus text exposition format.
+
+        :return: str - The metrics, one sample per line.
+        """
+        lines = []
+        gauges = self.read_gauges()
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(f"{self.prefix}_{name}{self.label_text(labels)} {value}")
+            for (name, labels), value in sorted(gauges.items(), key=lambda item: item[0]):
+                if value is not None:
+                    lines.append(f"{self.prefix}_{name}{self.label_text(labels)} {value}")
+            for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                cumulative = 0
+                for bound, count in zip(histogram.bounds, histogram.counts):
+                    cumulative += count
+                    bucket_labels = labels + (('le', bound),)
+                    lines.append(f"{self.prefix}_{name}_bucket{self.label_text(bucket_labels)} {cumulative}")
+                lines.append(f"{self.prefix}_{name}_bucket{self.label_text(labels + (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{self.prefix}_{name}_sum{self.label_text(labels)} {histogram.sum}")
+                lines.append(f"{self.prefix}_{name}_count{self.label_text(labels)} {histogram.count}")
+            for name, samples in sorted(self.epoch_samples.items()):
+                for epoch, value in samples.items():
+                    lines.append(f"{self.prefix}_{name}_by_epoch{self.label_text((('epoch', epoch),))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """
+    Serves a registry over HTTP on localhost: `/metrics` as text and `/metrics.json` as JSON.
+    """
+
+    def __init__(self, registry, port, host='localhost'):
+        registry_ref = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics.json':
+                    body = json.dumps(registry_ref.snapshot()).encode('utf-8')
+                    content_type = 'application/json'
+                elif self.path in ('/', '/metrics'):
+                    body = registry_ref.render_text().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Keep scrapes out of the node's console output
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    def start(self):
+        """Starts serving in a daemon thread."""
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+class MetricsDumper:
+    """
+    Periodically writes a JSON snapshot of a registry to a file (atomically replaced).
+    """
+
+    def __init__(self, registry, file_name, interval=5.0):
+        self.registry = registry
+        self.file_name = file_name
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def dump(self):
+        """Writes one snapshot to the file."""
+        temporary_name = f"{self.file_name}.tmp"
+        with open(temporary_name, 'w') as f:
+            json.dump(self.registry.snapshot(), f, indent=4)
+        os.replace(temporary_name, self.file_name)
+
+    def run(self):
+        """Dumps a snapshot every `interval` seconds until stopped."""
+        while not self.stopped.wait(self.interval):
+            self.dump()
+
+    def start(self):
+        """Starts dumping in a daemon thread."""
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def stop(self):
+        """Stops the periodic dump and writes a final snapshot."""
+        self.stopped.set()
+        self.dump()
@@ -0,0 +1,304 @@
+import asyncio
+import math
+import queue
+import random
+import threading
+import time
+
+from logger import get_logger
+from transport import Transport
+
+log = get_logger("netem")
+
+
+def parse_distribution(spec):
+    """
+    Builds a delay distribution from its configuration.
+
+    :param spec: float or dict - A constant number of seconds, or
+        {"distribution": "constant", "value": s}, {"distribution": "uniform", "low": s, "high": s},
+        {"distribution": "normal", "mean": s, "stdev": s} (clipped at 0) or
+        {"distribution": "exponential", "base": s, "mean_extra": s}.
+    :return: callable - rng -> delay in seconds.
+    :raises ValueError: If the distribution is unknown.
+    """
+    if spec is None:
+        return lambda rng: 0.0
+    if isinstance(spec, (int, float)):
+        return lambda rng: float(spec)
+    kind = spec.get("distribution", "constant")
+    if kind == "constant":
+        value = float(spec.get("value", 0.0))
+        return lambda rng: value
+    if kind == "uniform":
+        low, high = float(spec["low"]), float(spec["high"])
+        return lambda rng: rng.uniform(low, high)
+    if kind == "normal":
+        mean, stdev = float(spec["mean"]), float(spec["stdev"])
+        return lambda rng: max(rng.gauss(mean, stdev), 0.0)
+    if kind == "exponential":
+        base, mean_extra = float(spec.get("base", 0.0)), float(spec["mean_extra"])
+        return lambda rng: base + rng.expovariate(1 / mean_extra) if mean_extra > 0 else base
+    raise ValueError(f"Unknown distribution {kind} (expected constant, uniform, normal or exponential)")
+
+
+class LinkModel:
+    """
+    Impairments of a directed link: latency distribution, loss, and reordering (a message is
+    held back by an extra delay, so the messages sent after it overtake it).
+    """
+
+    def __init__(self, latency=None, loss=0.0, reorder=0.0, reorder_delay=None):
+        """
+        :param latency: float or dict, optional - Latency distribution (see `parse_distribution`).
+        :param loss: float - Probability that a message is lost.
+        :param reorder: float - Probability that a message is held back.
+        :param reorder_delay: float or dict, optional - Extra delay of held back messages (default uniform 0.5-2 s).
+        """
+        self.latency = parse_distribution(latency)
+        self.loss = float(loss)
+        self.reorder = float(reorder)
+        self.reorder_delay = parse_distribution(reorder_delay if reorder_delay is not None
+                                                else {"distribution": "uniform", "low": 0.5, "high": 2.0})
+
+    @staticmethod
+    def from_config(config, base=None):
+        """
+        Builds a link model from its configuration, taking the missing settings from `base`.
+
+        :param config: dict - Any of `latency`, `loss`, `reorder` and `reorder_delay`.
+        :param base: dict, optional - The configuration it overrides.
+        :return: LinkModel - The model.
+        """
+        merged = dict(base or {})
+        merged.update({key: value for key, value in config.items() if key in ("latency", "loss", "reorder", "reorder_delay")})
+        return LinkModel(**merged)
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel run by a single thread.
+
+    A callback scheduled `delay` seconds ahead goes to slot (tick + delay / tick) of the wheel;
+    on every tick the thread runs the callbacks of the current slot that are due, in the order
+    they were scheduled. Scheduling never blocks the caller, and thousands of pending timers
+    cost one thread instead of one sleeping thread each. The thread sleeps while no timer is
+    pending.
+    """
+
+    def __init__(self, tick=0.001, slots=1024):
+        """
+        :param tick: float - Resolution of the wheel in seconds.
+        :param slots: int - Number of slots (delays longer than slots * tick take several turns).
+        """
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]
+        self.condition = threading.Condition(threading.Lock())
+        self.origin = time.monotonic()
+        self.current_tick = 0  # Last tick whose slot was run
+        self.pending = 0  # Number of scheduled callbacks
+        self.sequence = 0  # Keeps callbacks of the same tick in scheduling order
+        self.thread = None
+
+    def now_tick(self):
+        return int((time.monotonic() - self.origin) / self.tick)
+
+    def schedule(self, delay, callback, *args):
+        """
+        Runs `callback(*args)` on the wheel's thread after `delay` seconds (rounded up to a tick).
+
+        :param delay: float - Delay in seconds.
+        :param callback: callable - The function to run.
+        :param args: tuple - Positional arguments for the function.
+        """
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            if self.pending == 0:
+                self.current_tick = max(self.current_tick, self.now_tick() - 1)  # Nothing to run in between
+            target = max(self.now_tick() + max(math.ceil(delay / self.tick), 1), self.current_tick + 1)
+            self.slots[target % len(self.slots)].append((target, self.sequence, callback, args))
+            self.sequence += 1
+            self.pending += 1
+            self.condition.notify()
+
+    def run(self):
+        """Runs the due callbacks, tick by tick."""
+        while True:
+            with self.condition:
+                while self.pending == 0:
+                    self.condition.wait()
+                wait = self.origin + (self.current_tick + 1) * self.tick - time.monotonic()
+                if wait > 0:
+                    self.condition.wait(wait)
+                    continue
+                due = []
+                last_tick = self.now_tick()
+                while self.current_tick < last_tick and self.pending:
+                    self.current_tick += 1
+                    slot = self.slots[self.current_tick % len(self.slots)]
+                    ready = [entry for entry in slot if entry[0] <= self.current_tick]
+                    if ready:
+                        slot[:] = [entry for entry in slot if entry[0] > self.current_tick]
+                        due.extend(sorted(ready, key=lambda entry: entry[1]))
+                        self.pending -= len(ready)
+            for _, _, callback, args in due:
+                try:
+                    callback(*args)
+                except Exception as e:
+                    log.error("Timer callback failed: %s", e)
+
+
+class NetworkEmulator(Transport):
+    """
+    Network emulation layer between a node and its transport.
+
+    Each message is dropped, sent at once, or sent later by the timer wheel, according to the
+    model of its link and the episodes in progress. Episodes apply to a range of epochs: they
+    override the link settings (e.g. the confusion period) and/or split the nodes into groups
+    that cannot reach each other (partitions). Senders never sleep, so impairments delay the
+    messages without slowing down the node. When a delayed message is due, the wheel hands it
+    to the sender thread of its target, so a send that blocks (a full ring, a slow connection)
+    only holds back the later messages of the same link.
+
+    Configuration (`network_emulation` in network_info.json):
+        {"seed": 1, "tick": 0.001,
+         "default": {"latency": ..., "loss": 0.0, "reorder": 0.0, "reorder_delay": ...},
+         "links": [{"from": 0, "to": 1, "latency": ..., "loss": 0.1}],
+         "episodes": [{"start_epoch": 5, "end_epoch": 7, "loss": 0.2, "groups": [[0, 1], [2, 3]]}]}
+    Nodes are designated by their ID; `end_epoch` is inclusive.
+    """
+
+    def __init__(self, inner, port, ports, config=None, confusion=None):
+        """
+        :param inner: Transport - The transport that carries the messages.
+        :param port: int - The port of this node.
+        :param ports: list - The ports of every node (node ID = index).
+        :param config: dict, optional - The `network_emulation` configuration.
+        :param confusion: tuple, optional - (start, duration) of the confusion period, emulated as an episode
+            with 20% loss and 30% of the messages held back by 1-3 seconds.
+        """
+        config = config or {}
+        self.inner = inner
+        self.max_message_size = inner.max_message_size
+        self.port = port
+        self.ports = ports
+        self.node_id = ports.index(port)
+        self.rng = random.Random(f"{config.get('seed', 0)}-{self.node_id}")
+        self.wheel = TimerWheel(config.get("tick", 0.001))
+        self.outboxes = {}  # Maps a target port to the queue of its sender thread (created by the wheel's thread)
+        self.node = None  # Attached node (current epoch and metrics)
+
+        default = config.get("default", {})
+        self.default_config = default
+        self.default = LinkModel.from_config(default)
+        self.links = {}  # Maps a target node ID to the configuration of the link from this node
+        for link in config.get("links", []):
+            if link["from"] == self.node_id:
+                self.links[link["to"]] = dict(default, **{key: value for key, value in link.items() if key not in ("from", "to")})
+        self.link_models = {target: LinkModel.from_config(link) for target, link in self.links.items()}
+
+        episodes = list(config.get("episodes", []))
+        if confusion is not None and confusion[0] >= 0 and confusion[1] > 0:
+            episodes.append({"start_epoch": confusion[0], "end_epoch": confusion[0] + confusion[1] - 1,
+                             "loss": 0.2, "reorder": 0.3, "reorder_delay": {"distribution": "uniform", "low": 1, "high": 3}})
+        self.episodes = []  # (start, end, groups, model by target or None)
+        for episode in episodes:
+            groups = episode.get("groups")
+            impairs = any(key in episode for key in ("latency", "loss", "reorder", "reorder_delay"))
+            models = None
+            if impairs:
+                models = {target: LinkModel.from_config(episode, self.links.get(target, default))
+                          for target in range(len(ports))}
+            self.episodes.append((episode["start_epoch"], episode["end_epoch"],
+                                  [set(group) for group in groups] if groups else None, models))
+
+    def attach(self, node):
+        """Attaches the node whose epoch selects the episodes and whose metrics count the impairments."""
+        self.node = node
+
+    def model(self, target_id):
+        """
+        Returns the link model to a node in the current epoch, or None if the node is unreachable.
+
+        :param target_id: int - The ID of the target node.
+        :return: LinkModel - The model, or None during a partition that separates the two nodes.
+        """
+        epoch = self.node.current_epoch if self.node is not None else 0
+        model = self.link_models.get(target_id, self.default)
+        for start, end, groups, models in self.episodes:
+            if not start <= epoch <= end:
+                continue
+            if groups is not None and not any(self.node_id in group and target_id in group for group in groups):
+                return None
+            if models is not None:
+                model = models[target_id]
+        return model
+
+    def delay(self, target_port):
+        """
+        Decides the fate of a message to a node.
+
+        :param target_port: int - The port of the target node.
+        :return: float - The delay before the message is sent, or None if it is dropped.
+        """
+        target_id = self.ports.index(target_port) if target_port in self.ports else None
+        if target_id is None:
+            return 0.0  # Not a node of the network (e.g. a local tool)
+        model = self.model(target_id)
+        if model is None:
+            self.count("netem_dropped", reason="partition")
+            return None
+        if model.loss and self.rng.random() < model.loss:
+            self.count("netem_dropped", reason="loss")
+            return None
+        delay = model.latency(self.rng)
+        if model.reorder and self.rng.random() < model.reorder:
+            delay += model.reorder_delay(self.rng)
+            self.count("netem_reordered")
+        return delay
+
+    def count(self, name, **labels):
+        if self.node is not None:
+            self.node.metrics.inc(name, **labels)
+
+    def send(self, target_port, data):
+        delay = self.delay(target_port)
+        if delay is None:
+            return
+        if delay <= 0:
+            self.inner.send(target_port, data)
+        else:
+            self.wheel.schedule(delay, self.deliver, target_port, data)
+
+    def deliver(self, target_port, data):
+        """Hands a delayed message to the sender thread of its target (on the timer wheel's thread, which never blocks)."""
+        outbox = self.outboxes.get(target_port)
+        if outbox is None:
+            outbox = self.outboxes[target_port] = queue.Queue()
+            threading.Thread(target=self.send_delayed, args=(target_port, outbox), daemon=True).start()
+        outbox.put(data)
+
+    def send_delayed(self, target_port, outbox):
+        """Sender thread of one target: sends its delayed messages in the order they were due."""
+        while True:
+            data = outbox.get()
+            try:
+                self.inner.send(target_port, data)
+            except (OSError, TimeoutError) as e:
+                log.warning("Could not deliver a delayed message to port %s: %s", target_port, e)
+
+    def listen(self, port):
+        return self.inner.listen(port)
+
+    async def send_async(self, target_port, data):
+        delay = self.delay(target_port)
+        if delay is None:
+            return
+        if delay > 0:
+            await asyncio.sleep(delay)  # Each send is its own task, so only this message waits
+        await self.inner.send_async(target_port, data)
+
+    async def serve_async(self, port, callback):
+        return await self.inner.serve_async(port, callback)
@@ -1,27 +1,44 @@
+import collections
 from datetime import datetime
 import json
 import threading
-import socket
 import time
+import os
 import random
 import sys
 
+from batch_store import BatchStore
 from block import Block
+from block_policy import BlockPackingPolicy
+from certificate import KeySet, NotarizationCertificate
+from compression import Compressor
+from epoch_scheduler import EpochScheduler
+from ledger import LedgerState
+from leader_schedule import LeaderSchedule
 from message import Message, MessageType
+from message_filter import MessageFilter
+from metrics import MetricsRegistry
+import logger
+from tracing import Tracer
 from transaction import Transaction
+from transport import TcpTransport
+from tx_index import FINALIZED, NOTARIZED, PENDING, TransactionIndex
 
 class Node(threading.Thread):
     """
     Represents a blockchain node in a network running the Streamlet consensus protocol.
     Each node can propose, vote, and notarize blocks, and broadcasts messages to other nodes.
     """
-    def __init__(self, node_id, total_nodes, total_epochs, delta, port, ports, start_time, rejoin, confusion_start=None, confusion_duration=None):
+    def __init__(self, node_id, total_nodes, total_epochs, delta, port, ports, start_time, rejoin, confusion_start=None, confusion_duration=None,
+                 optimistic_responsiveness=False, synthetic_transactions=True, mac_keys=None, transport=None,
+                 compression=None, compression_threshold=4096, max_block_bytes=None, max_block_transactions=None,
+                 target_notarization_latency=None, batching=False, batch_size=100, tx_index_retention=1000):
         super().__init__()
         # Node and network configuration
         self.node_id = node_id  # Unique identifier for the node
         self.total_nodes = total_nodes  # Total number of nodes in the network
         self.total_epochs = total_epochs  # Total number of epochs to run the protocol
-        self.epoch_duration = 2 * delta  # Duration of each epoch based on the delta parameter
+        self.epoch_duration = 2 * delta  # Duration of each epoch based on the delta parameter (may be sub-second)
         self.start_time = start_time  # Start time for the protocol
         self.rejoin = rejoin  # Indicates whether the node is rejoining the network
 
@@ -33,137 +50,292 @@ class Node(threading.Thread):
         self.tx_id_lock = threading.Lock()  # Lock for thread-safe transaction ID generation
         self.lock = threading.Lock()  # General-purpose lock for thread-safe operations
         self.message_queue_lock = threading.Lock()  # Lock for managing the message queue
+        self.message_queue_ready = threading.Condition(self.message_queue_lock)  # Signaled when a message is queued
 
         # Transaction and voting data
         self.global_tx_id = 0  # Counter for transaction IDs
-        self.pending_transactions = {}  # Pending transactions for the current epoch
+        self.pending_transactions = {}  # Pending transactions, by the epoch whose proposal should first include them
         self.vote_counts = {}  # Count of votes for each block
         self.voted_senders = {}  # Tracks nodes that have already voted
-        self.notarized_tx_ids = set()  # IDs of transactions that have been notarized
+        self.tx_index = TransactionIndex(tx_index_retention)  # State, block and position of the recent transactions, by tx_id
 
         # Networking
         self.port = port  # Port this node listens on
         self.ports = ports  # List of all node ports in the network
+        self.transport = transport or TcpTransport()  # Carries messages to the other nodes
 
         # Blockchain-related properties
         self.blockchain = []  # Local copy of the blockchain
-        self.notarized_blocks = {}  # Dictionary of notarized blocks
+        self.notarized_blocks = {}  # Notarized blocks by epoch, from the finalized tip up (see `prune_below_tip`)
+        self.blocks_by_hash = {}  # Every block seen in a proposal or vote, by hash, from the finalized tip up (to walk chains back)
+        self.certificates = {}  # Maps a block hash to the NotarizationCertificate built from its votes
+        self.keys = KeySet.from_config(mac_keys) if mac_keys else None  # Vote MAC keys (derived from the seed if not configured)
         self.genesis_block = Block(epoch=0, previous_hash=b'0' * 20, transactions={})  # The genesis block
+        self.ledger = LedgerState()  # Balances and account history of the finalized chain
 
         # Protocol state
         self.seed = None  # Seed for deterministic leader selection
+        self.leader_schedule = None  # Hash-based leader schedule (created once the seed is set)
+        self.rng = random.Random()  # Private RNG, so leader selection never reseeds or correlates with it
         self.running = False  # Indicates whether the main protocol loop is running
         self.recovery_completed = False  # Indicates whether recovery is complete
+        self.scheduler = None  # Epoch scheduler anchored to the shared start instant (created in `run`)
+        self.optimistic_responsiveness = optimistic_responsiveness  # Advance the epoch as soon as its block is notarized
+        self.epoch_notarized = threading.Event()  # Set once a block of the current (or a later) epoch is notarized
+        self.voted_epochs = set()  # Epochs this node has voted in (one vote per epoch in optimistic mode)
+        self.synthetic_transactions = synthetic_transactions  # Generate random transactions each epoch (off when clients submit the load)
+
+        # Commit listeners, called under `self.lock` (they must not block)
+        self.on_notarized = []  # Called with each newly notarized block
+        self.on_finalized = []  # Called with each list of newly finalized blocks, in chain order
+        self.on_chain_replaced = []  # Called with the new chain when resolve_forks replaces the finalized chain
 
         # Confusion (fault-tolerance testing) configuration
         self.confusion_start = confusion_start if confusion_start is not None else -1  # Start of confusion period
         self.confusion_duration = confusion_duration if confusion_duration is not None else 0  # Duration of confusion period
 
         # Message handling
-        self.message_queue = []  # Queue for incoming messages
+        self.message_queue = collections.deque()  # Queue for incoming messages
+        self.message_filter = MessageFilter(self)  # Drops stale and duplicate messages before they are decoded
+        self.compressor = Compressor(self, compression or (), compression_threshold)  # Per-peer negotiated body compression
+
+        # Metrics
+        self.metrics = MetricsRegistry()  # Consensus latency, network volume and resource metrics
+        self.block_seen_at = {}  # Maps the hash of a block above the finalized tip to (its epoch, the monotonic time this node first saw it)
+        self.metrics.set("message_queue_depth", lambda: len(self.message_queue))
+        self.metrics.set("pending_transactions", lambda: sum(len(txs) for txs in list(self.pending_transactions.values())))
+        self.metrics.set("thread_count", threading.active_count)
+        self.metrics.set("current_epoch", lambda: self.current_epoch)
+        self.metrics.set("finalized_height", lambda: len(self.blockchain) - 1)
+        self.metrics.set("notarized_blocks", lambda: len(self.notarized_blocks))
+
+        # Block building: size limits of proposals and adaptive sizing from notarization latency
+        self.block_policy = BlockPackingPolicy(self, max_block_bytes, max_block_transactions, target_notarization_latency)
+
+        # Data availability: transactions are disseminated in batches and blocks reference their digests
+        self.batch_store = BatchStore(self, batch_size, file_name=f"batches_{node_id}.jsonl") if batching else None
+
+        # Tracing (disabled until a trace file is opened)
+        self.tracer = Tracer(self.node_id)  # Records the lifecycle of each block as trace spans
+        self.block_trace_ids = {}  # Maps a block hash to the trace ID following it across nodes
 
-        print(f"Initialized Node {self.node_id} on port {self.port}")
+        self.log = logger.get_logger(f"node{self.node_id}")  # Leveled logger; formatting happens in a background writer
+        self.log.info("Initialized Node %s on port %s", self.node_id, self.port)
 
     def get_next_leader(self, seed):
         """Determines the leader for the current epoch using the provided seed."""
-        epoch_seed = f"{seed}-{self.current_epoch}"  # Combine seed and epoch for variability
-        random.seed(epoch_seed)  # Set the random seed
-        return random.randint(0, self.total_nodes - 1)  # Select a random node as leader
+        if self.leader_schedule is None or self.leader_schedule.seed != seed:
+            self.leader_schedule = LeaderSchedule(seed, self.total_nodes)
+        return self.leader_schedule.leader_for(self.current_epoch)  # Hash of seed and epoch, cached
+
+    def leader_of(self, epoch):
+        """
+        Returns the leader of any epoch, taking the confusion period into account.
+
+        :param epoch: int - The epoch number.
+        :return: int - The ID of the leader node.
+        """
+        if self.is_confusion_active(epoch):
+            return epoch % self.total_nodes  # Deterministic leader during confusion
+        return self.leader_schedule.leader_for(epoch)
 
     def next_leader(self, seed):
         """
         Determines the leader for the epoch based on the current epoch and confusion settings.
         Proposes a block if the node itself is selected as the leader.
         """
-        confusion_end = self.confusion_start + self.confusion_duration - 1
-        if self.current_epoch < self.confusion_start or self.current_epoch > confusion_end:
-            # Normal operation: Use random leader selection
-            self.current_leader = self.get_next_leader(seed)
-        else:
+        if self.is_confusion_active(self.current_epoch):
             # Confusion period: Use deterministic leader selection
             self.current_leader = self.current_epoch % self.total_nodes
+        else:
+            # Normal operation: Use random leader selection
+            self.current_leader = self.get_next_leader(seed)
+
+        # Keep the leaders of the upcoming epochs ready for transaction routing
+        self.leader_schedule.precompute(self.current_epoch)
 
-        print(f"Node {self.node_id}: Leader for epoch {self.current_epoch} is Node {self.current_leader}")
+        self.log.info("Leader for epoch %s is Node %s", self.current_epoch, self.current_leader)
 
         # If the node is the leader, propose a block
         if self.current_leader == self.node_id:
             self.propose_block(self.current_epoch)
 
+    def run_async(self, target, *args):
+        """
+        Runs a task without blocking the caller, in a daemon thread so it ends with the program.
+
+        Broadcasts and transaction generation go through this method, which lets
+        alternative runtimes (such as the simulator) decide how tasks are executed.
+
+        :param target: callable - The function to run.
+        :param args: tuple - Positional arguments for the function.
+        """
+        threading.Thread(target=target, args=args, daemon=True).start()
+
+    def configure_seed(self, seed):
+        """Sets the seed for leader selection (and the development MAC keys) without starting the protocol."""
+        self.seed = seed
+        self.leader_schedule = LeaderSchedule(seed, self.total_nodes)
+        if self.keys is None:
+            self.keys = KeySet.derive(seed, self.total_nodes)  # Development keys when `mac_keys` is not configured
+
     def set_seed(self, seed):
         """Sets the seed for leader selection and starts the consensus protocol."""
-        self.seed = seed
+        self.configure_seed(seed)
         self.running = True  # Enable the protocol loop
         self.start()  # Start the thread (calls `run`)
 
     def run(self):
         """Main loop for the node's consensus protocol."""
+        self.create_scheduler()
         if not self.rejoin:
             # Wait for the designated start time
-            start_datetime = self.calculate_start_datetime(self.start_time)
-            self.wait_for_start(start_datetime)
+            self.scheduler.wait_for_epoch(self.scheduler.first_epoch)
+
+        self.restore_chain()
+        if self.rejoin:
+            self.recover_blockchain()
+
+        first_epoch = self.first_epoch_to_run()
+        if self.rejoin:
+            # Join at the next epoch boundary instead of replaying epochs that already passed
+            self.scheduler.wait_for_epoch(first_epoch)
+
+        for epoch in range(first_epoch, self.total_epochs + 1):
+            self.start_epoch(epoch)
+
+            # Wait for the absolute end of the epoch, so the work above does not shift later epochs.
+            # In optimistic mode the epoch ends as soon as its block is notarized, and 2Δ is only the timeout.
+            early_event = self.epoch_notarized if self.optimistic_responsiveness else None
+            self.end_epoch(epoch, self.scheduler.wait_for_epoch(epoch + 1, early_event))
+
+        # Display the final blockchain state
+        self.display_blockchain()
+        self.tracer.close()
+
+    def create_scheduler(self):
+        """
+        Anchors the epoch schedule to the shared start instant.
 
-        # Load the blockchain from a file (if available)
+        A rejoining node keeps the original anchor (even if it is in the past) so its epochs
+        line up with the others.
+        """
+        start_datetime = self.calculate_start_datetime(self.start_time, clamp=not self.rejoin)
+        self.scheduler = EpochScheduler(start_datetime.timestamp(), self.epoch_duration)
+        wait_seconds = self.scheduler.time_until(self.scheduler.first_epoch)
+        if not self.rejoin and wait_seconds > 0:
+            self.log.info("Waiting for %.3f seconds until start time %s.", wait_seconds, start_datetime)
+
+    def restore_chain(self):
+        """Loads the saved blockchain (if available) and adds the genesis block when needed."""
         self.load_blockchain()
+        if self.batch_store is not None:
+            # A rejoining node keeps serving (and proposing) the batches it stored before
+            if self.rejoin:
+                self.batch_store.load()
+            else:
+                self.batch_store.reset_file()
 
         if self.rejoin:
-            # Rejoining node: Recover its previous state
-            print(f"Node {self.node_id}: Recovering...")
+            # Rejoining node: its previous state is recovered next (`recover_blockchain`)
+            self.log.info("Recovering...")
             self.notarized_blocks[0] = self.genesis_block
-            self.blockchain.append(self.genesis_block)
-            self.recover_blockchain()
+            self.append_finalized([self.genesis_block])
         else:
             # New node: Start with the genesis block
             if not self.blockchain:
                 self.notarized_blocks[0] = self.genesis_block
-                self.blockchain.append(self.genesis_block)
+                self.append_finalized([self.genesis_block])
 
-        # Calculate the starting epoch based on the blockchain state
+    def first_epoch_to_run(self):
+        """
+        Returns the first epoch the node runs, based on the blockchain state.
+
+        :return: int - The epoch after the last saved block (for a rejoining node, at least the next epoch boundary).
+        """
         last_saved_epoch = max(block.epoch for block in self.blockchain) if self.blockchain else 0
         self.current_epoch = last_saved_epoch + 1
+        if self.rejoin:
+            self.current_epoch = max(self.current_epoch, self.scheduler.epoch_at() + 1)
+        return self.current_epoch
 
-        for epoch in range(self.current_epoch, self.total_epochs + 1):
-            self.current_epoch = epoch
-            print(f"==================================== Epoch {epoch} ====================================")
-            
-            # Determine the leader and propose a block if necessary
-            self.next_leader(self.seed)
+    def end_epoch(self, epoch, overrun):
+        """
+        Performs the work done once an epoch is over.
 
-            if self.is_confusion_active(epoch):
-                print(f"Node {self.node_id}: Entering confusion period during epoch {epoch}.")
-            else:
-                print(f"Node {self.node_id}: Normal operation during epoch {epoch}.")
+        :param epoch: int - The epoch that ended.
+        :param overrun: float - Seconds by which the epoch's work ran past its end.
+        """
+        self.metrics.observe("epoch_overrun_seconds", overrun)
+        if overrun > 0:
+            self.log.warning("Epoch %s overran its duration by %.3f seconds.", epoch, overrun)
 
-            # End of confusion period: Resolve forks in the blockchain
-            if epoch == self.confusion_start + self.confusion_duration - 1:
-                print(f"Node {self.node_id}: Ending confusion period. Resolving forks.")
-                self.resolve_forks()
+        # Save the blockchain to persistent storage
+        self.save_blockchain()
 
-            # Generate transactions for the epoch
-            threading.Thread(target=self.generate_transactions_for_epoch, args=(epoch,), daemon=True).start()
+    def start_epoch(self, epoch):
+        """
+        Performs the work done at the beginning of an epoch.
 
-            # Wait for the epoch duration
-            time.sleep(self.epoch_duration)
+        Selects the leader (proposing a block if it is this node), handles the
+        confusion period and starts the generation of the epoch's transactions.
 
-            # Save the blockchain to persistent storage
-            self.save_blockchain()
+        :param epoch: int - The epoch that is starting.
+        """
+        self.current_epoch = epoch
+        self.epoch_notarized.clear()
+        with self.lock:
+            # The block of this epoch may already have been notarized while the node was catching up
+            if self.notarized_blocks and max(self.notarized_blocks.keys()) >= epoch:
+                self.epoch_notarized.set()
+        self.log.info("==================================== Epoch %s ====================================", epoch)
+        
+        # Determine the leader and propose a block if necessary
+        self.next_leader(self.seed)
 
-        # Display the final blockchain state
-        self.display_blockchain()
+        # Seal this node's new transactions into a batch, which spreads during the epoch ahead of the proposals
+        if self.batch_store is not None:
+            self.batch_store.tick()
 
-    def calculate_start_datetime(self, start_time):
+        if self.is_confusion_active(epoch):
+            self.log.info("Entering confusion period during epoch %s.", epoch)
+        else:
+            self.log.debug("Normal operation during epoch %s.", epoch)
+
+        # End of confusion period: Resolve forks in the blockchain
+        if epoch == self.confusion_start + self.confusion_duration - 1:
+            self.log.info("Ending confusion period. Resolving forks.")
+            self.resolve_forks()
+
+        # Generate transactions for the epoch
+        if self.synthetic_transactions:
+            self.run_async(self.generate_transactions_for_epoch, epoch)
+
+    def calculate_start_datetime(self, start_time, clamp=True):
         """
-        Calculate the start datetime based on the provided start_time string in HH:MM format.
+        Calculate the start datetime based on the provided start_time string in HH:MM[:SS[.ffffff]] format,
+        or on a UNIX timestamp (as handed out by the launcher).
 
         This function computes the datetime at which the protocol should start by
         combining the current date with the provided start time. If the calculated
-        start time is earlier than the current time, the start is set to "now."
+        start time is earlier than the current time and `clamp` is set, the start is set to "now."
         """
         now = datetime.now()  # Get the current datetime
-        start_hour, start_minute = map(int, start_time.split(":"))  # Extract hour and minute from the input string
-        start_datetime = now.replace(hour=start_hour, minute=start_minute, second=0, microsecond=0)  # Set start time
+        if isinstance(start_time, (int, float)):
+            start_datetime = datetime.fromtimestamp(start_time)
+            if clamp and start_datetime < now:
+                self.log.warning("Start time %s has already passed; starting immediately.", start_datetime)
+                start_datetime = now
+            return start_datetime
+
+        parsed_time = datetime.strptime(start_time, "%H:%M:%S.%f" if "." in start_time else
+                                        "%H:%M:%S" if start_time.count(":") == 2 else "%H:%M")
+        start_datetime = now.replace(hour=parsed_time.hour, minute=parsed_time.minute,
+                                     second=parsed_time.second, microsecond=parsed_time.microsecond)  # Set start time
 
         # If the start time has already passed, begin immediately
-        if start_datetime < now:
+        if clamp and start_datetime < now:
+            self.log.warning("Start time %s has already passed; starting immediately.", start_datetime)
             start_datetime = now
         
         return start_datetime
@@ -176,11 +348,13 @@ class Node(threading.Thread):
         blocks from the notarized blocks. This ensures all nodes have a consistent
         view of the blockchain.
         """
-        print(f"Node {self.node_id}: Resolving forks after confusion.")
+        self.log.info("Resolving forks after confusion.")
 
-        # Collect all notarized blocks in order of their epochs
+        # Collect all notarized blocks in order of their epochs, after the finalized blocks below them
+        # (notarized blocks below the finalized tip are pruned)
         notarized_epochs = sorted(self.notarized_blocks.keys())
-        longest_chain = []
+        first_epoch = notarized_epochs[0] if notarized_epochs else float('inf')
+        longest_chain = [block for block in self.blockchain if block.epoch < first_epoch]
 
         # Construct the longest chain by iterating through notarized blocks
         for epoch in notarized_epochs:
@@ -188,24 +362,16 @@ class Node(threading.Thread):
             if block not in longest_chain:
                 longest_chain.append(block)
 
-        # Replace the local blockchain with the resolved chain
-        self.blockchain = longest_chain
-
-    def wait_for_start(self, start_datetime):
-        """
-        Wait until the specified start_datetime.
-
-        This function pauses the node's execution until the start time is reached.
-        If the start time has already passed, it starts immediately.
-        """
-        now = datetime.now()  # Get the current time
-        wait_seconds = (start_datetime - now).total_seconds()  # Calculate the time to wait in seconds
-
-        if wait_seconds > 0:
-            print(f"Waiting for {int(wait_seconds)} seconds until start time {start_datetime}.")
-            time.sleep(wait_seconds)  # Pause execution until the start time
-        else:
-            print(f"Start time {start_datetime} is now or has passed. Starting immediately.")
+        # Replace the local blockchain with the resolved chain, and the ledger state derived from it
+        with self.lock:
+            self.blockchain = longest_chain
+            self.ledger = LedgerState.rebuild(self.blockchain)
+            self.tx_index.rebuild(self.blockchain, self.notarized_blocks)
+            for pending_epoch, txs in self.pending_transactions.items():
+                for tx in txs:
+                    self.tx_index.add_pending(tx.tx_id, pending_epoch)
+            for listener in self.on_chain_replaced:
+                listener(self.blockchain)
 
     def propose_block(self, epoch):
         """
@@ -213,34 +379,69 @@ class Node(threading.Thread):
 
         This function creates a new block, initializes it with transactions, and broadcasts
         the proposal to the network. Only the current leader of the epoch performs this action.
+        The block policy picks the pending transactions of this epoch and earlier ones, oldest
+        first, within its limits; the others stay pending for the next leader. With batching,
+        it picks available batches instead, and the block references them by digest.
         """
         if epoch == 0:
-            print("Genesis block is already set; skipping proposal for epoch 0.")
+            self.log.debug("Genesis block is already set; skipping proposal for epoch 0.")
             return None
 
+        if self.tracer.enabled:
+            trace_started = Tracer.now()
+
         # Get the latest notarized block as the parent block
         previous_block = self.get_longest_notarized_chain()
         previous_hash = previous_block.hash if previous_block else b'1' * 20  # Use a placeholder hash if no parent exists
 
         # Lock to ensure thread-safe access to shared data
         with self.lock:
-            # Retrieve and prepare transactions for the new block
-            block_transactions = self.pending_transactions.get(epoch, []).copy()
-            new_block = Block(epoch, previous_hash, {tx.tx_id: tx for tx in block_transactions})
-            
-            # Clear pending transactions for the epoch after proposing
-            if epoch in self.pending_transactions:
-                del self.pending_transactions[epoch]
+            if self.batch_store is not None:
+                # Reference available batches by digest, except those already in the chain this block extends
+                chain = self.get_chain_to_block(previous_block) if previous_block else []
+                batches, deferred = self.batch_store.pack(self.block_policy, chain)
+                new_block = Block(epoch, previous_hash, {tx.tx_id: tx for batch in batches for tx in batch.transactions},
+                                  [batch.digest for batch in batches])
+            else:
+                # Retrieve the transactions still pending up to this epoch, oldest first
+                candidates = []
+                for pending_epoch in sorted(self.pending_transactions):
+                    if pending_epoch > epoch:
+                        break
+                    # Also forget transactions that reached a block without going through this pool (e.g. synced
+                    # blocks); pooled transactions are always indexed, so a missing entry was evicted with its block
+                    pending = [tx for tx in self.pending_transactions[pending_epoch]
+                               if (self.tx_index.lookup(tx.tx_id) or {}).get('state') == PENDING]
+                    if pending:
+                        self.pending_transactions[pending_epoch] = pending
+                    else:
+                        del self.pending_transactions[pending_epoch]
+                    candidates.extend(pending)
+                block_transactions, deferred = self.block_policy.pack(candidates)
+                new_block = Block(epoch, previous_hash, {tx.tx_id: tx for tx in block_transactions})
+
+                # Remove the proposed transactions from the pool; the ones that did not fit stay pending
+                self.remove_pending(tx.tx_id for tx in block_transactions)
+            self.block_policy.proposed(new_block, deferred)
+
+        # Proposal time is the reference point of the block's latency metrics
+        self.block_seen_at[new_block.hash] = (epoch, time.monotonic())
+        self.metrics.inc("blocks_proposed")
+        if self.tracer.enabled:
+            trace_id = self.block_trace_ids.setdefault(new_block.hash, Tracer.new_trace_id())
+            self.tracer.span("propose", trace_id, trace_started, epoch=epoch, transactions=len(new_block.transactions))
 
         # Display details of the proposed block
-        print(f"Node {self.node_id} proposes Block: {new_block.hash.hex()} with previous hash {previous_hash.hex()} and transactions {list(new_block.transactions.keys())}")
+        self.log.debug("Proposes Block: %s with previous hash %s and transactions %s",
+                       new_block.hash, previous_hash, new_block.transactions.keys())
         
         # Vote on the proposed block
         self.vote_on_block(new_block)
 
         # Create and broadcast a "Propose" message to the network
         propose_message = Message.create_propose_message(new_block, self.node_id)
-        threading.Thread(target=self.broadcast_message, args=(propose_message,), daemon=True).start()
+        propose_message.trace_id = self.block_trace_ids.get(new_block.hash)
+        self.run_async(self.broadcast_message, propose_message)
 
     def vote_on_block(self, block):
         """
@@ -248,15 +449,31 @@ class Node(threading.Thread):
 
         This function checks whether the proposed block is valid and extends the chain.
         If so, it casts a vote and broadcasts the vote to other nodes in the network.
+        With batching, the vote waits until the node stores the block's batches.
         """
+        self.first_seen(block)
+        block = self.blocks_by_hash.setdefault(block.hash, block)  # Batches fill in the node's own instance
+        if self.tracer.enabled:
+            trace_started = Tracer.now()
+
         # Get the longest notarized chain's latest block
         longest_notarized_block = self.get_longest_notarized_chain()
         if longest_notarized_block and block.epoch <= longest_notarized_block.epoch:
             return  # Do not vote on older or same-epoch blocks
 
+        # Only vote for a block whose transactions are available; the vote resumes once its batches arrive
+        if self.batch_store is not None and not self.batch_store.ensure(block, self.leader_of(block.epoch), vote=True):
+            return
+
         with self.lock:
             block_hash = block.hash.hex()
 
+            # Epochs may start early in optimistic mode, so never vote for two blocks of the same epoch
+            if self.optimistic_responsiveness:
+                if block.epoch in self.voted_epochs and self.node_id not in self.voted_senders.get(block_hash, ()):
+                    return
+                self.voted_epochs.add(block.epoch)
+
             # Initialize vote counts and voted senders if not already present
             if block_hash not in self.vote_counts:
                 self.vote_counts[block_hash] = 0
@@ -267,26 +484,81 @@ class Node(threading.Thread):
             if self.node_id not in self.voted_senders[block_hash]:
                 self.vote_counts[block_hash] += 1
                 self.voted_senders[block_hash].add(self.node_id)
-                print(f"Node {self.node_id} voted for the proposed Block")
+                mac = self.keys.mac(self.node_id, block.hash, block.epoch) if self.keys else None
+                self.record_vote(block, self.node_id, mac)
+                self.log.debug("Voted for the proposed Block %s", block.hash)
             else:
                 return  # Skip voting again
 
         # Broadcast the vote to other nodes
-        vote_message = Message.create_vote_message(block, self.node_id)
-        threading.Thread(target=self.broadcast_message, args=(vote_message,), daemon=True).start()
+        vote_message = Message.create_vote_message(block, self.node_id, mac)
+        vote_message.trace_id = self.block_trace_ids.get(block.hash)
+        self.run_async(self.broadcast_message, vote_message)
+        if self.tracer.enabled:
+            self.tracer.span("vote", vote_message.trace_id, trace_started, epoch=block.epoch)
 
         # Check if the block meets the criteria for notarization
         self.notarize_block(block)
 
+    def first_seen(self, block):
+        """
+        Returns the monotonic time this node first saw a block, the reference of its latency metrics.
+
+        Blocks at or below the finalized tip are not tracked (their entries are pruned when the
+        tip moves past them), so late messages about them get no latency samples.
+
+        :param block: Block - The block.
+        :return: float - The `time.monotonic()` value at which the block was first seen, or None below the finalized tip.
+        """
+        seen = self.block_seen_at.get(block.hash)
+        if seen is not None:
+            return seen[1]
+        blockchain = self.blockchain
+        if blockchain and block.epoch <= blockchain[-1].epoch:
+            return None
+        return self.block_seen_at.setdefault(block.hash, (block.epoch, time.monotonic()))[1]
+
+    def verify_vote(self, block, sender, mac):
+        """
+        Checks the MAC of another node's vote.
+
+        :param block: Block - The block voted for.
+        :param sender: int - The voter.
+        :param mac: bytes - The MAC carried by the VOTE message.
+        :return: bool - True if the vote is authentic (always True when no keys are set).
+        """
+        return self.keys is None or self.keys.verify(sender, block.hash, block.epoch, mac)
+
+    def record_vote(self, block, sender, mac):
+        """
+        Adds a vote to the notarization certificate of its block.
+
+        :param block: Block - The block voted for.
+        :param sender: int - The voter.
+        :param mac: bytes - The MAC of the vote (None when no keys are set).
+        """
+        if mac is None:
+            return
+        certificate = self.certificates.get(block.hash)
+        if certificate is None:
+            certificate = self.certificates.setdefault(block.hash, NotarizationCertificate(block.hash, block.epoch))
+        certificate.add_vote(sender, mac)
+
     def notarize_block(self, block):
         """
         Notarizes a block if it receives more than n/2 votes, and notifies other nodes.
 
         This function validates that a block has received sufficient votes to be
         notarized. If so, it updates the node's state and processes related transactions.
+        With batching, the notarization waits until the node stores the block's batches.
         """
         with self.lock:
             block_hash = block.hash.hex()
+            block = self.blocks_by_hash.setdefault(block.hash, block)
+
+            # Blocks at or below the finalized tip can no longer join the chain (their state is pruned)
+            if self.blockchain and block.epoch <= self.blockchain[-1].epoch:
+                return
 
             # Skip if the block is already notarized
             if block.epoch in self.notarized_blocks and self.notarized_blocks[block.epoch].hash == block.hash:
@@ -294,64 +566,176 @@ class Node(threading.Thread):
 
             # Notarize if vote count exceeds quorum (n/2)
             if self.vote_counts.get(block_hash, 0) > self.total_nodes // 2:
-                self.notarized_blocks[block.epoch] = block
-                print(f"Node {self.node_id}: Block {block_hash} notarized in epoch {block.epoch} with transactions {list(block.transactions.keys())}")
-
-                # Add transaction IDs to the notarized set
-                for tx_id in block.transactions.keys():
-                    self.notarized_tx_ids.add(tx_id)
+                if self.batch_store is not None and not self.batch_store.ensure(block, self.leader_of(block.epoch)):
+                    return  # Resumed by the batch store once the batches arrive
+                seen = self.block_seen_at.get(block.hash)
+                if seen is not None:
+                    latency = time.monotonic() - seen[1]
+                    self.metrics.observe("propose_to_notarize_seconds", latency)
+                    self.metrics.record_epoch("propose_to_notarize_seconds", block.epoch, latency)
+                self.metrics.inc("blocks_notarized")
+                if self.tracer.enabled:
+                    self.tracer.event("notarize", self.block_trace_ids.get(block.hash), epoch=block.epoch,
+                                      votes=self.vote_counts.get(block_hash, 0))
+                self.log.debug("Block %s notarized in epoch %s with transactions %s",
+                               block.hash, block.epoch, block.transactions.keys())
+
+                self.add_notarized(block)
 
                 # Attempt to finalize blocks
                 self.finalize_blocks()
 
+                # Let the epoch loop advance early once the current epoch has a notarized block
+                if self.optimistic_responsiveness and block.epoch >= self.current_epoch:
+                    self.epoch_notarized.set()
+
+    def add_notarized(self, block):
+        """
+        Records a block as notarized. Callers hold `self.lock`, and attempt to finalize blocks next.
+
+        :param block: Block - The block, notarized by this node's votes or by a verified certificate.
+        """
+        self.notarized_blocks[block.epoch] = block
+
+        # Record the block's transactions as notarized, and drop them from the pool
+        self.remove_pending(block.transactions)
+        self.tx_index.add_block(block, NOTARIZED)
+        for listener in self.on_notarized:
+            listener(block)
+
     def finalize_blocks(self):
         """
-        Finalizes blocks when three consecutive notarized blocks are observed.
+        Finalizes blocks when three notarized blocks of consecutive epochs form a chain.
 
         This ensures the blockchain's immutability by finalizing blocks that are unlikely
-        to be replaced.
+        to be replaced. Only blocks above the finalized tip can be finalized, so the scan
+        starts at the tip, and it goes newest first: finalizing a block also finalizes the
+        lower blocks of its chain.
         """
-        notarized_epochs = sorted(self.notarized_blocks.keys())
+        tip = self.blockchain[-1] if self.blockchain else None
+        tip_epoch = tip.epoch if tip else -1
+        notarized_epochs = sorted(epoch for epoch in self.notarized_blocks if epoch >= tip_epoch)
+        unlinked = set()  # Hashes of blocks whose chain does not reach the finalized tip (each is walked once)
+
+        for i in range(len(notarized_epochs) - 1, 1, -1):
+            # Check for three consecutive notarized epochs whose blocks extend one another
+            first, second, third = (self.notarized_blocks[epoch] for epoch in notarized_epochs[i - 2:i + 1])
+            if (third.epoch == second.epoch + 1 and second.epoch == first.epoch + 1 and
+                third.previous_hash == second.hash and second.previous_hash == first.hash):
 
-        for i in range(2, len(notarized_epochs)):
-            # Check for three consecutive notarized epochs
-            if (notarized_epochs[i] == notarized_epochs[i - 1] + 1 and
-                notarized_epochs[i - 1] == notarized_epochs[i - 2] + 1):
-                
                 # Finalize the middle block in the sequence
-                second_epoch = notarized_epochs[i - 1]
-                finalized_block = self.notarized_blocks[second_epoch]
+                finalized_block = second
 
-                if finalized_block not in self.blockchain:
-                    print(f"Node {self.node_id}: Finalizing Block {finalized_block.hash.hex()} in epoch {finalized_block.epoch}")
-                    
-                    # Add the finalized block and its parent chain to the blockchain
+                if ((not self.blockchain or finalized_block.epoch > self.blockchain[-1].epoch) and
+                        finalized_block.hash not in unlinked):
+                    # Add the finalized block and its parent chain to the blockchain, but only once the
+                    # whole chain back to the finalized tip is known: a gap would finalize blocks out of order
                     chain = self.get_chain_to_block(finalized_block)
-                    self.blockchain.extend(chain)
-        
+                    if self.blockchain and chain[0].previous_hash != self.blockchain[-1].hash:
+                        unlinked.update(block.hash for block in chain)
+                        continue
+                    # Ancestors only seen in proposals may still miss their batches (fetched meanwhile)
+                    if self.batch_store is not None and not all(
+                            [self.batch_store.ensure(block, self.leader_of(block.epoch)) for block in chain]):
+                        continue
+
+                    self.log.debug("Finalizing Block %s in epoch %s", finalized_block.hash, finalized_block.epoch)
+                    self.append_finalized(chain)
+
+                    now = time.monotonic()
+                    for block in chain:
+                        seen = self.block_seen_at.pop(block.hash, None)
+                        if seen is not None:
+                            self.metrics.observe("propose_to_finalize_seconds", now - seen[1])
+                            self.metrics.record_epoch("propose_to_finalize_seconds", block.epoch, now - seen[1])
+                        trace_id = self.block_trace_ids.pop(block.hash, None)
+                        if self.tracer.enabled:
+                            self.tracer.event("finalize", trace_id, epoch=block.epoch)
+                    self.metrics.inc("blocks_finalized", len(chain))
+
+        if self.blockchain and self.blockchain[-1] is not tip:
+            self.prune_below_tip()
+
+    def prune_below_tip(self):
+        """
+        Forgets the consensus state of the blocks below the finalized tip. Callers hold `self.lock`.
+
+        Votes and notarizations below the tip can no longer change the finalized chain, and keeping
+        them would make the work of every epoch grow with the length of the run. The tip stays
+        notarized (the next finalized block links to it), and finalized blocks keep their
+        certificates, which are saved with the chain and served to recovering nodes.
+        """
+        tip_epoch = self.blockchain[-1].epoch
+        for epoch in [epoch for epoch in self.notarized_blocks if epoch < tip_epoch]:
+            del self.notarized_blocks[epoch]
+        self.voted_epochs.difference_update([epoch for epoch in self.voted_epochs if epoch < tip_epoch])
+
+        # Blocks at or below the finalized tip (forks included) no longer get latency samples
+        for block_hash, (epoch, _) in list(self.block_seen_at.items()):
+            if epoch <= tip_epoch:
+                self.block_seen_at.pop(block_hash, None)
+
+        stale = [block for block in list(self.blocks_by_hash.values()) if block.epoch < tip_epoch]
+        if not stale:
+            return
+        lowest_epoch = min(block.epoch for block in stale)
+        finalized = set()  # Hashes of the finalized blocks among the stale ones (the chain is walked back from the tip)
+        for block in reversed(self.blockchain):
+            if block.epoch < lowest_epoch:
+                break
+            finalized.add(block.hash)
+        for block in stale:
+            self.blocks_by_hash.pop(block.hash, None)
+            self.vote_counts.pop(block.hash.hex(), None)
+            self.voted_senders.pop(block.hash.hex(), None)
+            self.block_trace_ids.pop(block.hash, None)
+            if block.hash not in finalized:
+                self.certificates.pop(block.hash, None)
+
+    def append_finalized(self, blocks):
+        """
+        Appends blocks to the finalized chain and applies them to the ledger state and transaction index.
+
+        Every extension of the finalized chain goes through this method, so the ledger state,
+        the transaction index and the commit listeners always follow the chain. Callers hold
+        `self.lock` (except during startup, before any other thread runs).
+
+        :param blocks: list - The newly finalized blocks, in chain order.
+        """
+        self.blockchain.extend(blocks)
+        self.ledger.apply_blocks(blocks)
+        for block in blocks:
+            self.tx_index.add_block(block, FINALIZED)
+        for listener in self.on_finalized:
+            listener(blocks)
+
     def get_chain_to_block(self, block):
         """
         Constructs the chain leading to the given block.
 
-        This method traces back through the blockchain from the specified block to 
-        the genesis block or an already finalized block in the node's blockchain.
+        This method traces back through the blocks this node has seen, by hash, from the
+        specified block to the genesis block or the tip of the node's finalized blockchain.
+        A notarized block implies its ancestors were notarized, so they need not have been
+        notarized locally. The walk stops early at a parent this node has never seen.
 
         :param block: Block - The block to trace back from.
         :return: list - A list of blocks forming the chain up to the specified block.
         """
         chain = []
         current_block = block
+        tip_epoch = self.blockchain[-1].epoch if self.blockchain else -1
 
-        # Traverse back through the notarized blocks
-        while current_block and current_block not in self.blockchain:
-            # Insert the current block at the beginning of the chain
-            chain.insert(0, current_block)
+        # Traverse back through the known blocks, down to the finalized tip
+        while current_block and current_block.epoch > tip_epoch:
+            chain.append(current_block)
 
             # Find the parent block using the previous hash
-            current_block = next(
-                (b for b in self.notarized_blocks.values() if b.hash == current_block.previous_hash), None
-            )
-        
+            parent = self.notarized_blocks.get(current_block.epoch - 1)
+            if parent is None or parent.hash != current_block.previous_hash:
+                parent = self.blocks_by_hash.get(current_block.previous_hash)
+            current_block = parent
+
+        chain.reverse()
         return chain
 
     def get_longest_notarized_chain(self):
@@ -373,8 +757,11 @@ class Node(threading.Thread):
         """
         Adds a transaction to the list of pending transactions for the next epoch.
 
+        It stays pending until a block holding it is notarized: a leader proposes the pending
+        transactions of its epoch and all earlier ones, so a transaction that reaches a node after
+        the next leader proposed (e.g. a late echo of a client transaction) waits for a later leader.
         Ensures the transaction is unique and not already included in the blockchain,
-        notarized blocks, or pending transactions.
+        notarized blocks, or pending transactions (a single lookup in the transaction index).
 
         :param transaction: Transaction - The transaction to add.
         :param epoch: int - The current epoch.
@@ -386,65 +773,78 @@ class Node(threading.Thread):
             if next_epoch not in self.pending_transactions:
                 self.pending_transactions[next_epoch] = []
 
-            # Check if the transaction is already in the blockchain
-            for block in self.blockchain:
-                if transaction.tx_id in block.transactions:
-                    return
-
-            # Check if the transaction is already notarized
-            if transaction.tx_id in self.notarized_tx_ids:
+            # Skip transactions that are already pending, notarized or finalized
+            if not self.tx_index.add_pending(transaction.tx_id, next_epoch):
                 return
 
-            # Check if the transaction is already in pending transactions
-            for txs in self.pending_transactions.values():
-                if any(tx.tx_id == transaction.tx_id for tx in txs):
-                    return
-
             # Add the transaction to the pending list for the next epoch
             self.pending_transactions[next_epoch].append(transaction)
 
+    def remove_pending(self, tx_ids):
+        """
+        Removes transactions from the pool of pending transactions.
+
+        Callers hold `self.lock`. The transaction index gives the epoch under which each
+        pending transaction is kept, so only those epochs' lists are filtered.
+
+        :param tx_ids: iterable - IDs of the transactions to remove.
+        """
+        removed = {}  # Maps a pending epoch to the IDs to remove from it
+        for tx_id in tx_ids:
+            entry = self.tx_index.lookup(tx_id)
+            if entry is not None and entry['state'] == PENDING:
+                removed.setdefault(entry['epoch'], set()).add(tx_id)
+        for pending_epoch, ids in removed.items():
+            remaining = [tx for tx in self.pending_transactions.get(pending_epoch, []) if tx.tx_id not in ids]
+            if remaining:
+                self.pending_transactions[pending_epoch] = remaining
+            else:
+                self.pending_transactions.pop(pending_epoch, None)
+
     def get_next_tx_id(self):
         """
         Generates a globally unique transaction ID.
 
-        This method ensures that each transaction ID is unique across the node.
+        IDs are interleaved across nodes (`counter * total_nodes + node_id`), so transactions
+        created by different nodes never share an ID and are not dropped as duplicates.
 
         :return: int - The next available transaction ID.
         """
         with self.tx_id_lock:
             self.global_tx_id += 1
-            return self.global_tx_id
+            return self.global_tx_id * self.total_nodes + self.node_id
 
     def generate_random_transaction_for_epoch(self, epoch):
         """
         Creates and broadcasts a random transaction for the given epoch.
 
         This method generates a random transaction with random sender, receiver,
-        and amount, then sends it to a randomly selected node.
+        and amount, then routes it to the leader of the epoch that will include it.
 
         :param epoch: int - The epoch for which the transaction is generated.
         """
-        sender = f"Client{random.randint(1, 100)}"  # Random sender
-        receiver = f"Client{random.randint(1, 100)}"  # Random receiver
-        amount = random.randint(1, 1000)  # Random amount
+        sender = f"Client{self.rng.randint(1, 100)}"  # Random sender
+        receiver = f"Client{self.rng.randint(1, 100)}"  # Random receiver
+        amount = self.rng.randint(1, 1000)  # Random amount
 
         # Generate a unique transaction ID
         tx_id = self.get_next_tx_id()
         transaction = Transaction(tx_id, sender, receiver, amount)
 
-        # Select a random target node
-        target_id = random.randint(0, self.total_nodes - 1)
+        # With batching, every node disseminates its own transactions in batches
+        if self.batch_store is not None:
+            self.batch_store.add_local([transaction], self.current_epoch)
+            return
+
+        # Route the transaction to the leader of the next epoch, which proposes the block holding it
+        target_id = self.leader_of(self.current_epoch + 1)
         if target_id == self.node_id:
             # Add the transaction to the current node's pending transactions
             self.add_transaction(transaction, self.current_epoch)
 
             # Broadcast an ECHO message to notify the network
             echo_message = Message.create_echo_transaction_message(transaction, epoch, self.node_id)
-            threading.Thread(
-                target=self.broadcast_message,
-                args=(echo_message,),
-                daemon=True  # Use daemon thread so it ends with the program
-            ).start()
+            self.run_async(self.broadcast_message, echo_message)
 
     def generate_transactions_for_epoch(self, epoch):
         """
@@ -452,7 +852,7 @@ class Node(threading.Thread):
 
         :param epoch: int - The epoch for which transactions are to be generated.
         """
-        num_transactions = random.randint(1, 3)  # Generate 1 to 3 transactions
+        num_transactions = self.rng.randint(1, 3)  # Generate 1 to 3 transactions
         for _ in range(num_transactions):
             self.generate_random_transaction_for_epoch(epoch)
 
@@ -469,31 +869,31 @@ class Node(threading.Thread):
         """
         Broadcasts a message to all other nodes in the network.
 
-        If confusion is active, the message may be delayed, dropped, or altered
-        to simulate network issues.
+        Network impairments (such as the confusion period) are applied by the transport's
+        emulation layer (see netem.py), so broadcasting never sleeps.
 
         :param message: Message - The message to broadcast.
         """
+        if self.tracer.enabled:
+            trace_started = Tracer.now()
         serialized_message = message.serialize()
+        encoded = {}  # Encodings of the message by codec, shared by the peers that use the same one
         for target_port in self.ports:
             if target_port != self.port:  # Skip broadcasting to itself
                 try:
-                    # Simulate confusion with dropped or delayed messages
-                    if self.is_confusion_active(self.current_epoch):
-                        if random.random() < 0.2:  # 20% chance to drop the message
-                            continue
-                        if random.random() < 0.3:  # 30% chance to delay the message
-                            delay = random.uniform(1, 3)
-                            time.sleep(delay)
-
-                    # Send the message over a socket
-                    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                        s.connect(('localhost', target_port))
-                        s.sendall(serialized_message)
+                    # Send the message through the configured transport
+                    payload = self.compressor.encode(serialized_message, target_port, encoded)
+                    self.transport.send(target_port, payload)
+                    self.metrics.inc("messages_sent", type=message.type)
+                    self.metrics.inc("bytes_sent", len(payload), type=message.type)
                 except ConnectionRefusedError:
-                    print(f"Node {self.node_id} could not connect to Node at port {target_port}")
+                    self.log.warning("Could not connect to Node at port %s", target_port)
+                    self.metrics.inc("messages_send_failed", type=message.type)
                 except Exception as e:
-                    print(f"Node {self.node_id} encountered an error while broadcasting to port {target_port}: {e}")
+                    self.log.error("Encountered an error while broadcasting to port %s: %s", target_port, e)
+                    self.metrics.inc("messages_send_failed", type=message.type)
+        if self.tracer.enabled:
+            self.tracer.span("broadcast", message.trace_id, trace_started, type=message.type, bytes=len(serialized_message))
 
     def send_message_to_port(self, target_port, message):
         """
@@ -503,11 +903,14 @@ class Node(threading.Thread):
         :param message: Message - The message to send.
         """
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect(('localhost', target_port))  # Establish a connection
-                s.sendall(message.serialize())  # Send the serialized message
+            serialized_message = message.serialize()
+            payload = self.compressor.encode(serialized_message, target_port)
+            self.transport.send(target_port, payload)
+            self.metrics.inc("messages_sent", type=message.type)
+            self.metrics.inc("bytes_sent", len(payload), type=message.type)
         except Exception as e:
-            print(f"Node {self.node_id}: Error sending {message.type} to port {target_port}: {e}")
+            self.log.error("Error sending %s to port %s: %s", message.type, target_port, e)
+            self.metrics.inc("messages_send_failed", type=message.type)
 
     def save_blockchain(self):
         """
@@ -530,6 +933,11 @@ class Node(threading.Thread):
                 "transactions": [],  # Initialize an empty list for transactions
                 "hash": block.hash.hex()  # Convert block's hash to hex string
             }
+            if block.batch_digests is not None:
+                serialized_block["batch_digests"] = [digest.hex() for digest in block.batch_digests]  # Bound by the block hash
+            certificate = self.certificates.get(block.hash)
+            if certificate is not None:
+                serialized_block["certificate"] = certificate.to_dict()  # Votes that notarized the block
 
             # Serialize each transaction in the block
             for tx_id, tx in block.transactions.items():
@@ -539,6 +947,8 @@ class Node(threading.Thread):
                     "receiver": tx.receiver,  # Receiver's name
                     "amount": tx.amount  # Amount being transferred
                 }
+                if tx.payload:
+                    serialized_transaction["payload"] = tx.payload  # Optional opaque data
                 # Add the serialized transaction to the block's transaction list
                 serialized_block["transactions"].append(serialized_transaction)
 
@@ -550,7 +960,54 @@ class Node(threading.Thread):
             with open(file_name, 'w') as f:
                 json.dump(blockchain_data, f, indent=4)  # Save with indentation for readability
         except Exception as e:
-            print(f"Node {self.node_id}: Error saving blockchain to file: {e}")
+            self.log.error("Error saving blockchain to file: %s", e)
+
+        self.save_checkpoint()
+
+    def save_checkpoint(self):
+        """
+        Saves the ledger state and the transaction index to `checkpoint_<node_id>.json`.
+
+        Only a snapshot is taken under the lock, so it matches a single chain height; the
+        serialization, which grows with the ledger history, runs outside it. The file is replaced
+        atomically, so a crash never leaves a partial checkpoint.
+        """
+        file_name = f"checkpoint_{self.node_id}.json"
+        with self.lock:
+            ledger = self.ledger.snapshot()
+            tx_index = self.tx_index.to_dict()  # Entries are replaced, never changed in place
+        data = json.dumps({'ledger': LedgerState.snapshot_to_dict(ledger), 'tx_index': tx_index})
+        try:
+            with open(file_name + ".tmp", 'w') as f:
+                f.write(data)
+            os.replace(file_name + ".tmp", file_name)
+        except OSError as e:
+            self.log.error("Error saving checkpoint to file: %s", e)
+
+    def load_checkpoint(self):
+        """
+        Restores the ledger state and transaction index of the loaded chain from `checkpoint_<node_id>.json`.
+
+        The checkpoint is only used if it was taken at the current tip of the chain; otherwise the
+        ledger state and the index are rebuilt from the chain.
+        """
+        file_name = f"checkpoint_{self.node_id}.json"
+        tip = self.blockchain[-1].hash.hex() if self.blockchain else None
+        try:
+            with open(file_name, 'r') as f:
+                checkpoint = json.load(f)
+            ledger = LedgerState.from_dict(checkpoint['ledger'])
+            if ledger.height == len(self.blockchain) and ledger.last_hash == tip:
+                self.ledger = ledger
+                self.tx_index = TransactionIndex.from_dict(checkpoint['tx_index'], self.tx_index.retention)
+                return
+            self.log.info("Checkpoint does not match the saved blockchain; rebuilding the ledger state.")
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError) as e:
+            self.log.error("Error loading checkpoint from file: %s", e)
+        self.ledger = LedgerState.rebuild(self.blockchain)
+        self.tx_index.rebuild(self.blockchain, self.notarized_blocks)
 
     def load_blockchain(self):
         """
@@ -578,21 +1035,27 @@ class Node(threading.Thread):
                             tx_id=tx["tx_id"],
                             sender=tx["sender"],
                             receiver=tx["receiver"],
-                            amount=tx["amount"]
+                            amount=tx["amount"],
+                            payload=tx.get("payload", "")
                         )
                         for tx in block_data["transactions"]  # Deserialize each transaction
-                    }
+                    },
+                    batch_digests=[bytes.fromhex(digest) for digest in block_data["batch_digests"]]
+                    if "batch_digests" in block_data else None  # Batches the block references, if any
                 )
                 blockchain.append(block)  # Add the reconstructed block to the list
+                if "certificate" in block_data:
+                    self.certificates[block.hash] = NotarizationCertificate.from_dict(block_data["certificate"])
 
             # Update the node's blockchain and notarized blocks
             self.blockchain = blockchain
-            self.notarized_blocks = {block.epoch: block for block in self.blockchain}
+            self.notarized_blocks = {blockchain[-1].epoch: blockchain[-1]} if blockchain else {}  # The tip (see `prune_below_tip`)
+            self.load_checkpoint()
 
         except FileNotFoundError:
-            print(f"Node {self.node_id}: No saved blockchain file found.")
+            self.log.info("No saved blockchain file found.")
         except Exception as e:
-            print(f"Node {self.node_id}: Error loading blockchain from file: {e}")
+            self.log.error("Error loading blockchain from file: %s", e)
 
     def recover_blockchain(self):
         """
@@ -623,6 +1086,8 @@ class Node(threading.Thread):
             if time.time() - start_time > 15:  # Stop waiting after 15 seconds
                 break
             time.sleep(0.1)
+        self.metrics.set("recovery_duration_seconds", time.time() - start_time)
+        self.metrics.set("recovery_completed", int(self.recovery_completed))
 
         # Update the current epoch to one beyond the highest recovered epoch
         self.current_epoch = max(block.epoch for block in self.blockchain) + 1 if self.blockchain else 1
@@ -634,6 +1099,8 @@ class Node(threading.Thread):
         Iterates through each block and its transactions, printing their details
         to the console. This method helps visualize the state of the blockchain.
         """
+        logger.flush()  # Print the report after any pending log records
+
         if not self.blockchain:
             print(f"Node {self.node_id}: Blockchain is empty.")
             return
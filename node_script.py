@@ -1,71 +1,87 @@
+import asyncio
 from datetime import datetime, timedelta
 import json
-import random
 import socket
 import sys
 import threading
 import time
 from block import Block
+from certificate import verify_blocks
+from client_api import ClientAPIServer
 from message import Message, MessageType
+import logger
+from metrics import MetricsDumper, MetricsServer
+from tracing import SamplingProfiler, Tracer
+from netem import NetworkEmulator
 from node import Node
+from subscription import SubscriptionServer
 from transaction import Transaction
+from transport import create_transport
 
 
-def handle_incoming_messages(sock, node):
+def handle_incoming_messages(listener, node):
     """
     Listens for and processes incoming messages from other nodes.
 
-    :param sock: socket.socket - The socket on which the node listens for connections.
+    :param listener: object - The transport's listener for this node (see transport.py).
     :param node: Node - The current node instance.
     """
+    threading.Thread(target=process_message_queue, args=(node,), daemon=True).start()
     while True:
-        conn, _ = sock.accept()  # Accept incoming connections
-        with conn:
-            # Extract transaction IDs from the blockchain and notarized sets
-            blockchain_tx_ids = set()
-            for block in node.blockchain:
-                blockchain_tx_ids.update(block.transactions.keys())
-            
-            notarized_tx_ids = node.notarized_tx_ids
-
-            # Deserialize the incoming message
-            message = Message.deserialize_from_socket(conn, blockchain_tx_ids, notarized_tx_ids)
-            if message is None:
-                print(f"Deserialization failed in Node {node.node_id}. Ignoring message.")
-                continue
-            
-            # Add the message to the processing queue
-            with node.message_queue_lock:
-                node.message_queue.append(message)
-
-            # Start a thread to process the message queue
-            threading.Thread(target=process_message_queue, args=(node,), daemon=True).start()
+        data = listener.receive()  # Wait for the next message
+        if data is None:
+            return  # The listener was closed
+        if not data:
+            node.log.warning("No data received from socket.")
+            continue
+
+        # Drop stale and duplicate messages from their header, before decoding the body
+        if not node.message_filter.admit(data):
+            continue
+        data = node.compressor.decode(data)  # Also learns which codecs the sender accepts
+        if data is None:
+            node.metrics.inc("messages_invalid")
+            continue
+
+        # Deserialize the incoming message
+        if node.tracer.enabled:
+            trace_started = Tracer.now()
+        message = Message.deserialize(data)
+        if message is None:
+            node.log.warning("Deserialization failed. Ignoring message.")
+            node.metrics.inc("messages_invalid")
+            continue
+        node.metrics.inc("messages_received", type=message.type)
+        node.metrics.inc("bytes_received", message.size, type=message.type)
+        if node.tracer.enabled:
+            node.tracer.span("deserialize", message.trace_id, trace_started, type=message.type, bytes=message.size)
+            message.queued_at = Tracer.now()
+
+        # Add the message to the processing queue
+        with node.message_queue_ready:
+            node.message_queue.append(message)
+            node.message_queue_ready.notify()
 
 def process_message_queue(node):
     """
-    Processes messages from the node's message queue.
+    Processes messages from the node's message queue, in arrival order.
 
-    This function handles message ordering and delays during confusion periods.
+    A single thread per node runs this loop; it sleeps until a message is queued. Delays and
+    reordering of the confusion period are emulated by the network layer (see netem.py).
 
     :param node: Node - The current node instance.
     """
     while True:
-        with node.message_queue_lock:
-            if node.message_queue:
-                if node.is_confusion_active(node.current_epoch):
-                    # Simulate delays and reordering during confusion
-                    if random.random() < 0.5:  # 50% chance to delay processing
-                        print(f"Node {node.node_id}: Delaying message processing during confusion.")
-                        time.sleep(random.uniform(0.5, 2))
-                    else:  # Simulate reordering
-                        message = node.message_queue.pop(0)
-                        node.message_queue.append(message)
-                        print(f"Node {node.node_id}: Reordered message queue during confusion.")
-                else:
-                    # Process the first message in the queue
-                    message = node.message_queue.pop(0)
-                    threading.Thread(target=process_message, args=(node, message), daemon=True).start()
-        time.sleep(0.1)  # Prevent CPU overutilization
+        with node.message_queue_ready:
+            while not node.message_queue:
+                node.message_queue_ready.wait()
+            message = node.message_queue.popleft()
+        if node.tracer.enabled and hasattr(message, 'queued_at'):
+            node.tracer.span("queue", message.trace_id, message.queued_at, type=message.type)
+        try:
+            process_message(node, message)
+        except Exception as e:
+            node.log.error("Error processing %s from %s: %s", message.type, message.sender, e)
 
 def process_message(node, message):
     """
@@ -74,6 +90,10 @@ def process_message(node, message):
     :param node: Node - The current node instance.
     :param message: Message - The message to process.
     """
+    if node.tracer.enabled and message.trace_id and message.type in (MessageType.PROPOSE, MessageType.VOTE):
+        # Follow the block's trace on this node as well
+        node.block_trace_ids.setdefault(message.content.hash, message.trace_id)
+
     if message.type == MessageType.PROPOSE:
         # Handle a proposed block
         block = message.content
@@ -85,7 +105,24 @@ def process_message(node, message):
         block_hash = block.hash.hex()
         sender_id = message.sender
 
-        print(f"Node {node.node_id}: Received Vote from Node {sender_id}")
+        node.log.debug("Received Vote from Node %s", sender_id)
+
+        # Votes at or below the finalized tip no longer matter (their tallies are pruned)
+        blockchain = node.blockchain
+        if blockchain and block.epoch <= blockchain[-1].epoch:
+            return
+
+        # Only count authentic votes, and keep their MACs as the block's notarization certificate
+        if not node.verify_vote(block, sender_id, message.mac):
+            node.log.warning("Rejected Vote from Node %s with an invalid MAC", sender_id)
+            node.metrics.inc("votes_rejected")
+            return
+        node.record_vote(block, sender_id, message.mac)
+
+        # Vote arrival skew: time between this node first seeing the block and this vote
+        seen_at = node.first_seen(block)
+        if seen_at is not None:
+            node.metrics.observe("vote_arrival_skew_seconds", time.monotonic() - seen_at)
 
         # Update vote tracking
         if block_hash not in node.vote_counts:
@@ -107,48 +144,177 @@ def process_message(node, message):
         epoch = content['epoch']
         node.add_transaction(transaction, epoch)
 
+    elif message.type in (MessageType.BATCH, MessageType.RESPONSE_BATCH):
+        # Store disseminated or fetched batches (this may resume waiting votes and notarizations)
+        if node.batch_store is not None:
+            batches = [message.content] if message.type == MessageType.BATCH else message.content["batches"]
+            node.batch_store.add_batches(batches)
+
+    elif message.type == MessageType.QUERY_BATCH:
+        # Respond to batch queries with the requested batches this node stores
+        if node.batch_store is not None:
+            node.batch_store.serve(message.content["digests"], message.sender)
+
     elif message.type == MessageType.QUERY_MISSING_BLOCKS:
         # Respond to missing block queries
         last_epoch = message.content.get("last_epoch")
         sender = message.sender
 
-        missing_blocks = [
-            node.notarized_blocks[epoch].to_dict()
-            for epoch in range(last_epoch + 1, node.current_epoch + 1)
-            if epoch in node.notarized_blocks
-        ]
-
-        response_message = Message(MessageType.RESPONSE_MISSING_BLOCKS, {"missing_blocks": missing_blocks}, node.node_id)
-        node.send_message_to_port(sender, response_message)
+        # The finalized blocks after `last_epoch`, then the blocks notarized above the finalized tip
+        with node.lock:
+            missing_blocks = []
+            for block in reversed(node.blockchain):
+                if block.epoch <= last_epoch:
+                    break
+                missing_blocks.append(block)
+            missing_blocks.reverse()
+            tip_epoch = node.blockchain[-1].epoch if node.blockchain else -1
+            missing_blocks.extend(
+                node.notarized_blocks[epoch]
+                for epoch in range(max(last_epoch, tip_epoch) + 1, node.current_epoch + 1)
+                if epoch in node.notarized_blocks
+            )
+        send_missing_blocks(node, sender, missing_blocks)
 
     elif message.type == MessageType.RESPONSE_MISSING_BLOCKS:
         # Handle responses to missing block queries
         if node.recovery_completed:
             return
         
-        missing_blocks = message.content.get("missing_blocks", [])
-        for block_data in missing_blocks:
-            block = block_data
-            if block.epoch not in node.notarized_blocks:
-                node.notarized_blocks[block.epoch] = block
-                node.blockchain.append(block)
-                print(f"Node {node.node_id}: Recovered Block for epoch {block.epoch}")
+        # Verify the whole range at once: recomputed hashes, links and notarization certificates
+        with node.lock:
+            known_hashes = {block.hash for block in node.blockchain}
+            known_hashes.update(block.hash for block in node.notarized_blocks.values())
+        certificates = message.content.get("certificates", {})
+        resolve = None
+        if node.batch_store is not None:
+            # Blocks that reference batches take their transactions from the batches, checked against their digests
+            node.batch_store.add_batches(message.content.get("batches", []))
+            resolve = lambda block: not node.batch_store.resolve(block)
+        missing_blocks, rejected = verify_blocks(message.content.get("missing_blocks", []), certificates,
+                                                 node.keys, node.total_nodes, known_hashes, resolve)
+        if rejected:
+            node.log.warning("Rejected missing blocks from %s: %s", message.sender, rejected)
+            node.metrics.inc("recovered_blocks_rejected")
+
+        # A certificate proves that a block was notarized, not finalized: the recovered blocks
+        # are notarized here, and the node finalizes them by its own rule
+        with node.lock:
+            tip_epoch = node.blockchain[-1].epoch if node.blockchain else -1
+            for block in missing_blocks:
+                if block.epoch <= tip_epoch:
+                    continue
+                block = node.blocks_by_hash.setdefault(block.hash, block)
+                node.certificates.setdefault(block.hash, certificates[block.hash])
+                if block.epoch not in node.notarized_blocks:
+                    node.add_notarized(block)
+                    node.log.info("Recovered Block for epoch %s", block.epoch)
+            node.finalize_blocks()
 
         if missing_blocks:
             latest_recovered_epoch = max(block.epoch for block in missing_blocks)
             if latest_recovered_epoch >= node.current_epoch - 1:
                 node.recovery_completed = True
-                print(f"Node {node.node_id}: Recovery completed after receiving missing blocks.")
+                node.log.info("Recovery completed after receiving missing blocks.")
+
+
+def send_missing_blocks(node, target_port, blocks):
+    """
+    Answers a missing block query, in as many responses as the transport needs.
+
+    A response larger than the transport accepts (a shared memory ring) is split in halves,
+    in epoch order, so each part links to the blocks of the previous ones; only a single
+    block larger than the limit is sent (and refused) whole.
+
+    :param node: Node - The responding node.
+    :param target_port: int - The port of the querying node.
+    :param blocks: list - The missing blocks, in epoch order.
+    """
+    certificates = [node.certificates[block.hash] for block in blocks if block.hash in node.certificates]
+    batches = node.batch_store.batches_of(blocks) if node.batch_store is not None else []
+    response_message = Message.create_response_missing_blocks_message(blocks, node.node_id, certificates, batches)
+    limit = node.transport.max_message_size
+    if limit is not None and len(blocks) > 1 and len(response_message.serialize()) > limit:
+        half = len(blocks) // 2
+        send_missing_blocks(node, target_port, blocks[:half])
+        send_missing_blocks(node, target_port, blocks[half:])
+        return
+    node.send_message_to_port(target_port, response_message)
+
+
+def wait_for_launcher(control_port, node_id, port):
+    """
+    Reports to the launcher that the node is listening and waits for the shared start instant.
+
+    :param control_port: int - Port of the launcher's control socket.
+    :param node_id: int - The ID of this node.
+    :param port: int - The port this node listens on.
+    :return: tuple - The control connection (kept open for the final report) and the start instant as a UNIX timestamp.
+    """
+    control = socket.create_connection(('localhost', control_port))
+    control.sendall((json.dumps({'node_id': node_id, 'port': port, 'status': 'listening'}) + "\n").encode('utf-8'))
+    reply = json.loads(control.makefile('r').readline())
+    return control, reply['start_at']
+
+def report_to_launcher(control, node):
+    """
+    Sends the node's final state and metrics to the launcher.
+
+    :param control: socket.socket - The control connection to the launcher.
+    :param node: Node - The current node instance.
+    """
+    report = {
+        'node_id': node.node_id,
+        'status': 'finished',
+        'finalized_height': len(node.blockchain) - 1,
+        'finalized_hashes': [block.hash.hex() for block in node.blockchain],
+        'overruns': node.scheduler.overruns if node.scheduler else {},
+        'metrics': node.metrics.snapshot(),
+    }
+    control.sendall((json.dumps(report) + "\n").encode('utf-8'))
+    control.close()
+
+async def run_asyncio_node(node, runtime, control_port, profiler=None):
+    """
+    Runs a node on the asyncio runtime: listens, waits for the start instant, then runs the epochs.
+
+    :param node: AsyncNode - The current node instance.
+    :param runtime: AsyncRuntime - The runtime driving the node.
+    :param control_port: int - Port of the launcher's control socket, or None.
+    :param profiler: SamplingProfiler, optional - Profiler of the event loop's thread, stopped once the epochs are over.
+    """
+    await runtime.listen()
+    node.log.info("Listening on port %s (asyncio runtime)", node.port)
+
+    control = None
+    if control_port is not None:
+        # Readiness barrier: every node starts at the instant chosen by the launcher
+        control, node.start_time = await asyncio.to_thread(wait_for_launcher, control_port, node.node_id, node.port)
+    node.configure_seed("toleranciaedfaltadeintrusoes")  # Seed for random leader selection
+    node.running = True
+    await runtime.run_epochs()
+    if profiler is not None:
+        profiler.stop()  # The event loop's thread outlives the epochs: write the profile now
+
+    if control is None:
+        await runtime.serve_forever()
+    else:
+        report_to_launcher(control, node)
+        await runtime.close()
 
 def main():
     """
     Entry point for the node script. Initializes and starts a node.
 
     Usage:
-        node_script.py <node_id> <port> <rejoin> <network_config_file>
+        node_script.py <node_id> <port> <rejoin> <network_config_file> [--control-port <port>] [--runtime threads|asyncio]
+
+    With --control-port (used by launcher.py), the node reports when it is listening, takes the
+    start instant from the launcher instead of `start_time`, and exits once its epochs are done.
+    --runtime selects how the node runs (default: the `runtime` configuration entry, else threads).
     """
     if len(sys.argv) < 5:
-        print("Usage: node_script.py <node_id> <port> <rejoin> <network_config_file>")
+        print("Usage: node_script.py <node_id> <port> <rejoin> <network_config_file> [--control-port <port>] [--runtime threads|asyncio]")
         sys.exit(1)
 
     # Parse command-line arguments
@@ -156,6 +322,8 @@ def main():
     port = int(sys.argv[2])
     rejoin = sys.argv[3].lower() == "true"
     network_config_file = sys.argv[4]
+    options = dict(zip(sys.argv[5::2], sys.argv[6::2]))
+    control_port = int(options["--control-port"]) if "--control-port" in options else None
 
     # Load network configuration from a file
     try:
@@ -171,32 +339,132 @@ def main():
     total_nodes = network_config["num_nodes"]
     total_epochs = network_config["total_epochs"]
     delta = network_config["delta"]
-    start_time = network_config["start_time"]
+    start_time = network_config.get("start_time")
     ports = network_config["ports"]
     confusion_start = network_config.get("confusion_start", None)
     confusion_duration = network_config.get("confusion_duration", None)
+    optimistic_responsiveness = network_config.get("optimistic_responsiveness", False)
+    synthetic_transactions = network_config.get("synthetic_transactions", True)
+    mac_keys = network_config.get("mac_keys", None)
+    metrics_port_offset = network_config.get("metrics_port_offset", None)
+    metrics_file = network_config.get("metrics_file", None)
+    metrics_interval = network_config.get("metrics_interval", 5)
+    trace_file = network_config.get("trace_file", None)
+    profile_file = network_config.get("profile_file", None)
+    profile_interval = network_config.get("profile_interval", 0.005)
+    client_port_offset = network_config.get("client_port_offset", None)
+    subscription_port_offset = network_config.get("subscription_port_offset", None)
+    runtime = options.get("--runtime", network_config.get("runtime", "threads"))
+    if runtime not in ("threads", "asyncio"):
+        print(f"Error: Unknown runtime {runtime} (expected threads or asyncio).")
+        sys.exit(1)
+    compression = network_config.get("compression", [])
+    compression_threshold = network_config.get("compression_threshold", 4096)
+    max_block_bytes = network_config.get("max_block_bytes", None)
+    max_block_transactions = network_config.get("max_block_transactions", None)
+    target_notarization_latency = network_config.get("target_notarization_latency", None)
+    batching = network_config.get("batching", False)
+    batch_size = network_config.get("batch_size", 100)
+    tx_index_retention = network_config.get("tx_index_retention", 1000)
+    try:
+        transport = create_transport(network_config, port)
+        if "network_emulation" in network_config or confusion_start is not None:
+            # Impairments (including the confusion period) are applied between the node and its transport
+            transport = NetworkEmulator(transport, port, ports, network_config.get("network_emulation"),
+                                        (confusion_start, confusion_duration or 0) if confusion_start is not None else None)
+    except ValueError as e:
+        print(f"Error: {e}.")
+        sys.exit(1)
+
+    # Leveled, asynchronous logging (DEBUG shows every proposal, vote, notarization and finalization)
+    logger.configure(level=network_config.get("log_level", "INFO"), json_format=network_config.get("log_json", False))
 
     # Initialize the Node
-    node = Node(
-        node_id=node_id,
-        total_nodes=total_nodes,
-        total_epochs=total_epochs,
-        delta=delta,
-        port=port,
-        ports=ports,
-        start_time=start_time,
-        rejoin=rejoin,
-        confusion_start=confusion_start,
-        confusion_duration=confusion_duration
-    )
-    node.set_seed("toleranciaedfaltadeintrusoes")  # Seed for random leader selection
+    node_class = Node
+    if runtime == "asyncio":
+        from async_runtime import AsyncNode, AsyncRuntime  # Imported here: async_runtime imports this module
+        node_class = AsyncNode
+    try:
+        node = node_class(
+            node_id=node_id,
+            total_nodes=total_nodes,
+            total_epochs=total_epochs,
+            delta=delta,
+            port=port,
+            ports=ports,
+            start_time=start_time,
+            rejoin=rejoin,
+            confusion_start=confusion_start,
+            confusion_duration=confusion_duration,
+            optimistic_responsiveness=optimistic_responsiveness,
+            synthetic_transactions=synthetic_transactions,
+            mac_keys=mac_keys,
+            transport=transport,
+            compression=compression,
+            compression_threshold=compression_threshold,
+            max_block_bytes=max_block_bytes,
+            max_block_transactions=max_block_transactions,
+            target_notarization_latency=target_notarization_latency,
+            batching=batching,
+            batch_size=batch_size,
+            tx_index_retention=tx_index_retention
+        )
+    except ValueError as e:
+        print(f"Error: {e}.")
+        sys.exit(1)
+
+    if isinstance(transport, NetworkEmulator):
+        transport.attach(node)
+
+    # Expose the node's metrics over HTTP and/or dump them periodically to a file
+    if metrics_port_offset is not None:
+        MetricsServer(node.metrics, port + metrics_port_offset).start()
+        node.log.info("Serving metrics on http://localhost:%s/metrics", port + metrics_port_offset)
+    if metrics_file:
+        MetricsDumper(node.metrics, metrics_file.format(node_id=node_id), metrics_interval).start()
+
+    # Trace the lifecycle of each block and/or profile the consensus thread (the event loop's thread on asyncio)
+    if trace_file:
+        node.tracer.open(trace_file.format(node_id=node_id))
+    profiler = None
+    if profile_file:
+        profiler = SamplingProfiler(node if runtime == "threads" else threading.current_thread(),
+                                    profile_file.format(node_id=node_id), profile_interval)
+        profiler.start()
+
+    # Accept transactions from local clients and acknowledge their notarization and finalization
+    if client_port_offset is not None:
+        ClientAPIServer(node, port + client_port_offset).start()
+        node.log.info("Accepting client transactions on port %s", port + client_port_offset)
+
+    # Push finalized blocks to local subscribers
+    if subscription_port_offset is not None:
+        SubscriptionServer(node, port + subscription_port_offset).start()
+        node.log.info("Publishing finalized blocks on port %s", port + subscription_port_offset)
+
+    if runtime == "asyncio":
+        asyncio.run(run_asyncio_node(node, AsyncRuntime(node), control_port, profiler))
+        logger.flush()
+        return
 
     # Start listening for incoming messages
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-        sock.bind(('localhost', port))
-        sock.listen()
-        print(f"Node {node_id} listening on port {port}")
-        handle_incoming_messages(sock, node)
+    listener = transport.listen(port)
+    node.log.info("Listening on port %s (%s transport)", port, network_config.get("transport", "tcp"))
+    try:
+        if control_port is None:
+            node.set_seed("toleranciaedfaltadeintrusoes")  # Seed for random leader selection
+            handle_incoming_messages(listener, node)
+        else:
+            # Readiness barrier: every node starts at the instant chosen by the launcher
+            control, node.start_time = wait_for_launcher(control_port, node_id, port)
+            node.set_seed("toleranciaedfaltadeintrusoes")  # Seed for random leader selection
+            threading.Thread(target=handle_incoming_messages, args=(listener, node), daemon=True).start()
+            node.join()
+            report_to_launcher(control, node)
+            logger.flush()
+            return
+    finally:
+        listener.close()
 
     input("Press Enter to exit...")  # Prevent the script from exiting immediately
 
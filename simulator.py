@@ -0,0 +1,345 @@
+import argparse
+import heapq
+import json
+import random
+import time
+
+import logger
+from message import Message, MessageType
+from node import Node
+from node_script import process_message
+
+
+def constant_latency(seconds):
+    """Latency model where every message takes the same time to arrive."""
+    return lambda rng, sender, target: seconds
+
+
+def uniform_latency(low, high):
+    """Latency model drawing each message's delay uniformly from [low, high]."""
+    return lambda rng, sender, target: rng.uniform(low, high)
+
+
+def exponential_latency(base, mean_extra):
+    """Latency model with a fixed base delay plus an exponentially distributed extra delay."""
+    return lambda rng, sender, target: base + rng.expovariate(1 / mean_extra) if mean_extra > 0 else base
+
+
+def bernoulli_drop(probability):
+    """Drop model where every message is lost independently with the given probability."""
+    return lambda rng, sender, target: probability > 0 and rng.random() < probability
+
+
+class VirtualClock:
+    """
+    Discrete-event clock: callbacks are scheduled at virtual instants and run in time order.
+
+    Virtual time only advances when the next event is popped, so no real time is spent
+    waiting for epochs or network delays.
+    """
+
+    def __init__(self):
+        self.now = 0.0  # Current virtual time in seconds
+        self.events = []  # Heap of (time, sequence, callback, args)
+        self.sequence = 0  # Tie-breaker that keeps events at the same instant in FIFO order
+
+    def schedule(self, delay, callback, *args):
+        """
+        Schedules a callback to run `delay` virtual seconds from now.
+
+        :param delay: float - Delay in virtual seconds.
+        :param callback: callable - The function to run.
+        :param args: tuple - Positional arguments for the function.
+        """
+        self.schedule_at(self.now + delay, callback, *args)
+
+    def schedule_at(self, instant, callback, *args):
+        """
+        Schedules a callback to run at an absolute virtual instant.
+
+        :param instant: float - The virtual time at which the callback runs.
+        :param callback: callable - The function to run.
+        :param args: tuple - Positional arguments for the function.
+        """
+        heapq.heappush(self.events, (instant, self.sequence, callback, args))
+        self.sequence += 1
+
+    def run(self, until=None):
+        """
+        Runs events in time order until none are left or `until` is reached.
+
+        :param until: float, optional - Virtual time at which to stop.
+        :return: int - The number of events processed.
+        """
+        processed = 0
+        while self.events:
+            if until is not None and self.events[0][0] > until:
+                break
+            instant, _, callback, args = heapq.heappop(self.events)
+            self.now = instant
+            callback(*args)
+            processed += 1
+        return processed
+
+
+# Messages whose sent object already holds the decoded content (blocks, batches), so receivers can share it
+SHARED_TYPES = (MessageType.PROPOSE, MessageType.VOTE, MessageType.BATCH)
+
+
+class SimulatedNetwork:
+    """
+    In-memory transport between simulated nodes, driven by the virtual clock.
+
+    Proposals, votes and batches (nearly all of the traffic) are handed to the receivers as
+    they were sent: a broadcast is serialized once, only to charge its size to the traffic
+    statistics, and every receiver shares the same message. Other messages, and every message
+    with `wire_format`, are decoded from the serialized bytes once per broadcast and the
+    decoded message is shared instead.
+    """
+
+    def __init__(self, clock, latency_model, drop_model, rng, wire_format=False):
+        """
+        :param clock: VirtualClock - The clock used to schedule deliveries.
+        :param latency_model: callable - (rng, sender_port, target_port) -> delay in seconds.
+        :param drop_model: callable - (rng, sender_port, target_port) -> True to drop the message.
+        :param rng: random.Random - RNG used by the latency and drop models.
+        :param wire_format: bool - Deliver every message decoded from its serialized bytes.
+        """
+        self.clock = clock
+        self.wire_format = wire_format
+        self.latency_model = latency_model
+        self.drop_model = drop_model
+        self.rng = rng
+        self.nodes = {}  # Maps a port to the node listening on it
+        self.on_delivered = None  # Optional callback(node) run after each delivery
+
+        # Traffic statistics
+        self.messages_sent = 0
+        self.messages_dropped = 0
+        self.messages_delivered = 0
+        self.bytes_sent = 0
+
+    def send(self, sender_port, target_ports, message):
+        """
+        Sends a message to the given ports.
+
+        :param sender_port: int - Port of the sending node.
+        :param target_ports: list - Ports of the receiving nodes.
+        :param message: Message - The message (serialized once, for its size).
+        """
+        data = message.serialize()
+        if self.wire_format or message.type not in SHARED_TYPES:
+            message = Message.deserialize(data)  # Decode once, share among receivers
+        size = len(data)
+        schedule, latency_model, drop_model, rng = self.clock.schedule, self.latency_model, self.drop_model, self.rng
+        for target_port in target_ports:
+            target = self.nodes.get(target_port)
+            if target is None:
+                continue
+            self.messages_sent += 1
+            self.bytes_sent += size
+            if drop_model(rng, sender_port, target_port):
+                self.messages_dropped += 1
+                continue
+            schedule(latency_model(rng, sender_port, target_port), self.deliver, target, message)
+
+    def deliver(self, node, message):
+        """Hands a message to a node's message handler."""
+        self.messages_delivered += 1
+        process_message(node, message)
+        if self.on_delivered is not None:
+            self.on_delivered(node)
+
+
+class SimulatedNode(Node):
+    """
+    A Node whose tasks run inline and whose messages go through a SimulatedNetwork.
+
+    The consensus logic is inherited unchanged from Node; only task execution,
+    message transport and persistence are replaced.
+    """
+
+    def __init__(self, network, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.network = network
+        network.nodes[self.port] = self
+        if self.batch_store is not None:
+            self.batch_store.file_name = None  # Batches are kept in memory only
+
+    def run_async(self, target, *args):
+        """Runs tasks inline: sends only schedule deliveries on the virtual clock, so they never block."""
+        target(*args)
+
+    def broadcast_message(self, message):
+        """Sends a message to every other node through the simulated network."""
+        self.network.send(self.port, [port for port in self.ports if port != self.port], message)
+
+    def send_message_to_port(self, target_port, message):
+        """Sends a message to a single node through the simulated network."""
+        self.network.send(self.port, [target_port], message)
+
+    def save_blockchain(self):
+        """Simulated nodes keep their state in memory only."""
+
+
+class Simulator:
+    """
+    Runs N nodes in one process over an in-memory transport and a virtual clock.
+
+    Epochs last 2Δ of virtual time, so thousands of epochs run as fast as the consensus
+    code itself allows. The results report the work done and whether the nodes agree.
+    """
+
+    def __init__(self, num_nodes, total_epochs, delta=1.0, latency_model=None, drop_model=None, seed=0,
+                 confusion_start=None, confusion_duration=None, optimistic_responsiveness=False, log_level="WARNING",
+                 batching=False, wire_format=False):
+        """
+        :param num_nodes: int - Number of nodes to simulate.
+        :param total_epochs: int - Number of epochs to run.
+        :param delta: float - Δ in virtual seconds (each epoch lasts 2Δ).
+        :param latency_model: callable, optional - Latency model; defaults to a constant Δ/10.
+        :param drop_model: callable, optional - Drop model; defaults to no drops.
+        :param seed: int - Seed for the network, the nodes' RNGs and the leader schedule.
+        :param log_level: str - Log level of the simulated nodes (DEBUG shows every consensus step).
+        :param batching: bool - Disseminate transactions in batches that blocks reference by digest (see batch_store.py).
+        :param wire_format: bool - Deliver messages decoded from their wire format instead of the sent objects.
+        """
+        logger.configure(level=log_level)
+        self.num_nodes = num_nodes
+        self.total_epochs = total_epochs
+        self.delta = delta
+        self.seed = seed
+        self.optimistic_responsiveness = optimistic_responsiveness
+        self.clock = VirtualClock()
+        self.network = SimulatedNetwork(
+            self.clock,
+            latency_model or constant_latency(delta / 10),
+            drop_model or bernoulli_drop(0.0),
+            random.Random(seed),
+            wire_format
+        )
+
+        ports = list(range(num_nodes))  # Ports only serve as addresses in memory
+        self.nodes = [
+            SimulatedNode(self.network, node_id, num_nodes, total_epochs, delta, ports[node_id], ports, None, False,
+                          confusion_start, confusion_duration, optimistic_responsiveness, batching=batching)
+            for node_id in range(num_nodes)
+        ]
+        for node in self.nodes:
+            node.configure_seed(f"simulation-{seed}")  # Builds the leader schedule without starting the thread
+            node.rng.seed(f"{seed}-{node.node_id}")
+            node.notarized_blocks[0] = node.genesis_block
+            node.append_finalized([node.genesis_block])
+        self.node_epochs = {node.node_id: 0 for node in self.nodes}  # Epoch each node is currently in
+        if optimistic_responsiveness:
+            self.network.on_delivered = self.check_early_advance  # Nodes may advance after any delivery
+
+    def start_epoch(self, node, epoch):
+        """
+        Starts an epoch on one node and arms the 2Δ timeout of that epoch.
+
+        In optimistic mode the next epoch may start earlier, as soon as the node
+        sees the current epoch notarized (see `check_early_advance`).
+        """
+        if self.node_epochs[node.node_id] >= epoch:
+            return  # The epoch already started early; this is its stale timeout
+        self.node_epochs[node.node_id] = epoch
+        node.start_epoch(epoch)
+        if epoch < self.total_epochs:
+            self.clock.schedule(2 * self.delta, self.start_epoch, node, epoch + 1)
+        self.check_early_advance(node)
+
+    def check_early_advance(self, node):
+        """Starts the node's next epoch right away if optimistic mode allows it."""
+        epoch = self.node_epochs[node.node_id]
+        if self.optimistic_responsiveness and node.epoch_notarized.is_set() and epoch < self.total_epochs:
+            node.epoch_notarized.clear()
+            self.clock.schedule(0.0, self.start_epoch, node, epoch + 1)
+
+    def run(self):
+        """
+        Runs the simulation to completion.
+
+        :return: dict - Statistics about the run.
+        """
+        for node in self.nodes:
+            self.clock.schedule_at(0.0, self.start_epoch, node, 1)
+        started = time.perf_counter()
+        events = self.clock.run()
+        wall_time = time.perf_counter() - started
+        logger.flush()
+        return self.results(events, wall_time)
+
+    def results(self, events, wall_time):
+        """Summarizes the run: cost, traffic and agreement between the finalized chains."""
+        chains = [[block.hash for block in node.blockchain] for node in self.nodes]
+        shortest = min(len(chain) for chain in chains)
+        consistent = all(chain[:shortest] == chains[0][:shortest] for chain in chains)
+        return {
+            'nodes': self.num_nodes,
+            'epochs': self.total_epochs,
+            'virtual_time': self.clock.now,
+            'wall_time': wall_time,
+            'wall_time_per_epoch': wall_time / self.total_epochs,
+            'events': events,
+            'messages_sent': self.network.messages_sent,
+            'messages_dropped': self.network.messages_dropped,
+            'messages_delivered': self.network.messages_delivered,
+            'bytes_sent': self.network.bytes_sent,
+            'messages_per_epoch': self.network.messages_sent / self.total_epochs,
+            'min_finalized_height': shortest - 1,
+            'max_finalized_height': max(len(chain) for chain in chains) - 1,
+            'consistent': consistent,
+        }
+
+
+def main():
+    """
+    Entry point of the simulator. Runs one simulation per requested cluster size and prints the results.
+
+    Usage:
+        simulator.py --nodes 4 16 64 --epochs 1000 [--delta 1] [--latency 0.05] [--jitter 0.02] [--drop 0.0] [--batching] [--wire-format]
+    """
+    parser = argparse.ArgumentParser(description="In-process Streamlet simulator with a virtual clock.")
+    parser.add_argument("--nodes", type=int, nargs="+", default=[5], help="Cluster sizes to simulate")
+    parser.add_argument("--epochs", type=int, default=100, help="Epochs per simulation")
+    parser.add_argument("--delta", type=float, default=1.0, help="Δ in virtual seconds")
+    parser.add_argument("--latency", type=float, default=None, help="Base one-way latency (default Δ/10)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Mean extra exponential latency")
+    parser.add_argument("--drop", type=float, default=0.0, help="Probability of dropping a message")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for a reproducible run")
+    parser.add_argument("--optimistic", action="store_true", help="Enable optimistic responsiveness")
+    parser.add_argument("--batching", action="store_true", help="Reference transaction batches by digest in blocks")
+    parser.add_argument("--wire-format", action="store_true", help="Decode every broadcast from its serialized bytes")
+    parser.add_argument("--log-level", default="WARNING", help="Log level of the simulated nodes")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    latency = args.latency if args.latency is not None else args.delta / 10
+    all_results = []
+    for num_nodes in args.nodes:
+        simulator = Simulator(
+            num_nodes, args.epochs, args.delta,
+            latency_model=exponential_latency(latency, args.jitter),
+            drop_model=bernoulli_drop(args.drop),
+            seed=args.seed,
+            optimistic_responsiveness=args.optimistic,
+            batching=args.batching,
+            wire_format=args.wire_format,
+            log_level=args.log_level
+        )
+        results = simulator.run()
+        all_results.append(results)
+        print(f"{num_nodes:>5} nodes: {results['wall_time']:.2f}s wall, "
+              f"{results['wall_time_per_epoch'] * 1000:.2f} ms/epoch, "
+              f"{results['messages_per_epoch']:.0f} msgs/epoch, "
+              f"finalized height {results['min_finalized_height']}-{results['max_finalized_height']}, "
+              f"consistent={results['consistent']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(all_results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import argparse
+import collections
+import json
+import socket
+import sys
+import threading
+
+
+def first_index_after(blockchain, epoch):
+    """
+    Returns the index of the first block of the chain with an epoch greater than `epoch`.
+
+    :param blockchain: list - The finalized chain (epochs are increasing).
+    :param epoch: int - The cursor epoch.
+    :return: int - The index (len(blockchain) if every block is at or before the cursor).
+    """
+    low, high = 0, len(blockchain)
+    while low < high:
+        middle = (low + high) // 2
+        if blockchain[middle].epoch <= epoch:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+class Subscriber:
+    """
+    One subscriber of the finalized-block feed.
+
+    Newly finalized blocks are buffered up to `capacity` blocks. A subscriber that falls further
+    behind loses its buffer instead of holding back the node: it is marked as not live and its
+    thread catches up by reading the missing blocks from the chain, from its cursor, before it
+    goes live again.
+    """
+
+    def __init__(self, server, connection, from_epoch=0, headers_only=False, capacity=256):
+        """
+        :param server: SubscriptionServer - The server the subscriber is attached to.
+        :param connection: socket.socket - The subscriber's connection.
+        :param from_epoch: int - First epoch to send.
+        :param headers_only: bool - Send block headers without their transactions.
+        :param capacity: int - Maximum number of blocks buffered for the subscriber.
+        """
+        self.server = server
+        self.connection = connection
+        self.cursor = from_epoch - 1  # Epoch of the last block sent
+        self.headers_only = headers_only
+        self.capacity = capacity
+        self.buffer = collections.deque()
+        self.condition = threading.Condition(threading.Lock())
+        self.live = False  # Whether newly finalized blocks are buffered (False until caught up)
+
+    def push(self, blocks):
+        """Buffers newly finalized blocks, or drops the subscriber back to catching up if it is too far behind."""
+        with self.condition:
+            if not self.live:
+                return
+            if len(self.buffer) + len(blocks) > self.capacity:
+                self.live = False
+                self.buffer.clear()
+            else:
+                self.buffer.extend(blocks)
+            self.condition.notify()
+
+    def resync(self):
+        """Drops the buffered blocks and catches up from the chain (after the chain was replaced)."""
+        with self.condition:
+            self.live = False
+            self.buffer.clear()
+            self.condition.notify()
+
+    def catch_up(self):
+        """Returns the finalized blocks after the cursor and goes live, atomically with respect to finalization."""
+        node = self.server.node
+        with node.lock:
+            blocks = node.blockchain[first_index_after(node.blockchain, self.cursor):]
+            with self.condition:
+                self.live = True
+        return blocks
+
+    def encode(self, block):
+        """Encodes a block as one line of the feed."""
+        data = block.to_dict()
+        data['tx_count'] = len(block.transactions)
+        if self.headers_only:
+            del data['transactions']
+        return json.dumps(data) + "\n"
+
+    def run(self):
+        """Sends finalized blocks to the subscriber until it disconnects."""
+        try:
+            while True:
+                with self.condition:
+                    while self.live and not self.buffer:
+                        self.condition.wait()
+                    blocks = list(self.buffer)
+                    self.buffer.clear()
+                    live = self.live
+                if not live:
+                    blocks = self.catch_up()
+                lines = []
+                for block in blocks:
+                    if block.epoch > self.cursor:
+                        lines.append(self.encode(block))
+                        self.cursor = block.epoch
+                if lines:
+                    self.connection.sendall("".join(lines).encode('utf-8'))
+        except OSError:
+            pass
+        finally:
+            self.server.remove(self)
+            self.connection.close()
+
+
+class SubscriptionServer:
+    """
+    Local push feed of the blocks a node finalizes.
+
+    Protocol: newline-delimited JSON over TCP. A subscriber connects and sends one line,
+    `{"from_epoch": 10, "headers_only": false}`; the node then sends every finalized block from
+    that epoch on (read from the chain), followed by each block as soon as it is finalized, one
+    JSON object per line. Reconnecting with `from_epoch` set to the last epoch received plus one
+    resumes the feed without gaps.
+    """
+
+    def __init__(self, node, port, host='localhost', capacity=256):
+        """
+        :param node: Node - The node whose finalized blocks are published.
+        :param port: int - Port of the feed.
+        :param host: str - Interface to listen on (local only by default).
+        :param capacity: int - Maximum number of blocks buffered per subscriber.
+        """
+        self.node = node
+        self.address = (host, port)
+        self.capacity = capacity
+        self.subscribers = set()
+        node.on_finalized.append(self.blocks_finalized)
+        node.on_chain_replaced.append(self.chain_replaced)
+        node.metrics.set("subscribers", lambda: len(self.subscribers))
+
+    def blocks_finalized(self, blocks):
+        """Node listener: hands newly finalized blocks to every subscriber (called under the node's lock)."""
+        for subscriber in list(self.subscribers):
+            subscriber.push(blocks)
+
+    def chain_replaced(self, blockchain):
+        """Node listener: makes every subscriber catch up from the new chain (called under the node's lock)."""
+        for subscriber in list(self.subscribers):
+            subscriber.resync()
+
+    def remove(self, subscriber):
+        """Detaches a disconnected subscriber."""
+        with self.node.lock:
+            self.subscribers.discard(subscriber)
+
+    def accept(self, connection):
+        """Reads a subscription request and serves the subscriber."""
+        try:
+            request = json.loads(connection.makefile('r', encoding='utf-8').readline() or "{}")
+            subscriber = Subscriber(self, connection, int(request.get('from_epoch', 0)),
+                                    bool(request.get('headers_only', False)), self.capacity)
+        except (OSError, ValueError, TypeError, AttributeError):
+            connection.close()
+            return
+        with self.node.lock:
+            self.subscribers.add(subscriber)
+        subscriber.run()
+
+    def serve(self, sock):
+        """Accepts subscribers forever, one thread per subscriber."""
+        while True:
+            connection, _ = sock.accept()
+            threading.Thread(target=self.accept, args=(connection,), daemon=True).start()
+
+    def start(self):
+        """Starts listening in a daemon thread."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(self.address)
+        sock.listen()
+        threading.Thread(target=self.serve, args=(sock,), daemon=True).start()
+
+
+def main():
+    """
+    Entry point of the feed consumer: prints the finalized blocks of a node.
+
+    Usage:
+        subscription.py <port> [--from-epoch 0] [--headers-only]
+    """
+    parser = argparse.ArgumentParser(description="Follow the finalized blocks of a node.")
+    parser.add_argument("port", type=int, help="Port of the node's subscription feed")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--from-epoch", type=int, default=0, help="First epoch to receive")
+    parser.add_argument("--headers-only", action="store_true", help="Receive block headers without transactions")
+    args = parser.parse_args()
+
+    try:
+        sock = socket.create_connection((args.host, args.port))
+    except OSError as e:
+        print(f"Error: cannot connect to the feed: {e}")
+        sys.exit(1)
+    sock.sendall((json.dumps({'from_epoch': args.from_epoch, 'headers_only': args.headers_only}) + "\n").encode('utf-8'))
+    for line in sock.makefile('r', encoding='utf-8'):
+        block = json.loads(line)
+        print(f"Epoch {block['epoch']}: {block['hash']} ({block['tx_count']} transactions)", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import unittest
+
+from client_api import ClientAPIServer
+from message import MessageType
+from node import Node
+from transaction import Transaction
+
+
+class RecordingSession:
+    """Stands in for a client connection and keeps what it is sent."""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, reply):
+        self.sent.append(reply)
+
+
+class ClientSubmitTest(unittest.TestCase):
+    """Client transactions reach a proposal and are acknowledged, whenever they arrive."""
+
+    def setUp(self):
+        self.node = Node(0, 4, 10 ** 6, 1, 0, [0, 1, 2, 3], "00:00", False, synthetic_transactions=False)
+        self.messages = []
+        self.node.run_async = lambda target, *args: self.messages.extend(args)
+        self.server = ClientAPIServer(self.node, 0)
+        self.session = RecordingSession()
+
+    def proposal(self, epoch):
+        self.messages.clear()
+        self.node.propose_block(epoch)
+        return next(message.content for message in self.messages if message.type == MessageType.PROPOSE)
+
+    def test_transaction_submitted_after_the_next_proposal_reaches_a_later_one(self):
+        self.node.current_epoch = 5
+        self.server.watchers[11] = self.session
+        self.server.submit([Transaction(11, "Client1", "Client2", 5)])
+
+        # The leader of epoch 6 proposed before the echo arrived; it is still pending for epoch 8
+        self.node.current_epoch = 8
+        block = self.proposal(8)
+        self.assertIn(11, block.transactions)
+
+        for listener in self.node.on_notarized:
+            listener(block)
+        self.assertEqual([(reply['event'], reply['tx_id']) for reply in self.session.sent], [('notarized', 11)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+
+from block import Block
+from node import Node
+
+
+class FinalizationRuleTest(unittest.TestCase):
+    """The middle block of three notarized blocks of consecutive epochs is finalized only if they form a chain."""
+
+    def setUp(self):
+        self.node = Node(0, 4, 10 ** 6, 1, 0, [0, 1, 2, 3], "00:00", False, synthetic_transactions=False)
+        self.genesis = self.node.genesis_block
+        self.node.notarized_blocks[0] = self.genesis
+        self.node.append_finalized([self.genesis])
+
+    def notarize(self, block):
+        self.node.blocks_by_hash.setdefault(block.hash, block)
+        self.node.add_notarized(block)
+        self.node.finalize_blocks()
+
+    def finalized_epochs(self):
+        return [block.epoch for block in self.node.blockchain]
+
+    def test_linked_blocks_finalize_the_middle_one_and_its_parents(self):
+        first = Block(1, self.genesis.hash, {})
+        second = Block(2, first.hash, {})
+        third = Block(3, second.hash, {})
+        for block in (first, second, third):
+            self.notarize(block)
+        self.assertEqual(self.finalized_epochs(), [0, 1, 2])
+        self.assertIs(self.node.blockchain[-1], second)
+
+    def test_consecutive_epochs_of_a_fork_finalize_nothing(self):
+        first = Block(1, self.genesis.hash, {})
+        fork = Block(2, self.genesis.hash, {})  # Skips the block of epoch 1
+        third = Block(3, fork.hash, {})
+        for block in (first, fork, third):
+            self.notarize(block)
+        self.assertEqual(self.finalized_epochs(), [0])
+
+    def test_finalization_waits_for_an_unseen_parent(self):
+        first = Block(1, self.genesis.hash, {})
+        second = Block(2, first.hash, {})
+        third = Block(3, second.hash, {})
+        fourth = Block(4, third.hash, {})
+        for block in (second, third, fourth):
+            self.notarize(block)
+        self.assertEqual(self.finalized_epochs(), [0])
+
+        # Once the parent is seen (in a proposal or a vote), the whole chain is finalized in order
+        self.node.blocks_by_hash[first.hash] = first
+        self.node.finalize_blocks()
+        self.assertEqual(self.finalized_epochs(), [0, 1, 2, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,28 @@
+import unittest
+
+from load_generator import percentile
+
+
+class PercentileTest(unittest.TestCase):
+    """Percentiles are taken by nearest rank: the smallest value with at least q% of the values at or below it."""
+
+    def test_nearest_rank(self):
+        values = [1, 2, 3, 4, 5]
+        self.assertEqual(percentile(values, 50), 3)
+        self.assertEqual(percentile(values, 90), 5)
+        self.assertEqual(percentile(values, 20), 1)
+        self.assertEqual(percentile(values, 21), 2)
+        self.assertEqual(percentile(values, 0), 1)
+        self.assertEqual(percentile(values, 100), 5)
+
+    def test_rank_rounds_up_on_halves(self):
+        self.assertEqual(percentile([1, 2], 25), 1)
+        self.assertEqual(percentile([1, 2], 75), 2)
+        self.assertEqual(percentile(list(range(1, 101)), 99), 99)
+
+    def test_no_values(self):
+        self.assertIsNone(percentile([], 50))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import threading
+import time
+import unittest
+
+from netem import NetworkEmulator
+from transport import Transport
+
+
+class BlockingTransport(Transport):
+    """Records the messages it sends; sends to `blocked_port` wait until `release` is set."""
+
+    def __init__(self, blocked_port):
+        self.blocked_port = blocked_port
+        self.release = threading.Event()
+        self.sent = []
+
+    def send(self, target_port, data):
+        if target_port == self.blocked_port:
+            self.release.wait()
+        self.sent.append((target_port, data))
+
+
+class DelayedDeliveryTest(unittest.TestCase):
+    """Delayed messages are sent off the timer wheel's thread."""
+
+    def test_blocked_link_does_not_hold_back_the_others(self):
+        inner = BlockingTransport(blocked_port=7001)
+        emulator = NetworkEmulator(inner, 7000, [7000, 7001, 7002], {"default": {"latency": 0.01}})
+        emulator.send(7001, b"first")
+        emulator.send(7002, b"second")
+        emulator.send(7001, b"third")
+
+        deadline = time.monotonic() + 2.0
+        while (7002, b"second") not in inner.sent and time.monotonic() < deadline:
+            time.sleep(0.005)
+        self.assertEqual(inner.sent, [(7002, b"second")])
+
+        # The blocked link keeps its own order once it is released
+        inner.release.set()
+        while len(inner.sent) < 3 and time.monotonic() < deadline:
+            time.sleep(0.005)
+        self.assertEqual(inner.sent, [(7002, b"second"), (7001, b"first"), (7001, b"third")])
+
+
+if __name__ == "__main__":
+    unittest.main()
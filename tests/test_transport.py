@@ -0,0 +1,152 @@
+import asyncio
+import os
+import socket
+import tempfile
+import time
+import unittest
+import uuid
+
+from transport import ShmRing, ShmTransport, TcpTransport, UnixTransport, open_segment, remove_segment
+
+
+class ShmRingTest(unittest.TestCase):
+    """Framing and wrap-around of the shared memory ring."""
+
+    def setUp(self):
+        self.segment = open_segment(f"streamlet_test_{os.getpid()}_{uuid.uuid4().hex[:8]}", ShmRing.DATA + 64, create=True)
+        self.ring = ShmRing(self.segment)
+        self.ring.reset()
+
+    def tearDown(self):
+        self.ring = None
+        remove_segment(self.segment)
+
+    def test_messages_come_out_in_order(self):
+        for data in (b"a", b"", b"bcd"):
+            self.assertTrue(self.ring.try_write(data))
+        self.assertEqual([self.ring.read() for _ in range(3)], [b"a", b"", b"bcd"])
+        self.assertIsNone(self.ring.read())
+
+    def test_frames_wrap_around_the_end_of_the_ring(self):
+        for round_number in range(50):
+            data = bytes([round_number]) * (round_number % 29 + 1)
+            self.assertTrue(self.ring.try_write(data))
+            self.assertEqual(self.ring.read(), data)
+        self.assertGreater(self.ring.load(ShmRing.HEAD), 2 * self.ring.capacity)
+
+    def test_full_ring_writes_nothing(self):
+        self.assertTrue(self.ring.try_write(b"A" * 40))
+        self.assertFalse(self.ring.try_write(b"B" * 40))
+        self.assertEqual(self.ring.read(), b"A" * 40)
+        self.assertTrue(self.ring.try_write(b"B" * 40))
+        self.assertEqual(self.ring.read(), b"B" * 40)
+
+    def test_timed_out_write_leaves_framing_intact(self):
+        self.assertTrue(self.ring.try_write(b"A" * 40))
+        with self.assertRaises(TimeoutError):
+            self.ring.write(b"B" * 40, timeout=0.01)
+        self.assertTrue(self.ring.try_write(b"C" * 10))
+        self.assertEqual([self.ring.read(), self.ring.read(), self.ring.read()], [b"A" * 40, b"C" * 10, None])
+
+    def test_message_larger_than_the_ring_is_refused(self):
+        with self.assertRaises(ValueError):
+            self.ring.try_write(b"X" * self.ring.capacity)
+        self.assertIsNone(self.ring.read())
+
+    def test_full_ring_of_a_silent_consumer_is_refused_at_once(self):
+        self.assertTrue(self.ring.try_write(b"A" * 40))
+        self.ring.store(ShmRing.ALIVE, int((time.time() - 2 * ShmRing.STALE) * 1000))
+        started = time.monotonic()
+        with self.assertRaises(ConnectionRefusedError):
+            self.ring.write(b"B" * 40, timeout=5)
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_closed_ring_is_refused(self):
+        self.ring.store(ShmRing.CLOSED, 1)
+        with self.assertRaises(ConnectionRefusedError):
+            self.ring.try_write(b"A")
+
+
+class ShmTransportTest(unittest.TestCase):
+    """Sending through the transport, with blocking and asyncio senders."""
+
+    def setUp(self):
+        base = 40000 + os.getpid() % 20000
+        self.ports = [base, base + 1]
+        self.receiver = ShmTransport(self.ports[1], self.ports, ring_size=256, timeout=0.05)
+        self.listener = self.receiver.listen(self.ports[1])
+        self.sender = ShmTransport(self.ports[0], self.ports, ring_size=256, timeout=0.05)
+
+    def tearDown(self):
+        self.sender.rings.clear()
+        self.listener.close()
+
+    def test_send_and_receive(self):
+        self.sender.send(self.ports[1], b"hello")
+        self.assertEqual(self.listener.receive(), b"hello")
+
+    def test_send_async_waits_without_blocking_the_loop(self):
+        async def scenario():
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0.001)
+
+            task = asyncio.get_running_loop().create_task(ticker())
+            await self.sender.send_async(self.ports[1], b"A" * 200)
+            with self.assertRaises(TimeoutError):
+                await self.sender.send_async(self.ports[1], b"B" * 200)
+            task.cancel()
+            return ticks
+
+        self.assertGreater(asyncio.run(scenario()), 5)
+        self.assertEqual(self.listener.receive(), b"A" * 200)
+
+
+class SocketTransportAsyncTest(unittest.TestCase):
+    """Sending and receiving on the event loop with the socket transports."""
+
+    def exchange(self, transport, port, messages):
+        async def scenario():
+            received = []
+            done = asyncio.get_running_loop().create_future()
+
+            def callback(data):
+                received.append(data)
+                if len(received) == len(messages) and not done.done():
+                    done.set_result(None)
+
+            server = await transport.serve_async(port, callback)
+            try:
+                for message in messages:
+                    await transport.send_async(port, message)
+                await asyncio.wait_for(done, 5.0)
+            finally:
+                server.close()
+            return received
+
+        return asyncio.run(scenario())
+
+    def test_tcp_messages_arrive_whole(self):
+        with socket.socket() as sock:
+            sock.bind(('localhost', 0))
+            port = sock.getsockname()[1]
+        messages = [b"hello", bytes(range(256)) * 1024]  # The second one takes several reads
+        self.assertEqual(sorted(self.exchange(TcpTransport(), port, messages)), sorted(messages))
+
+    def test_unix_messages_arrive_whole(self):
+        with tempfile.TemporaryDirectory() as directory:
+            messages = [b"hello", bytes(range(256)) * 1024]
+            self.assertEqual(sorted(self.exchange(UnixTransport(directory), 7000, messages)), sorted(messages))
+
+    def test_unix_send_to_a_missing_node_is_refused(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaises(ConnectionRefusedError):
+                asyncio.run(UnixTransport(directory).send_async(7001, b"hello"))
+
+
+if __name__ == "__main__":
+    unittest.main()
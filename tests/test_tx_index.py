@@ -0,0 +1,63 @@
+import unittest
+
+from block import Block
+from transaction import Transaction
+from tx_index import FINALIZED, NOTARIZED, PENDING, TransactionIndex
+
+
+def make_block(epoch, previous_hash, tx_ids):
+    return Block(epoch, previous_hash, {tx_id: Transaction(tx_id, "Client1", "Client2", 1) for tx_id in tx_ids})
+
+
+class TransactionIndexRetentionTest(unittest.TestCase):
+    """With a retention, entries older than the window below the finalized tip are evicted."""
+
+    def setUp(self):
+        self.index = TransactionIndex(retention=2)
+        self.blocks = [make_block(0, b'0' * 20, [])]
+        for epoch in range(1, 6):
+            self.blocks.append(make_block(epoch, self.blocks[-1].hash, [epoch * 10, epoch * 10 + 1]))
+
+    def finalize(self, last_epoch):
+        for block in self.blocks[1:last_epoch + 1]:
+            self.index.add_block(block, FINALIZED)
+
+    def test_entries_are_evicted_oldest_block_first(self):
+        self.finalize(3)
+        self.assertEqual(self.index.horizon, 1)
+        self.assertNotIn(10, self.index)
+        self.assertEqual(self.index.lookup(20)['epoch'], 2)
+
+        self.index.add_block(self.blocks[4], FINALIZED)
+        self.assertEqual(self.index.horizon, 2)
+        self.assertEqual(sorted(self.index.entries), [30, 31, 40, 41])
+
+    def test_pending_entries_and_newer_blocks_are_kept(self):
+        self.assertTrue(self.index.add_pending(99, 1))
+        self.index.add_block(self.blocks[5], NOTARIZED)
+        self.finalize(3)
+        self.assertEqual(self.index.lookup(99)['state'], PENDING)
+        self.assertEqual(self.index.lookup(50)['state'], NOTARIZED)
+
+    def test_transactions_at_or_below_the_horizon_are_refused(self):
+        self.finalize(4)
+        self.assertFalse(self.index.add_pending(500, 2))  # Could be one of the evicted transactions
+        self.assertTrue(self.index.add_pending(500, 3))
+        self.index.add_block(self.blocks[2], NOTARIZED)  # A late block of evicted history stays out
+        self.assertNotIn(20, self.index)
+
+    def test_round_trip_keeps_entries_and_horizon(self):
+        self.index.add_pending(99, 5)
+        self.finalize(4)
+        restored = TransactionIndex.from_dict(self.index.to_dict(), retention=2)
+        self.assertNotIn(99, restored)  # Pending transactions are not persisted
+        self.assertEqual(restored.entries, {tx_id: entry for tx_id, entry in self.index.entries.items() if tx_id != 99})
+        self.assertEqual(restored.horizon, self.index.horizon)
+
+        # The restored index keeps evicting in order
+        restored.add_block(self.blocks[5], FINALIZED)
+        self.assertEqual(sorted(restored.entries), [40, 41, 50, 51])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,211 @@
+import argparse
+import collections
+import glob
+import json
+import os
+import sys
+import threading
+import time
+
+
+class Tracer:
+    """
+    Records trace spans of a node into a per-node JSON-lines file.
+
+    Records use the Chrome trace event format (complete "X" events and instant "i" events),
+    so the merged timeline of every node opens directly in chrome://tracing or Perfetto.
+    Spans carry a `trace_id` that travels in the message envelope, which ties together the
+    work every node does for one block. While disabled, callers check `enabled` first and
+    no record is ever built, so tracing costs a single attribute lookup.
+    """
+
+    def __init__(self, node_id):
+        self.node_id = node_id
+        self.enabled = False  # Callers must check this before building a record
+        self.file = None
+        self.lock = threading.Lock()
+
+    def open(self, file_name):
+        """
+        Enables tracing and starts writing records to the given file.
+
+        :param file_name: str - Path of the node's trace file.
+        """
+        self.file = open(file_name, 'w')
+        self.enabled = True
+
+    def close(self):
+        """Disables tracing and closes the trace file."""
+        with self.lock:
+            self.enabled = False
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    @staticmethod
+    def new_trace_id():
+        """Returns a new random trace ID."""
+        return os.urandom(8).hex()
+
+    @staticmethod
+    def now():
+        """Returns the current wall-clock time in microseconds (shared by nodes on the same host)."""
+        return time.time_ns() // 1000
+
+    def write(self, record):
+        """Writes one record to the trace file."""
+        line = json.dumps(record)
+        with self.lock:
+            if self.file is not None:
+                self.file.write(line + "\n")
+
+    def span(self, name, trace_id, started, finished=None, **args):
+        """
+        Records a span that has already completed.
+
+        :param name: str - The name of the span (e.g. "propose", "vote").
+        :param trace_id: str - The trace the span belongs to (may be None).
+        :param started: int - Start time in microseconds, from `Tracer.now()`.
+        :param finished: int, optional - End time in microseconds; defaults to now.
+        :param args: dict - Extra attributes of the span.
+        """
+        finished = self.now() if finished is None else finished
+        args['trace_id'] = trace_id
+        self.write({
+            'name': name,
+            'ph': 'X',
+            'ts': started,
+            'dur': finished - started,
+            'pid': self.node_id,
+            'tid': threading.current_thread().name,
+            'args': args,
+        })
+
+    def event(self, name, trace_id, **args):
+        """
+        Records an instant event.
+
+        :param name: str - The name of the event (e.g. "notarize", "finalize").
+        :param trace_id: str - The trace the event belongs to (may be None).
+        :param args: dict - Extra attributes of the event.
+        """
+        args['trace_id'] = trace_id
+        self.write({
+            'name': name,
+            'ph': 'i',
+            's': 't',
+            'ts': self.now(),
+            'pid': self.node_id,
+            'tid': threading.current_thread().name,
+            'args': args,
+        })
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread at a fixed interval and writes the counts in the
+    collapsed-stack format understood by flame graph tools (`frame;frame;frame count`).
+
+    Sampling runs in its own daemon thread and stops once the profiled thread ends, or
+    when `stop` is called (for a thread that outlives the work, e.g. an event loop's).
+    """
+
+    def __init__(self, thread, file_name, interval=0.005):
+        """
+        :param thread: threading.Thread - The thread to profile (the node's consensus thread, or the event loop's).
+        :param file_name: str - Path of the output file.
+        :param interval: float - Seconds between samples.
+        """
+        self.thread = thread
+        self.file_name = file_name
+        self.interval = interval
+        self.samples = collections.Counter()  # Maps a collapsed stack to its number of samples
+        self.stopped = threading.Event()
+        self.sampler = None  # The sampling thread, once started
+
+    def sample(self):
+        """Takes one sample of the profiled thread's stack."""
+        frame = sys._current_frames().get(self.thread.ident)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        if stack:
+            self.samples[";".join(reversed(stack))] += 1
+
+    def run(self):
+        """Samples until stopped or until the profiled thread ends, then writes the profile."""
+        while not self.stopped.wait(self.interval):
+            if self.thread.ident is not None and not self.thread.is_alive():
+                break
+            self.sample()
+        self.write()
+
+    def write(self):
+        """Writes the collapsed stacks to the output file."""
+        with open(self.file_name, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def start(self):
+        """Starts sampling in a daemon thread."""
+        self.sampler = threading.Thread(target=self.run, name="profiler", daemon=True)
+        self.sampler.start()
+
+    def stop(self):
+        """Stops sampling and waits until the sampling thread has written the profile."""
+        self.stopped.set()
+        if self.sampler is not None:
+            self.sampler.join()
+
+
+def merge_traces(file_names, trace_id=None):
+    """
+    Merges per-node trace files into a single timeline sorted by time.
+
+    :param file_names: list - Paths of the per-node trace files.
+    :param trace_id: str, optional - Keep only the records of this trace.
+    :return: dict - The timeline in the Chrome trace event format.
+    """
+    events = []
+    for file_name in file_names:
+        with open(file_name, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                if trace_id is None or record['args'].get('trace_id') == trace_id:
+                    events.append(record)
+    events.sort(key=lambda record: record['ts'])
+
+    # Name each node's process so the timeline shows one lane per node
+    node_ids = sorted({record['pid'] for record in events})
+    metadata = [{'name': 'process_name', 'ph': 'M', 'pid': node_id, 'args': {'name': f"Node {node_id}"}}
+                for node_id in node_ids]
+    return {'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}
+
+
+def main():
+    """
+    Entry point of the trace merger.
+
+    Usage:
+        tracing.py [trace files ...] [--trace-id ID] [--output timeline.json]
+    """
+    parser = argparse.ArgumentParser(description="Merge per-node trace files into one timeline.")
+    parser.add_argument("files", nargs="*", help="Trace files (default: trace_*.jsonl)")
+    parser.add_argument("--trace-id", help="Only keep the records of this trace")
+    parser.add_argument("--output", default="timeline.json", help="Merged timeline file")
+    args = parser.parse_args()
+
+    file_names = args.files or sorted(glob.glob("trace_*.jsonl"))
+    timeline = merge_traces(file_names, args.trace_id)
+    with open(args.output, 'w') as f:
+        json.dump(timeline, f)
+    print(f"Merged {len(timeline['traceEvents'])} records from {len(file_names)} files into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,9 +7,10 @@ class Transaction:
     - sender (str): The ID or name of the sender in the transaction.
     - receiver (str): The ID or name of the receiver in the transaction.
     - amount (float/int): The amount being transferred in the transaction.
+    - payload (str): Optional opaque data carried by the transaction (empty by default).
     """
     
-    def __init__(self, tx_id, sender, receiver, amount):
+    def __init__(self, tx_id, sender, receiver, amount, payload=""):
         """
         Initializes a new Transaction object with a unique ID, sender, receiver, and amount.
         
@@ -18,25 +19,31 @@ class Transaction:
         - sender (str): The sender’s identifier.
         - receiver (str): The receiver’s identifier.
         - amount (float/int): The amount of value being transferred.
+        - payload (str): Optional opaque data carried by the transaction.
         """
         self.tx_id = int(tx_id)  
         self.sender = sender
         self.receiver = receiver
         self.amount = amount
+        self.payload = payload
     
     def to_dict(self):
         """
         Serializes the transaction to a dictionary format.
         
         Returns:
-        - dict: A dictionary representation of the transaction, containing the transaction ID, sender, receiver, and amount.
+        - dict: A dictionary representation of the transaction, containing the transaction ID, sender, receiver, and amount
+          (and the payload, only when it is not empty).
         """
-        return {
+        data = {
             'tx_id': self.tx_id,
             'sender': self.sender,
             'receiver': self.receiver,
             'amount': self.amount
         }
+        if self.payload:
+            data['payload'] = self.payload
+        return data
     
     @staticmethod
     def from_dict(data):
@@ -44,7 +51,7 @@ class Transaction:
         Deserializes a transaction from a dictionary format.
         
         Parameters:
-        - data (dict): A dictionary containing `tx_id`, `sender`, `receiver`, and `amount` fields.
+        - data (dict): A dictionary containing `tx_id`, `sender`, `receiver`, and `amount` fields (and optionally `payload`).
 
         Returns:
         - Transaction: A Transaction object constructed from the dictionary data.
@@ -53,5 +60,6 @@ class Transaction:
             tx_id=int(data['tx_id']),
             sender=data['sender'],
             receiver=data['receiver'],
-            amount=data['amount']
+            amount=data['amount'],
+            payload=data.get('payload', "")
         )
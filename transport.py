@@ -0,0 +1,563 @@
+import asyncio
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+
+def read_until_eof(conn):
+    """
+    Reads a connection until the sender closes it.
+
+    :param conn: socket.socket - The connection.
+    :return: bytes - Everything the sender wrote.
+    """
+    chunks = []
+    while True:
+        chunk = conn.recv(65536)  # Read up to 64 KB at a time
+        if not chunk:
+            break
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+class Transport:
+    """
+    Carries serialized messages between nodes, which are addressed by their port.
+
+    A transport delivers one message per `send`; the receiving side gets the same bytes back
+    from its listener. Every transport also offers asyncio versions of both sides for the
+    asyncio runtime. Sending to a node that is not listening raises ConnectionRefusedError.
+    """
+
+    max_message_size = None  # Largest message a send accepts, in bytes (None: no limit)
+
+    def send(self, target_port, data):
+        """
+        Sends one message to a node.
+
+        :param target_port: int - The port of the target node.
+        :param data: bytes - The serialized message.
+        """
+        raise NotImplementedError
+
+    def listen(self, port):
+        """
+        Starts receiving the messages addressed to a port.
+
+        :param port: int - The port of this node.
+        :return: object - A listener whose `receive()` blocks until the next message and returns its bytes.
+        """
+        raise NotImplementedError
+
+    async def send_async(self, target_port, data):
+        """Sends one message from the event loop (by default `send`, which must not block: transports that may wait override this)."""
+        self.send(target_port, data)
+
+    async def serve_async(self, port, callback):
+        """
+        Receives messages on the event loop, calling `callback(data)` on the loop for each one.
+
+        By default a daemon thread reads from the listener and hands each message to the loop.
+
+        :return: object - The server; `close()` stops it.
+        """
+        loop = asyncio.get_running_loop()
+        listener = self.listen(port)
+
+        def receive():
+            while True:
+                data = listener.receive()
+                if data is None:
+                    return
+                loop.call_soon_threadsafe(callback, data)
+
+        threading.Thread(target=receive, daemon=True).start()
+        return listener
+
+
+class SocketListener:
+    """Listener of the socket transports: one message per accepted connection."""
+
+    def __init__(self, sock, path=None):
+        """
+        :param sock: socket.socket - The listening socket.
+        :param path: str, optional - The socket file to remove on close (Unix domain sockets).
+        """
+        self.sock = sock
+        self.path = path
+
+    def receive(self):
+        """Accepts the next connection and returns the message it carries (None once closed)."""
+        try:
+            conn, _ = self.sock.accept()
+        except OSError:
+            return None
+        with conn:
+            return read_until_eof(conn)
+
+    def close(self):
+        self.sock.close()
+        if self.path and os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class LoopListener:
+    """
+    Receives messages on an event loop from a listening socket: one message per accepted connection.
+
+    Connections are accepted and read by reader callbacks on the loop's selector, and `callback(data)`
+    is called on the loop once the sender closes the connection. An asyncio server would start a
+    task and build a transport, a protocol and a stream reader for every connection, which costs
+    more than the short message each connection carries.
+    """
+
+    def __init__(self, listener, callback):
+        """
+        :param listener: SocketListener - The listening socket.
+        :param callback: callable - Called with the bytes of each message (empty if the connection failed).
+        """
+        self.listener = listener
+        self.callback = callback
+        self.loop = asyncio.get_running_loop()
+        self.connections = set()  # Accepted connections whose message is not complete yet
+        listener.sock.setblocking(False)
+        if listener.sock.family == socket.AF_INET and hasattr(socket, 'TCP_DEFER_ACCEPT'):
+            listener.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_DEFER_ACCEPT, 1)
+        self.loop.add_reader(listener.sock, self.accept)
+
+    def accept(self):
+        """Reader callback of the listening socket: accepts the waiting connections."""
+        while True:
+            try:
+                conn, _ = self.listener.sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                if self.listener.sock.fileno() != -1:
+                    # Out of file descriptors: pause instead of spinning on the socket that stays ready
+                    self.loop.remove_reader(self.listener.sock)
+                    self.loop.call_later(1.0, self.resume)
+                return
+            conn.setblocking(False)
+            chunks = []
+            # The message has usually arrived with the connection: read it now, and wait only if it has not
+            if not self.read(conn, chunks):
+                self.connections.add(conn)
+                self.loop.add_reader(conn, self.read, conn, chunks)
+
+    def resume(self):
+        """Accepts connections again after a pause (unless the listener was closed meanwhile)."""
+        if self.listener.sock.fileno() != -1:
+            self.loop.add_reader(self.listener.sock, self.accept)
+
+    def read(self, conn, chunks):
+        """
+        Reads what a connection has sent, and hands the message over at the end of the stream.
+
+        :return: bool - True once the connection is closed.
+        """
+        while True:
+            try:
+                chunk = conn.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return False
+            except OSError:
+                chunks, chunk = [], b''  # Reset before the end of the message
+            if chunk:
+                chunks.append(chunk)
+                continue
+            if conn in self.connections:
+                self.connections.discard(conn)
+                self.loop.remove_reader(conn)
+            conn.close()
+            self.callback(b''.join(chunks))
+            return True
+
+    def close(self):
+        self.loop.remove_reader(self.listener.sock)
+        for conn in self.connections:
+            self.loop.remove_reader(conn)
+            conn.close()
+        self.connections.clear()
+        self.listener.close()
+
+
+async def send_socket(sock, address, data):
+    """Writes one message to a new connection from the event loop and closes it."""
+    loop = asyncio.get_running_loop()
+    with sock:
+        sock.setblocking(False)
+        await loop.sock_connect(sock, address)
+        await loop.sock_sendall(sock, data)
+
+
+class TcpTransport(Transport):
+    """
+    TCP connections, one per message (the original transport, needed when nodes run on different hosts).
+    """
+
+    def __init__(self, hosts=None):
+        """
+        :param hosts: dict, optional - Maps a port to the host of its node (default: localhost).
+        """
+        self.hosts = hosts or {}
+        self.addresses = {}  # Resolved address of each port, for the event loop (which must not resolve names)
+
+    def host(self, port):
+        return self.hosts.get(port, 'localhost')
+
+    def send(self, target_port, data):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.connect((self.host(target_port), target_port))
+            s.sendall(data)
+
+    def listen(self, port):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind((self.host(port), port))
+        sock.listen(1024)
+        return SocketListener(sock)
+
+    async def send_async(self, target_port, data):
+        address = self.addresses.get(target_port)
+        if address is None:
+            infos = await asyncio.get_running_loop().getaddrinfo(self.host(target_port), target_port,
+                                                                 family=socket.AF_INET, type=socket.SOCK_STREAM)
+            address = self.addresses.setdefault(target_port, infos[0][4])
+        await send_socket(socket.socket(socket.AF_INET, socket.SOCK_STREAM), address, data)
+
+    async def serve_async(self, port, callback):
+        return LoopListener(self.listen(port), callback)
+
+
+class UnixTransport(Transport):
+    """
+    Unix domain sockets, one connection per message, for nodes on the same host.
+
+    Node `port` listens on `<socket_dir>/streamlet_<port>.sock`. Compared to TCP over the
+    loopback interface, connections skip the TCP/IP stack (no handshake, checksums or ports).
+    """
+
+    def __init__(self, socket_dir=None):
+        """
+        :param socket_dir: str, optional - Directory of the socket files (default: the temporary directory).
+        """
+        self.socket_dir = socket_dir or tempfile.gettempdir()
+
+    def path(self, port):
+        return os.path.join(self.socket_dir, f"streamlet_{port}.sock")
+
+    def send(self, target_port, data):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            try:
+                s.connect(self.path(target_port))
+            except FileNotFoundError:
+                raise ConnectionRefusedError(f"no socket at {self.path(target_port)}")
+            s.sendall(data)
+
+    def listen(self, port):
+        path = self.path(port)
+        if os.path.exists(path):
+            os.unlink(path)  # Left behind by a node that crashed
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(path)
+        sock.listen(1024)
+        return SocketListener(sock, path)
+
+    async def send_async(self, target_port, data):
+        try:
+            await send_socket(socket.socket(socket.AF_UNIX, socket.SOCK_STREAM), self.path(target_port), data)
+        except FileNotFoundError:
+            raise ConnectionRefusedError(f"no socket at {self.path(target_port)}")
+
+    async def serve_async(self, port, callback):
+        return LoopListener(self.listen(port), callback)
+
+
+def open_segment(name, size=0, create=False):
+    """
+    Creates or attaches a shared memory segment that outlives this process.
+
+    The segment is left out of the resource tracker, which would otherwise remove it when any
+    process that used it exits (a crashed node reattaches its rings when it rejoins).
+    """
+    segment = shared_memory.SharedMemory(name=name, create=create, size=size)
+    try:
+        resource_tracker.unregister(segment._name, "shared_memory")
+    except Exception:
+        pass
+    return segment
+
+
+def remove_segment(segment):
+    """Unmaps and removes a segment opened with `open_segment`."""
+    segment.close()
+    resource_tracker.register(segment._name, "shared_memory")  # `unlink` unregisters it again
+    segment.unlink()
+
+
+class ShmRing:
+    """
+    Single-producer, single-consumer byte ring in a shared memory segment.
+
+    The header holds the producer's write position (`head`), the consumer's read position
+    (`tail`), both monotonically increasing, a closed flag and the consumer's liveness stamp
+    (the last time it polled), each on its own cache line. Messages are framed by a 4-byte
+    length. The producer only writes a frame once the ring has room for all of it, and
+    publishes `head` once the whole frame is in place, so the consumer never sees part of a
+    frame; a message (plus its length) must therefore fit in the ring.
+    """
+
+    HEAD, TAIL, CLOSED, ALIVE = 0, 64, 128, 192
+    DATA = 256  # Offset of the data area
+    FIELD = struct.Struct("<Q")
+    STALE = 1.0  # Seconds without a poll after which the consumer is considered gone
+
+    def __init__(self, segment):
+        """
+        :param segment: shared_memory.SharedMemory - The segment holding the ring.
+        """
+        self.segment = segment
+        self.buffer = segment.buf
+        self.capacity = segment.size - self.DATA
+
+    def load(self, offset):
+        return self.FIELD.unpack_from(self.buffer, offset)[0]
+
+    def store(self, offset, value):
+        self.FIELD.pack_into(self.buffer, offset, value)
+
+    def closed(self):
+        return self.load(self.CLOSED) != 0
+
+    def beat(self):
+        """Consumer side: records that the consumer is polling the ring."""
+        self.store(self.ALIVE, int(time.time() * 1000))
+
+    def consumer_alive(self):
+        """Returns True if the consumer polled the ring recently."""
+        return time.time() * 1000 - self.load(self.ALIVE) < self.STALE * 1000
+
+    def reset(self):
+        """Consumer side: discards unread data and reopens the ring."""
+        self.store(self.TAIL, self.load(self.HEAD))
+        self.store(self.CLOSED, 0)
+        self.beat()
+
+    def try_write(self, data):
+        """
+        Producer side: writes one message if the ring has room for the whole frame.
+
+        :param data: bytes - The message.
+        :return: bool - False if the ring is full (nothing was written).
+        :raises ValueError: If the message does not fit in the ring.
+        :raises ConnectionRefusedError: If the consumer closed the ring or stopped polling it.
+        """
+        size = 4 + len(data)
+        if size > self.capacity:
+            raise ValueError(f"message of {len(data)} bytes does not fit in a ring of {self.capacity} bytes")
+        if self.closed():
+            raise ConnectionRefusedError("ring closed by the receiver")
+        head = self.load(self.HEAD)
+        if self.capacity - (head - self.load(self.TAIL)) < size:
+            if not self.consumer_alive():
+                raise ConnectionRefusedError("receiver stopped reading the ring")
+            return False
+        self.write_bytes(head, len(data).to_bytes(4, 'little'))
+        self.write_bytes(head + 4, data)
+        self.store(self.HEAD, head + size)  # Publish after the whole frame is in place
+        return True
+
+    def write(self, data, timeout):
+        """
+        Producer side: writes one message, waiting for the consumer when the ring is full.
+
+        :param data: bytes - The message.
+        :param timeout: float - Seconds to wait for free space.
+        :raises ValueError: If the message does not fit in the ring.
+        :raises ConnectionRefusedError: If the consumer closed the ring or stopped polling it.
+        :raises TimeoutError: If the consumer does not make room in time.
+        """
+        deadline = None
+        while not self.try_write(data):
+            deadline = deadline or time.monotonic() + timeout
+            if time.monotonic() > deadline:
+                raise TimeoutError("ring full")
+            time.sleep(0.0002)
+
+    def write_bytes(self, head, data):
+        position = head % self.capacity
+        first = min(len(data), self.capacity - position)
+        self.buffer[self.DATA + position:self.DATA + position + first] = data[:first]
+        self.buffer[self.DATA:self.DATA + len(data) - first] = data[first:]
+
+    def read_bytes(self, tail, count):
+        position = tail % self.capacity
+        first = min(count, self.capacity - position)
+        return bytes(self.buffer[self.DATA + position:self.DATA + position + first]) + \
+            bytes(self.buffer[self.DATA:self.DATA + count - first])
+
+    def read(self):
+        """
+        Consumer side: reads the next message.
+
+        :return: bytes - The next message, or None if the ring is empty.
+        """
+        tail = self.load(self.TAIL)
+        if self.load(self.HEAD) - tail < 4:
+            return None
+        # Frames are published whole, so the message follows its length
+        length = int.from_bytes(self.read_bytes(tail, 4), 'little')
+        data = self.read_bytes(tail + 4, length)
+        self.store(self.TAIL, tail + 4 + length)
+        return data
+
+
+class ShmListener:
+    """Listener of the shared memory transport: polls the rings of every peer."""
+
+    def __init__(self, rings):
+        """
+        :param rings: list - The ShmRing of each peer, this node being the consumer.
+        """
+        self.rings = rings
+        self.ready = []  # Messages read but not returned yet
+        self.running = True
+        self.beaten_at = 0.0  # Monotonic time of the last liveness stamp
+
+    def receive(self):
+        """Returns the next message, backing off from 50 µs to 1 ms between empty polls (None once closed)."""
+        idle = 0.00005
+        while self.running:
+            if self.ready:
+                return self.ready.pop(0)
+            now = time.monotonic()
+            if now - self.beaten_at > 0.1:
+                # Tell the producers this node is alive (they give up on a full ring of a crashed node)
+                for ring in self.rings:
+                    ring.beat()
+                self.beaten_at = now
+            for ring in self.rings:
+                data = ring.read()
+                if data is not None:
+                    self.ready.append(data)
+            if not self.ready:
+                time.sleep(idle)
+                idle = min(idle * 2, 0.001)
+        return None
+
+    def close(self):
+        """Closes the rings (so producers stop attaching to them) and removes the segments."""
+        self.running = False
+        for ring in self.rings:
+            ring.store(ring.CLOSED, 1)
+            try:
+                remove_segment(ring.segment)
+            except (BufferError, FileNotFoundError):
+                pass
+
+
+class ShmTransport(Transport):
+    """
+    Shared memory rings for nodes on the same host.
+
+    Every ordered pair of nodes has its own ring, `streamlet_<sender>_<target>`, created by the
+    receiving node when it starts listening, so each ring has exactly one producer process and
+    one consumer. A message is copied into the ring and out of it, without system calls or
+    connections; the receiver polls its rings.
+
+    A send waits (up to `timeout`) for room in a full ring only while the receiver keeps polling;
+    the ring of a crashed receiver is refused at once, so it does not stall sends to the others.
+    """
+
+    def __init__(self, port, ports, ring_size=1 << 20, timeout=5.0):
+        """
+        :param port: int - The port of this node.
+        :param ports: list - The ports of every node.
+        :param ring_size: int - Bytes of each ring.
+        :param timeout: float - Seconds a send waits for space in a full ring of a live receiver.
+        """
+        self.port = port
+        self.ports = ports
+        self.ring_size = ring_size
+        self.max_message_size = ring_size - 4  # A frame (message and length) must fit in the ring
+        self.timeout = timeout
+        self.rings = {}  # Maps a target port to the attached ring (producer side)
+        self.locks = {port: threading.Lock() for port in ports}  # One producer per ring, across threads
+
+    @staticmethod
+    def segment_name(sender_port, target_port):
+        return f"streamlet_{sender_port}_{target_port}"
+
+    def try_send(self, target_port, data):
+        """
+        Writes one message to a node's ring if it has room, without waiting.
+
+        :return: bool - False if the ring is full.
+        """
+        with self.locks[target_port]:
+            ring = self.rings.get(target_port)
+            if ring is None or ring.closed():
+                try:
+                    ring = ShmRing(open_segment(self.segment_name(self.port, target_port)))
+                except FileNotFoundError:
+                    raise ConnectionRefusedError(f"no ring for port {target_port}")
+                self.rings[target_port] = ring
+            return ring.try_write(data)
+
+    def send(self, target_port, data):
+        deadline = None
+        while not self.try_send(target_port, data):  # The lock is not held while waiting
+            deadline = deadline or time.monotonic() + self.timeout
+            if time.monotonic() > deadline:
+                raise TimeoutError("ring full")
+            time.sleep(0.0002)
+
+    async def send_async(self, target_port, data):
+        """Waits for room in a full ring on the event loop instead of blocking it."""
+        deadline = None
+        while not self.try_send(target_port, data):
+            deadline = deadline or time.monotonic() + self.timeout
+            if time.monotonic() > deadline:
+                raise TimeoutError("ring full")
+            await asyncio.sleep(0.0002)
+
+    def listen(self, port):
+        rings = []
+        for sender_port in self.ports:
+            if sender_port == port:
+                continue
+            name = self.segment_name(sender_port, port)
+            try:
+                segment = open_segment(name, self.ring_size + ShmRing.DATA, create=True)
+            except FileExistsError:
+                segment = open_segment(name)  # Reattach after a crash, so the sender's mapping stays valid
+                if segment.size != self.ring_size + ShmRing.DATA:
+                    remove_segment(segment)
+                    segment = open_segment(name, self.ring_size + ShmRing.DATA, create=True)
+            ring = ShmRing(segment)
+            ring.reset()
+            rings.append(ring)
+        return ShmListener(rings)
+
+
+def create_transport(network_config, port):
+    """
+    Builds the transport selected by the `transport` entry of the network configuration.
+
+    :param network_config: dict - The network configuration.
+    :param port: int - The port of this node.
+    :return: Transport - TcpTransport ("tcp", the default), UnixTransport ("unix") or ShmTransport ("shm").
+    """
+    kind = network_config.get("transport", "tcp")
+    if kind == "tcp":
+        hosts = network_config.get("hosts")
+        return TcpTransport(dict(zip(network_config["ports"], hosts)) if hosts else None)
+    if kind == "unix":
+        return UnixTransport(network_config.get("socket_dir"))
+    if kind == "shm":
+        return ShmTransport(port, network_config["ports"], network_config.get("shm_ring_size", 1 << 20))
+    raise ValueError(f"Unknown transport {kind} (expected tcp, unix or shm)")
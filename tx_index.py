@@ -0,0 +1,148 @@
+import heapq
+
+PENDING = "pending"
+NOTARIZED = "notarized"
+FINALIZED = "finalized"
+
+STATES = {PENDING: 0, NOTARIZED: 1, FINALIZED: 2}  # Order of the states; an entry never moves back
+
+
+class TransactionIndex:
+    """
+    Index of the transactions known to a node, by tx_id.
+
+    Each entry records the state of the transaction (pending, notarized or finalized) and,
+    once it is in a block, the block's hash, epoch and the transaction's position in the
+    block. Lookups and duplicate checks are a dictionary access instead of a scan of the
+    chain and of the pending transactions.
+
+    With a retention, the entries of blocks more than `retention` epochs below the finalized
+    tip are evicted, so the index stays bounded however long the node runs. Transactions
+    meant for an epoch at or below that horizon are refused as already known, since they
+    can no longer be told apart from evicted ones (the ledger keeps their history).
+    """
+
+    def __init__(self, retention=None):
+        """
+        :param retention: int, optional - Epochs below the finalized tip whose entries are kept (default: all).
+        """
+        self.retention = retention
+        self.entries = {}  # Maps a tx_id to {'state', 'block', 'epoch', 'position'}
+        self.block_epochs = {}  # Maps the epoch of an indexed block to the tx_ids it holds (with a retention)
+        self.epoch_heap = []  # Epochs of `block_epochs`, oldest first
+        self.horizon = -1  # Epochs at or below it were evicted
+
+    def __contains__(self, tx_id):
+        return tx_id in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, tx_id):
+        """
+        Returns the entry of a transaction.
+
+        :param tx_id: int - The transaction ID.
+        :return: dict - The entry (state, block hash, epoch, position), or None if the transaction is unknown.
+        """
+        return self.entries.get(tx_id)
+
+    def add_pending(self, tx_id, epoch):
+        """
+        Records a new pending transaction.
+
+        :param tx_id: int - The transaction ID.
+        :param epoch: int - The epoch whose proposal should include it.
+        :return: bool - False if the transaction was already known (or is too old to tell).
+        """
+        if tx_id in self.entries or epoch <= self.horizon:
+            return False
+        self.entries[tx_id] = {'state': PENDING, 'block': None, 'epoch': epoch, 'position': None}
+        return True
+
+    def add_block(self, block, state):
+        """
+        Records the transactions of a block that was notarized or finalized.
+
+        A transaction never moves back to an earlier state, so a finalized transaction stays
+        finalized if another block holding it is notarized later.
+
+        :param block: Block - The block.
+        :param state: str - NOTARIZED or FINALIZED.
+        """
+        if block.epoch <= self.horizon:
+            return  # Already evicted history
+        block_hash = block.hash.hex()
+        rank = STATES[state]
+        for position, tx_id in enumerate(block.transactions):
+            entry = self.entries.get(tx_id)
+            if entry is None or STATES[entry['state']] <= rank:
+                self.entries[tx_id] = {'state': state, 'block': block_hash, 'epoch': block.epoch, 'position': position}
+        if self.retention is not None:
+            self.track(block.epoch, block.transactions)
+            if state == FINALIZED:
+                self.evict(block.epoch - self.retention)
+
+    def track(self, epoch, tx_ids):
+        """Remembers which transactions a block of the epoch indexed, so they can be evicted with it."""
+        tracked = self.block_epochs.get(epoch)
+        if tracked is None:
+            tracked = self.block_epochs[epoch] = []
+            heapq.heappush(self.epoch_heap, epoch)
+        tracked.extend(tx_ids)
+
+    def evict(self, horizon):
+        """
+        Evicts the entries of blocks at or below an epoch.
+
+        :param horizon: int - The newest epoch to evict.
+        """
+        while self.epoch_heap and self.epoch_heap[0] <= horizon:
+            for tx_id in self.block_epochs.pop(heapq.heappop(self.epoch_heap)):
+                entry = self.entries.get(tx_id)
+                if entry is not None and entry['state'] != PENDING and entry['epoch'] <= horizon:
+                    del self.entries[tx_id]
+        self.horizon = max(self.horizon, horizon)
+
+    def rebuild(self, blockchain, notarized_blocks):
+        """
+        Rebuilds the index from the finalized chain and the notarized blocks (pending transactions are lost).
+
+        :param blockchain: list - The finalized chain.
+        :param notarized_blocks: dict - The notarized blocks, by epoch.
+        """
+        self.entries = {}
+        self.block_epochs = {}
+        self.epoch_heap = []
+        self.horizon = -1
+        for block in notarized_blocks.values():
+            self.add_block(block, NOTARIZED)
+        for block in blockchain:
+            self.add_block(block, FINALIZED)
+
+    def to_dict(self):
+        """
+        Serializes the index for a checkpoint (pending transactions are not persisted).
+
+        :return: dict - Maps each tx_id (as a string) to its entry.
+        """
+        return {str(tx_id): entry for tx_id, entry in self.entries.items() if entry['state'] != PENDING}
+
+    @staticmethod
+    def from_dict(data, retention=None):
+        """
+        Restores an index from a checkpoint.
+
+        :param data: dict - A dictionary produced by `to_dict`.
+        :param retention: int, optional - Epochs below the finalized tip whose entries are kept (default: all).
+        :return: TransactionIndex - The restored index.
+        """
+        index = TransactionIndex(retention)
+        index.entries = {int(tx_id): dict(entry) for tx_id, entry in data.items()}
+        if retention is not None and index.entries:
+            for tx_id, entry in index.entries.items():
+                index.track(entry['epoch'], [tx_id])
+            tip = max((entry['epoch'] for entry in index.entries.values() if entry['state'] == FINALIZED), default=None)
+            if tip is not None:
+                index.evict(tip - retention)
+        return index
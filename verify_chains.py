@@ -0,0 +1,416 @@
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from block import Block
+
+READ_SIZE = 1 << 20  # Characters read from a chain file at a time by the streaming decoder
+SEGMENT_BYTES = 8 << 20  # Bytes of a chain file decoded and verified by one worker task
+SEGMENT_BLOCKS = 2048  # Blocks per worker task when the file has to be decoded by the main process
+MAX_LISTED_PROBLEMS = 100  # Problems kept per node in the report (all are counted)
+
+SEPARATORS = re.compile(r'[\s,]*')
+CHAIN_FILE = re.compile(r'blockchain_(\d+)\.json$')
+BLOCK_START = b"\n    {"  # Starts a block in a file written with indent=4 (JSON strings never hold a raw newline)
+
+
+def iter_json_array(path, read_size=READ_SIZE):
+    """
+    Streams the elements of a JSON array file, so a chain never has to fit in memory as text or as objects.
+
+    :param path: str - Path of the file (e.g. `blockchain_<id>.json`, as written by `Node.save_blockchain`).
+    :param read_size: int - Characters read at a time (grown for elements larger than the buffer).
+    :return: generator - The decoded elements, in file order.
+    :raises ValueError: If the file is not a well-formed JSON array.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r') as f:
+        buffer = f.read(read_size)
+        position = SEPARATORS.match(buffer).end()
+        if buffer[position:position + 1] != "[":
+            raise ValueError(f"{path} does not hold a JSON array")
+        position += 1
+        consumed = 0  # Characters dropped from the front of the buffer
+        eof = False
+        while True:
+            position = SEPARATORS.match(buffer, position).end()
+            if position < len(buffer) and buffer[position] == "]":
+                return
+            try:
+                if position == len(buffer):
+                    raise json.JSONDecodeError("Unterminated array", buffer, position)
+                element, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise ValueError(f"{path} is truncated or malformed near character {consumed + position}")
+                # The element continues past the buffer: read more (at least as much as is buffered)
+                chunk = f.read(max(read_size, len(buffer) - position))
+                eof = not chunk
+                buffer = buffer[position:] + chunk
+                consumed += position
+                position = 0
+                continue
+            yield element
+
+
+def split_chain_file(path, segment_bytes=SEGMENT_BYTES):
+    """
+    Splits a chain file written by `Node.save_blockchain` into byte ranges of whole blocks.
+
+    Blocks are found from the file's layout (each one starts on a line indented by four
+    spaces), without decoding anything, so the ranges can be decoded in parallel.
+
+    :param path: str - Path of the chain file.
+    :param segment_bytes: int - Approximate size of a range.
+    :return: list - (start, end) byte offsets of the ranges, or None if the file has another layout.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        head = f.read(len(BLOCK_START) + 1)
+        if head.rstrip() == b"[" or head.replace(b" ", b"").replace(b"\n", b"").startswith(b"[]"):
+            return []
+        if head != b"[" + BLOCK_START:
+            return None
+        f.seek(max(size - 64, 0))
+        tail = f.read()
+        if tail.rfind(b"]") < 0:
+            return None
+        end = size - len(tail) + tail.rfind(b"]")
+
+        ranges = []
+        start = 2  # The first block, after "[\n"
+        while start < end:
+            f.seek(min(start + segment_bytes, end))
+            window = b""
+            cut = end
+            while f.tell() < end:
+                window = window[-len(BLOCK_START):] + f.read(1 << 16)
+                found = window.find(BLOCK_START)
+                if found >= 0:
+                    cut = min(f.tell() - len(window) + found + 1, end)
+                    break
+            ranges.append((start, cut))
+            start = cut
+    return ranges
+
+
+def block_record(position, data):
+    """
+    Extracts what the checks need from a serialized block.
+
+    :param position: int - Height of the block within its segment.
+    :param data: dict - The block, as saved by `Node.save_blockchain`.
+    :return: tuple - (height, epoch, previous hash, hash, transaction IDs, batch digests or None).
+    """
+    return (position, data['epoch'], data['previous_hash'], data['hash'],
+            [tx['tx_id'] for tx in data['transactions']], data.get('batch_digests'))
+
+
+def check_link(previous, record):
+    """
+    Checks that a block follows the one before it.
+
+    :param previous: tuple - Record of the block before (see `block_record`).
+    :param record: tuple - Record of the block.
+    :return: list - Problems found, as (height, epoch, kind, detail).
+    """
+    problems = []
+    position, epoch, previous_hash = record[:3]
+    if previous_hash != previous[3]:
+        problems.append((position, epoch, "link",
+                         f"previous hash {previous_hash} is not the hash of the block before ({previous[3]})"))
+    if epoch <= previous[1]:
+        problems.append((position, epoch, "epoch", f"epoch does not follow epoch {previous[1]}"))
+    return problems
+
+
+def verify_records(records):
+    """
+    Recomputes the hashes of consecutive blocks and checks the links between them.
+
+    :param records: list - Records of the blocks (see `block_record`).
+    :return: list - Problems found, as (height, epoch, kind, detail).
+    """
+    problems = []
+    previous = None
+    for record in records:
+        position, epoch, previous_hash, block_hash, tx_ids, batch_digests = record
+        if batch_digests is not None:
+            batch_digests = [bytes.fromhex(digest) for digest in batch_digests]  # The hash covers the digests instead
+        recomputed = Block(epoch, bytes.fromhex(previous_hash), dict.fromkeys(tx_ids), batch_digests).hash.hex()
+        if recomputed != block_hash:
+            problems.append((position, epoch, "hash", f"stored hash {block_hash}, recomputed {recomputed}"))
+        if previous is not None:
+            problems.extend(check_link(previous, record))
+        previous = record
+    return problems
+
+
+def verify_range(path, start, end):
+    """
+    Decodes and verifies a byte range of a chain file (runs in a worker process).
+
+    :param path: str - Path of the chain file.
+    :param start: int - Offset of the first block of the range.
+    :param end: int - Offset just after the last block of the range.
+    :return: tuple - (records of the blocks, problems found), with heights counted from the start of the range.
+    :raises ValueError: If the range is not valid JSON.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+    blocks = json.loads("[" + text[:text.rfind("}") + 1] + "]")  # Drop the separator after the last block
+    records = [block_record(position, data) for position, data in enumerate(blocks)]
+    return records, verify_records(records)
+
+
+class ChainVerifier:
+    """
+    Verifies the chain files of a run and checks that the nodes agree on their finalized prefix.
+
+    A chain file is split into segments of whole blocks, and worker processes decode each
+    segment, recompute its block hashes and check its hash links. The main process then
+    checks the links between segments and looks for duplicate transaction IDs, in chain order.
+    The number of segments in flight is bounded, so the decoded blocks never all sit in memory
+    at once. What is kept still grows with the history: the hash and epoch of every block (for
+    the comparison between nodes) and the set of transaction IDs seen (for the duplicate check),
+    roughly 100 bytes per block and 75 per transaction. Files that were not written by
+    `Node.save_blockchain` are decoded by the main process as a stream instead.
+    """
+
+    def __init__(self, workers=None, segment_bytes=SEGMENT_BYTES):
+        """
+        :param workers: int, optional - Worker processes (default: one per CPU; 0 verifies in this process).
+        :param segment_bytes: int - Bytes of a chain file per worker task.
+        """
+        self.workers = os.cpu_count() if workers is None else workers
+        self.segment_bytes = segment_bytes
+        self.pool = ProcessPoolExecutor(self.workers) if self.workers > 0 else None
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def segments(self, path):
+        """
+        Verifies the segments of a chain file, in the pool when there is one.
+
+        :param path: str - Path of the chain file.
+        :return: generator - (records, problems) of each segment, in chain order.
+        """
+        ranges = split_chain_file(path, self.segment_bytes)
+        if ranges is not None:
+            if self.pool is None:
+                for start, end in ranges:
+                    yield verify_range(path, start, end)
+                return
+            pending = []  # Segments in flight, oldest first
+            for start, end in ranges:
+                pending.append(self.pool.submit(verify_range, path, start, end))
+                if len(pending) > 2 * self.workers:
+                    yield pending.pop(0).result()
+            for future in pending:
+                yield future.result()
+            return
+
+        # Unknown layout: decode in this process, verify in the pool
+        pending = []
+        records = []
+        error = None
+        try:
+            for data in iter_json_array(path):
+                records.append(block_record(len(records), data))
+                if len(records) == SEGMENT_BLOCKS:
+                    pending.append((records, self.pool.submit(verify_records, records) if self.pool else verify_records(records)))
+                    records = []
+                    if len(pending) > 2 * self.workers:
+                        segment, problems = pending.pop(0)
+                        yield segment, problems.result() if self.pool else problems
+        except (ValueError, KeyError, TypeError) as e:
+            error = e  # Report the blocks decoded before the error first
+        if records:
+            pending.append((records, self.pool.submit(verify_records, records) if self.pool else verify_records(records)))
+        for segment, problems in pending:
+            yield segment, problems.result() if self.pool else problems
+        if error is not None:
+            raise error
+
+    def verify_file(self, path):
+        """
+        Verifies one chain file.
+
+        :param path: str - Path of the chain file.
+        :return: dict - Height, epoch range, transaction count, hashes (bytes) and epochs of the blocks in chain order, and problems.
+        """
+        hashes = []
+        epochs = []
+        problems = []
+        seen_tx = set()
+        transactions = 0
+        previous = None  # Record of the last block of the previous segment
+        try:
+            for records, segment_problems in self.segments(path):
+                height = len(hashes)
+                problems.extend((height + position, epoch, kind, detail) for position, epoch, kind, detail in segment_problems)
+                if records and previous is not None:
+                    problems.extend((height, epoch, kind, detail) for _, epoch, kind, detail in check_link(previous, records[0]))
+                for position, epoch, _, block_hash, tx_ids, _ in records:
+                    hashes.append(bytes.fromhex(block_hash))
+                    epochs.append(epoch)
+                    transactions += len(tx_ids)
+                    for tx_id in tx_ids:
+                        if tx_id in seen_tx:
+                            problems.append((height + position, epoch, "duplicate_tx",
+                                             f"transaction {tx_id} is already in an earlier block"))
+                        seen_tx.add(tx_id)
+                if records:
+                    previous = records[-1]
+        except (ValueError, KeyError, TypeError) as e:
+            problems.append((len(hashes), epochs[-1] if epochs else None, "format", f"{type(e).__name__}: {e}"))
+
+        problems.sort(key=lambda problem: problem[0])
+        return {
+            'path': path,
+            'height': len(hashes),
+            'epochs': [epochs[0], epochs[-1]] if epochs else [None, None],
+            'transactions': transactions,
+            'hashes': hashes,
+            'block_epochs': epochs,
+            'problems': problems,
+        }
+
+
+def compare_chains(chains):
+    """
+    Finds where the finalized chains of the nodes diverge.
+
+    Every chain is compared with the longest one (the lowest node ID among equals): a node whose
+    chain is a prefix of it is only behind, otherwise the first differing height is reported.
+
+    :param chains: dict - Maps a node ID to the result of `ChainVerifier.verify_file`.
+    :return: tuple - (reference node ID, list of divergences as dicts).
+    """
+    if not chains:
+        return None, []
+    reference_id = max(sorted(chains), key=lambda node_id: chains[node_id]['height'])
+    reference = chains[reference_id]['hashes']
+    divergences = []
+    for node_id, chain in sorted(chains.items()):
+        hashes = chain['hashes']
+        if node_id == reference_id or hashes == reference[:len(hashes)]:
+            continue
+        height = next(position for position, (ours, theirs) in enumerate(zip(hashes, reference)) if ours != theirs)
+        divergences.append({
+            'node': node_id,
+            'reference': reference_id,
+            'height': height,
+            'epoch': chain['block_epochs'][height],
+            'hash': hashes[height].hex(),
+            'reference_epoch': chains[reference_id]['block_epochs'][height],
+            'reference_hash': reference[height].hex(),
+        })
+    return reference_id, divergences
+
+
+def find_chain_files(paths):
+    """
+    Resolves the command-line paths to chain files by node ID.
+
+    :param paths: list - Chain files, or directories holding `blockchain_<id>.json` files.
+    :return: dict - Maps a node ID to the path of its chain file.
+    :raises ValueError: If a file name does not carry a node ID.
+    """
+    files = {}
+    for path in paths:
+        candidates = sorted(glob.glob(os.path.join(path, "blockchain_*.json"))) if os.path.isdir(path) else [path]
+        for candidate in candidates:
+            match = CHAIN_FILE.search(os.path.basename(candidate))
+            if match is None:
+                raise ValueError(f"{candidate} is not named blockchain_<node_id>.json")
+            files[int(match.group(1))] = candidate
+    return files
+
+
+def main():
+    """
+    Entry point of the chain verifier.
+
+    Usage:
+        verify_chains.py [paths ...] [--workers N] [--segment-mb 8] [--report verify_report.json]
+    """
+    parser = argparse.ArgumentParser(description="Verify saved chains and check that the nodes agree on them.")
+    parser.add_argument("paths", nargs="*", default=["."], help="Chain files or directories holding blockchain_<id>.json")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU; 0: none)")
+    parser.add_argument("--segment-mb", type=float, default=SEGMENT_BYTES / (1 << 20), help="Megabytes of a chain file per worker task")
+    parser.add_argument("--report", default=None, help="File for the verification report (JSON)")
+    args = parser.parse_args()
+
+    try:
+        files = find_chain_files(args.paths)
+    except ValueError as e:
+        print(f"Error: {e}.")
+        sys.exit(1)
+    if not files:
+        print("Error: no chain files found.")
+        sys.exit(1)
+
+    started = time.monotonic()
+    verifier = ChainVerifier(args.workers, int(args.segment_mb * (1 << 20)))
+    try:
+        chains = {node_id: verifier.verify_file(path) for node_id, path in sorted(files.items())}
+    finally:
+        verifier.close()
+    reference_id, divergences = compare_chains(chains)
+    elapsed = time.monotonic() - started
+
+    for node_id, chain in chains.items():
+        problems = chain['problems']
+        epochs = f" (epochs {chain['epochs'][0]}-{chain['epochs'][1]})" if chain['height'] else ""
+        print(f"Node {node_id}: {chain['height']} blocks{epochs}, {chain['transactions']} transactions, {len(problems)} problems")
+        for height, epoch, kind, detail in problems[:MAX_LISTED_PROBLEMS]:
+            print(f"  height {height}, epoch {epoch}: {kind}: {detail}")
+        if len(problems) > MAX_LISTED_PROBLEMS:
+            print(f"  ... {len(problems) - MAX_LISTED_PROBLEMS} more")
+    for divergence in divergences:
+        print(f"Node {divergence['node']} diverges from node {divergence['reference']} at height {divergence['height']}: "
+              f"block {divergence['hash']} of epoch {divergence['epoch']} instead of "
+              f"{divergence['reference_hash']} of epoch {divergence['reference_epoch']}")
+    valid = not any(chain['problems'] for chain in chains.values())
+    print(f"Chains valid: {valid}. Finalized prefixes agree: {not divergences}. Verified in {elapsed:.2f}s")
+
+    if args.report:
+        report = {
+            'valid': valid,
+            'consistent': not divergences,
+            'reference': reference_id,
+            'divergences': divergences,
+            'nodes': {
+                node_id: {
+                    'path': chain['path'],
+                    'height': chain['height'],
+                    'epochs': chain['epochs'],
+                    'transactions': chain['transactions'],
+                    'tip': chain['hashes'][-1].hex() if chain['hashes'] else None,
+                    'problem_count': len(chain['problems']),
+                    'problems': [
+                        {'height': height, 'epoch': epoch, 'kind': kind, 'detail': detail}
+                        for height, epoch, kind, detail in chain['problems'][:MAX_LISTED_PROBLEMS]
+                    ],
+                }
+                for node_id, chain in chains.items()
+            },
+            'elapsed_seconds': elapsed,
+        }
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=4)
+
+    sys.exit(0 if valid and not divergences else 1)
+
+
+if __name__ == "__main__":
+    main()